@@ -1,5 +1,6 @@
 import { useEffect, useState } from 'react';
 import { supabase } from '../supabaseClient';
+import { carregarAnalyticsCompleta } from '../snapshots';
 import type { AnalyticsData } from '../types';
 
 export const useAnalytics = (parceiroLogado?: string, isAdmin: boolean = true) => {
@@ -18,7 +19,8 @@ export const useAnalytics = (parceiroLogado?: string, isAdmin: boolean = true) =
       setRefreshing(true);
       const { error } = await supabase.rpc('refresh_analytics');
       if (error) throw error;
-      await fetchAllData(); 
+      // Acabou de recalcular no banco: o snapshot ainda é o anterior, então lê ao vivo
+      await fetchAllData(true); 
     } catch (err: any) {
       alert("Aviso: " + err.message);
     } finally {
@@ -75,7 +77,22 @@ export const useAnalytics = (parceiroLogado?: string, isAdmin: boolean = true) =
       return allData;
   };
 
-  const fetchAllData = async () => {
+  // Admin lê o tabelão dos snapshots estáticos (CDN, só baixa o que mudou); sem snapshot ou com
+  // falha em algum arquivo, consulta o banco como antes. Parceiro sempre consulta o banco, filtrado.
+  const fetchAnalytics = async (pageSize: number, aoVivo: boolean) => {
+      const filtraParceiro = !!parceiroLogado && !isAdmin;
+      if (!aoVivo && !filtraParceiro) {
+          try {
+              const linhas = await carregarAnalyticsCompleta();
+              if (linhas) return linhas;
+          } catch (err) {
+              console.warn('Snapshot do tabelão indisponível, consultando o banco:', err);
+          }
+      }
+      return fetchTableInParallel('analytics_incremental', '*', pageSize, true, parceiroLogado);
+  };
+
+  const fetchAllData = async (aoVivo: boolean = false) => {
     try {
       setLoading(true);
       setError(null);
@@ -84,7 +101,7 @@ export const useAnalytics = (parceiroLogado?: string, isAdmin: boolean = true) =
       
       // INJEÇÃO CIRÚRGICA: Adicionamos a 4ª tabela na busca (view_comissoes_recorrencia) sem mexer nas outras
       const [allRows, comissoesRows, crmRows, comissoesRecorrenciaRows] = await Promise.all([
-          fetchTableInParallel('analytics_materializada', '*', pageSize, true, parceiroLogado),
+          fetchAnalytics(pageSize, aoVivo),
           fetchTableInParallel('view_comissoes_calculadas', 'uc, percentual_final, percentual_personal', pageSize, true),
           (!isAdmin && parceiroLogado) ? Promise.resolve([]) : fetchTableInParallel('view_crm_dashboard', '*', pageSize, true),
           fetchTableInParallel('view_comissoes_recorrencia', 'uc, percentual_parceiro, percentual_indicador, percentual_total, indicador_nome', pageSize, true)
@@ -216,5 +233,5 @@ export const useAnalytics = (parceiroLogado?: string, isAdmin: boolean = true) =
     }
   };
 
-  return { data, crmData, loading, error, refetch: fetchAllData, refreshSnapshot, refreshing };
+  return { data, crmData, loading, error, refetch: () => fetchAllData(true), refreshSnapshot, refreshing };
 };
\ No newline at end of file
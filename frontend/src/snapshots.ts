@@ -0,0 +1,62 @@
+// Snapshots estáticos gerados por `python -m services snapshots` depois de cada carga.
+// O manifesto (cache curto) aponta para arquivos com o hash no nome (cache eterno),
+// então o navegador/CDN só baixa de novo o que mudou de fato.
+// Padrão: o bucket público que a automação publica (SNAPSHOTS_DESTINO=supabase, bucket
+// SNAPSHOTS_BUCKET). VITE_SNAPSHOTS_URL troca a origem; '/dados' serve os gerados localmente
+// em frontend/public/dados (SNAPSHOTS_DESTINO=local).
+const BUCKET_PUBLICO = import.meta.env.VITE_SUPABASE_URL
+  ? `${import.meta.env.VITE_SUPABASE_URL.replace(/\/$/, '')}/storage/v1/object/public/${import.meta.env.VITE_SNAPSHOTS_BUCKET || 'snapshots'}`
+  : '/dados';
+const BASE_SNAPSHOTS = (import.meta.env.VITE_SNAPSHOTS_URL || BUCKET_PUBLICO).replace(/\/$/, '');
+
+interface EntradaSnapshot {
+  arquivo: string;
+  sha256: string;
+  linhas: number;
+  bytes: number;
+}
+
+export interface ManifestoSnapshots {
+  versao: number;
+  gerado_em: string;
+  conjuntos: Record<string, EntradaSnapshot>;
+  historicos_uc: { digitos: number; fatias: Record<string, EntradaSnapshot> };
+}
+
+let manifestoPromise: Promise<ManifestoSnapshots | null> | null = null;
+const arquivosCarregados = new Map<string, Promise<Record<string, any>[]>>();
+
+export const carregarManifesto = (): Promise<ManifestoSnapshots | null> => {
+  if (!manifestoPromise) {
+    manifestoPromise = fetch(`${BASE_SNAPSHOTS}/manifesto.json`, { cache: 'no-cache' })
+      .then(res => (res.ok ? res.json() : null))
+      .catch(() => null);
+  }
+  return manifestoPromise;
+};
+
+const lerArquivo = (arquivo: string): Promise<Record<string, any>[]> => {
+  if (!arquivosCarregados.has(arquivo)) {
+    const promessa = fetch(`${BASE_SNAPSHOTS}/${arquivo}`)
+      .then(res => {
+        if (!res.ok || !res.body) throw new Error(`Snapshot ${arquivo} indisponível (${res.status})`);
+        // Os arquivos são .json.gz gravados como estão: descomprime no navegador
+        return new Response(res.body.pipeThrough(new DecompressionStream('gzip'))).json();
+      })
+      .then(({ colunas, linhas }: { colunas: string[]; linhas: any[][] }) =>
+        linhas.map(linha => Object.fromEntries(colunas.map((coluna, i) => [coluna, linha[i]])))
+      );
+    arquivosCarregados.set(arquivo, promessa);
+  }
+  return arquivosCarregados.get(arquivo)!;
+};
+
+// Tabelão completo (todas as fatias do histórico por UC) para o dashboard do admin;
+// null = sem snapshot publicado, consultar o banco
+export const carregarAnalyticsCompleta = async (): Promise<Record<string, any>[] | null> => {
+  const manifesto = await carregarManifesto();
+  if (!manifesto) return null;
+  const fatias = Object.values(manifesto.historicos_uc.fatias);
+  const partes = await Promise.all(fatias.map(entrada => lerArquivo(entrada.arquivo)));
+  return partes.flat();
+};
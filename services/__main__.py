@@ -0,0 +1,5 @@
+from .cli import main
+
+# Guarda necessária: o pool de processos (spawn) reimporta este módulo nos filhos
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import text
+
+# Detecção de alterações antes do upsert: compara o lote normalizado com o que já está no banco
+# e devolve só as linhas novas ou com alguma coluna diferente, junto com os valores antigos.
+
+def normalizar(valor, coluna_json=False):
+    if valor is None: return None
+    if coluna_json:
+        if isinstance(valor, str):
+            try: valor = json.loads(valor)
+            except ValueError: return valor
+        return json.dumps(valor, sort_keys=True, ensure_ascii=False)
+    if isinstance(valor, Decimal): return float(valor)
+    if isinstance(valor, bool): return valor
+    if isinstance(valor, int): return float(valor)
+    if isinstance(valor, datetime): return valor.isoformat()
+    if isinstance(valor, date): return valor.isoformat()
+    return valor
+
+class Diferencas(dict):
+    """{coluna: (antigo, novo)}; nova=True quando a linha ainda não existia no banco."""
+    def __init__(self, nova=False):
+        super().__init__()
+        self.nova = nova
+
+def filtrar_alterados(conn, tabela, chave, colunas, registros, colunas_json=(), coluna_particao=None):
+    """
+    chave: dict ordenado {coluna: tipo_sql} da chave primária (ex.: {"uc": "text", "mes_referencia": "date"}).
+    colunas: colunas comparadas (sem carimbos como updated_at).
+    coluna_particao: coluna da chave pela qual a tabela é particionada; o filtro explícito deixa o
+    Postgres descartar as partições que o lote não toca.
+    Retorna lista de (registro, diferencas) onde diferencas = {coluna: (antigo, novo)};
+    para linhas novas, diferencas.nova é True e antigo é None em todas as colunas.
+    """
+    if not registros: return []
+    nomes_chave = list(chave)
+
+    def chave_de(reg):
+        return tuple(normalizar(reg.get(k)) for k in nomes_chave)
+
+    params = {}
+    arrays = []
+    for i, (coluna, tipo) in enumerate(chave.items()):
+        params[f"k{i}"] = [reg.get(coluna) for reg in registros]
+        arrays.append(f"CAST(:k{i} AS {tipo}[])")
+    juncao = " AND ".join(f"t.{coluna} = k.k{i}" for i, coluna in enumerate(nomes_chave))
+    aliases = ", ".join(f"k{i}" for i in range(len(nomes_chave)))
+    if coluna_particao:
+        params["particoes"] = list({reg.get(coluna_particao) for reg in registros})
+        juncao += f" AND t.{coluna_particao} = ANY(CAST(:particoes AS {chave[coluna_particao]}[]))"
+    selecao = ", ".join(f"t.{c}" for c in dict.fromkeys(nomes_chave + list(colunas)))
+
+    rows = conn.execute(text(f"""
+        SELECT {selecao}
+        FROM {tabela} t
+        JOIN unnest({", ".join(arrays)}) AS k({aliases}) ON {juncao}
+    """), params).mappings().all()
+    existentes = {chave_de(row): row for row in rows}
+
+    alterados = []
+    for reg in registros:
+        antigo = existentes.get(chave_de(reg))
+        diferencas = Diferencas(nova=antigo is None)
+        for coluna in colunas:
+            eh_json = coluna in colunas_json
+            novo = reg.get(coluna)
+            velho = antigo[coluna] if antigo is not None else None
+            if antigo is None or normalizar(novo, eh_json) != normalizar(velho, eh_json):
+                diferencas[coluna] = (velho, novo)
+        if diferencas:
+            alterados.append((reg, diferencas))
+    return alterados
+
+# --- FEED DE ALTERAÇÕES (log_alteracoes) ---
+
+def nova_execucao(fonte):
+    return f"{fonte}-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+def _valor_log(valor):
+    valor = normalizar(valor)
+    return valor if isinstance(valor, (str, float, bool, type(None))) else str(valor)
+
+def registrar_alteracoes(conn, execucao_id, fonte, tabela, chave, alterados, ignorar=()):
+    """Grava no log as diferenças devolvidas por filtrar_alterados (mesma transação do upsert)."""
+    linhas = []
+    for reg, diferencas in alterados:
+        novo = getattr(diferencas, "nova", False)
+        compacto = {
+            col: [_valor_log(antigo), _valor_log(atual)]
+            for col, (antigo, atual) in diferencas.items()
+            if col not in ignorar and not (novo and atual is None)
+        }
+        linhas.append({
+            "exec": execucao_id, "fonte": fonte, "tabela": tabela,
+            "op": "insercao" if novo else "alteracao",
+            "chave": json.dumps({k: _valor_log(reg.get(k)) for k in chave}),
+            "alt": json.dumps(compacto, ensure_ascii=False),
+        })
+    if not linhas: return 0
+    conn.execute(text("""
+        INSERT INTO log_alteracoes (execucao_id, fonte, tabela, operacao, chave, alteracoes)
+        VALUES (:exec, :fonte, :tabela, :op, CAST(:chave AS jsonb), CAST(:alt AS jsonb))
+    """), linhas)
+    return len(linhas)
+
+def registrar_remocoes(conn, execucao_id, fonte, tabela, chaves):
+    """chaves: lista de dicts com a chave primária das linhas removidas."""
+    linhas = [{
+        "exec": execucao_id, "fonte": fonte, "tabela": tabela,
+        "chave": json.dumps({k: _valor_log(v) for k, v in c.items()})
+    } for c in chaves]
+    if not linhas: return 0
+    conn.execute(text("""
+        INSERT INTO log_alteracoes (execucao_id, fonte, tabela, operacao, chave, alteracoes)
+        VALUES (:exec, :fonte, :tabela, 'remocao', CAST(:chave AS jsonb), '{}'::jsonb)
+    """), linhas)
+    return len(linhas)
+
+def ler_alteracoes(engine, consumidor, tabelas=None, limite=1000, apos=None):
+    """
+    Próximas entradas do log para o consumidor, em ordem de commit. Não move o cursor:
+    depois de processar, chame confirmar_leitura com a última entrada devolvida.
+    apos: entrada já lida nesta execução, para paginar além do limite sem confirmar ainda.
+    """
+    filtro = "AND l.tabela = ANY(:tabelas)" if tabelas else ""
+    with engine.begin() as conn:
+        return conn.execute(text(f"""
+            SELECT l.id, l.transacao::text AS transacao, l.execucao_id, l.fonte, l.tabela,
+                   l.operacao, l.chave, l.alteracoes, l.registrado_em
+            FROM log_alteracoes l
+            LEFT JOIN log_alteracoes_cursores c ON c.consumidor = :consumidor
+            WHERE (l.transacao, l.id) > (
+                      coalesce(CAST(:apos_transacao AS xid8), c.ultima_transacao, '0'::xid8),
+                      coalesce(:apos_id, c.ultimo_id, 0))
+              AND l.transacao < pg_snapshot_xmin(pg_current_snapshot())
+              {filtro}
+            ORDER BY l.transacao, l.id
+            LIMIT :limite
+        """), {"consumidor": consumidor, "tabelas": list(tabelas or []), "limite": limite,
+               "apos_transacao": apos["transacao"] if apos else None,
+               "apos_id": apos["id"] if apos else None}).mappings().all()
+
+def confirmar_leitura(engine, consumidor, entrada):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO log_alteracoes_cursores (consumidor, ultima_transacao, ultimo_id, atualizado_em)
+            VALUES (:consumidor, CAST(:transacao AS xid8), :id, now())
+            ON CONFLICT (consumidor) DO UPDATE SET
+                ultima_transacao = EXCLUDED.ultima_transacao,
+                ultimo_id = EXCLUDED.ultimo_id,
+                atualizado_em = EXCLUDED.atualizado_em;
+        """), {"consumidor": consumidor, "transacao": entrada["transacao"], "id": entrada["id"]})
@@ -0,0 +1,82 @@
+import time
+from sqlalchemy import text
+
+# Manutenção incremental da analytics_incremental (mesmas colunas da analytics_materializada).
+# Os conectores registram em analytics_pendencias as chaves que alteraram; aqui só essas
+# chaves são recalculadas a partir da view analytics_base. O rebuild completo é sob demanda.
+
+LOTE_UCS = 500
+
+def marcar_alteradas(conn, chaves, fonte):
+    """chaves: iterável de (uc, mes_referencia); mes_referencia None marca todos os meses da UC."""
+    linhas = [{"uc": uc, "mes": mes, "fonte": fonte} for uc, mes in set(chaves) if uc]
+    if not linhas: return 0
+    conn.execute(text("""
+        INSERT INTO analytics_pendencias (uc, mes_referencia, fonte)
+        VALUES (:uc, CAST(:mes AS date), :fonte)
+    """), linhas)
+    return len(linhas)
+
+def recalcular_pendencias(engine):
+    with engine.begin() as conn:
+        limite = conn.execute(text("SELECT max(id) FROM analytics_pendencias")).scalar()
+        if limite is None:
+            print("✅ Analytics em dia: nenhuma chave alterada.", flush=True)
+            return 0
+
+        conn.execute(text("""
+            CREATE TEMP TABLE chaves_pendentes ON COMMIT DROP AS
+            SELECT DISTINCT uc, mes_referencia FROM analytics_pendencias WHERE id <= :limite
+        """), {"limite": limite})
+        meses_por_uc = {}
+        for uc, mes in conn.execute(text("SELECT uc, mes_referencia FROM chaves_pendentes")):
+            meses_por_uc.setdefault(uc, set()).add(mes)
+        ucs = sorted(meses_por_uc)
+
+        # Os filtros uc = ANY(...) e, quando todas as chaves do lote têm mês, mes_referencia = ANY(...)
+        # são empurrados para dentro da view (e para as partições mensais das tabelas raw)
+        for i in range(0, len(ucs), LOTE_UCS):
+            lote = ucs[i:i + LOTE_UCS]
+            meses = set().union(*(meses_por_uc[uc] for uc in lote))
+            filtro_mes = "" if None in meses else "AND b.mes_referencia::date = ANY(:meses)"
+            conn.execute(text("""
+                DELETE FROM analytics_incremental a
+                USING chaves_pendentes c
+                WHERE a.uc::text = ANY(:ucs) AND a.uc::text = c.uc
+                  AND (c.mes_referencia IS NULL OR a.mes_referencia::date = c.mes_referencia)
+            """), {"ucs": lote})
+            conn.execute(text(f"""
+                INSERT INTO analytics_incremental
+                SELECT b.*, now() FROM analytics_base b
+                WHERE b.uc::text = ANY(:ucs) {filtro_mes}
+                  AND EXISTS (
+                      SELECT 1 FROM chaves_pendentes c
+                      WHERE c.uc = b.uc::text
+                        AND (c.mes_referencia IS NULL OR c.mes_referencia = b.mes_referencia::date)
+                  )
+            """), {"ucs": lote, "meses": sorted(meses - {None})})
+
+        conn.execute(text("DELETE FROM analytics_pendencias WHERE id <= :limite"), {"limite": limite})
+    print(f"✅ Analytics incremental: {len(ucs)} UCs recalculadas.", flush=True)
+    return len(ucs)
+
+def reconstruir_analytics(engine):
+    # DELETE em vez de TRUNCATE: os dashboards continuam lendo a versão anterior até o commit
+    print("🔄 Reconstruindo analytics_incremental por completo...", flush=True)
+    with engine.begin() as conn:
+        limite = conn.execute(text("SELECT max(id) FROM analytics_pendencias")).scalar()
+        conn.execute(text("DELETE FROM analytics_incremental"))
+        conn.execute(text("INSERT INTO analytics_incremental SELECT b.*, now() FROM analytics_base b"))
+        if limite is not None:
+            conn.execute(text("DELETE FROM analytics_pendencias WHERE id <= :limite"), {"limite": limite})
+        conn.execute(text("REFRESH MATERIALIZED VIEW analytics_materializada;"))
+    print("✅ Rebuild completo concluído.", flush=True)
+
+def manter_analytics(engine, completo=False):
+    inicio = time.time()
+    try:
+        if completo: reconstruir_analytics(engine)
+        else: recalcular_pendencias(engine)
+        print(f"⏱️ Manutenção do analytics em {time.time() - inicio:.1f}s", flush=True)
+    except Exception as e:
+        print(f"❌ Erro na manutenção do analytics: {e}", flush=True)
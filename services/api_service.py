@@ -0,0 +1,366 @@
+import base64
+import hashlib
+import hmac
+import io
+import json
+import select
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+from sqlalchemy import text
+from .config import Ajuste, cfg, exigir, engine
+from .sinais import CANAL_CARGA
+
+# API de leitura do dashboard: serve a analytics_incremental (já pré-calculada) com paginação
+# por chave, ETag/304 e cache LRU em memória invalidado pelo sinal de fim de carga dos conectores.
+# Autenticação: API_TOKEN é o token do administrador (vê tudo) e a chave que assina os tokens de
+# parceiro (nome + HMAC, emitidos com `python -m services api --emitir-token NOME`); com token de
+# parceiro, toda consulta fica restrita às UCs em que ele é quem_indicou. Sem API_TOKEN a API não sobe.
+# CORS só para as origens listadas em API_ORIGENS (separadas por vírgula).
+API_CACHE_ITENS = Ajuste("API_CACHE_ITENS", "512", int)
+LIMITE_PADRAO = 1000
+LIMITE_MAXIMO = 5000
+
+class CacheLRU:
+    def __init__(self, max_itens):
+        # Número ou Ajuste (lido no uso)
+        self.max_itens = max_itens
+        self.itens = OrderedDict()
+        self.lock = threading.Lock()
+
+    def obter(self, chave):
+        with self.lock:
+            if chave not in self.itens: return None
+            self.itens.move_to_end(chave)
+            return self.itens[chave]
+
+    def guardar(self, chave, valor):
+        with self.lock:
+            self.itens[chave] = valor
+            self.itens.move_to_end(chave)
+            limite = self.max_itens() if callable(self.max_itens) else self.max_itens
+            while len(self.itens) > limite:
+                self.itens.popitem(last=False)
+
+    def limpar(self):
+        with self.lock:
+            self.itens.clear()
+
+cache = CacheLRU(API_CACHE_ITENS)
+
+def serializar(valor):
+    if isinstance(valor, Decimal): return float(valor)
+    if isinstance(valor, (date, datetime)): return valor.isoformat()
+    return str(valor)
+
+def codificar_cursor(uc, mes, id_linha):
+    return base64.urlsafe_b64encode(json.dumps([uc, mes, id_linha]).encode()).decode()
+
+def decodificar_cursor(cursor):
+    uc, mes, id_linha = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return uc, mes, int(id_linha)
+
+def ler_limite(params):
+    limite = int(params.get("limite", LIMITE_PADRAO))
+    if limite < 1: raise ValueError("limite deve ser maior que zero.")
+    return min(limite, LIMITE_MAXIMO)
+
+# --- AUTENTICAÇÃO ---
+
+def assinar_parceiro(parceiro):
+    return hmac.new(exigir("API_TOKEN").encode(), parceiro.encode(), hashlib.sha256).hexdigest()
+
+def emitir_token(parceiro):
+    nome = base64.urlsafe_b64encode(parceiro.encode()).decode().rstrip("=")
+    return f"{nome}.{assinar_parceiro(parceiro)}"
+
+def identificar(autorizacao):
+    """Devolve (autorizado, parceiro); parceiro None = administrador."""
+    if not autorizacao or not autorizacao.startswith("Bearer "): return False, None
+    token = autorizacao[len("Bearer "):].strip()
+    if hmac.compare_digest(token.encode(), exigir("API_TOKEN").encode()): return True, None
+    nome, _, assinatura = token.partition(".")
+    try:
+        parceiro = base64.urlsafe_b64decode((nome + "=" * (-len(nome) % 4)).encode()).decode()
+    except ValueError:
+        return False, None
+    if not parceiro or not hmac.compare_digest(assinatura.encode(), assinar_parceiro(parceiro).encode()):
+        return False, None
+    return True, parceiro
+
+def restringir(filtros, valores, parceiro, direto=True):
+    """Limita a consulta às UCs do parceiro (direto = a tabela é a própria analytics_incremental)."""
+    if parceiro is None: return
+    valores["parceiro"] = parceiro
+    if direto: filtros.append("quem_indicou = :parceiro")
+    else: filtros.append("uc IN (SELECT uc::text FROM analytics_incremental WHERE quem_indicou = :parceiro)")
+
+# --- CONSULTAS ---
+
+def consultar_tabelao(params, parceiro=None):
+    limite = ler_limite(params)
+    filtros, valores = [], {"limite": limite}
+    restringir(filtros, valores, parceiro)
+    if params.get("apos"):
+        # Keyset em (uc, mes_referencia, id_linha): usa o índice único da analytics_incremental, sem OFFSET
+        valores["uc"], valores["mes"], valores["id_linha"] = decodificar_cursor(params["apos"])
+        filtros.append("(uc, mes_referencia, id_linha) > (:uc, CAST(:mes AS date), :id_linha)")
+    if params.get("mes"):
+        valores["mes_ref"] = f"{params['mes'][:7]}-01"
+        filtros.append("mes_referencia = CAST(:mes_ref AS date)")
+    if params.get("concessionaria"):
+        valores["concessionaria"] = params["concessionaria"]
+        filtros.append("concessionaria = :concessionaria")
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT * FROM analytics_incremental {where}
+            ORDER BY uc, mes_referencia, id_linha
+            LIMIT :limite
+        """), valores).mappings().all()
+
+    dados = [dict(r) for r in rows]
+    proximo = None
+    if len(dados) == limite:
+        ultimo = dados[-1]
+        proximo = codificar_cursor(ultimo["uc"], serializar(ultimo["mes_referencia"]), ultimo["id_linha"])
+    return {"dados": dados, "proximo": proximo}
+
+def consultar_historico_uc(uc, parceiro=None):
+    filtros, valores = ["uc = :uc"], {"uc": uc}
+    restringir(filtros, valores, parceiro)
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT * FROM analytics_incremental WHERE {' AND '.join(filtros)} ORDER BY mes_referencia, id_linha
+        """), valores).mappings().all()
+    return {"uc": uc, "dados": [dict(r) for r in rows]}
+
+def consultar_resumo_distribuidoras(params, parceiro=None):
+    filtros, valores = [], {}
+    restringir(filtros, valores, parceiro)
+    if params.get("mes"):
+        valores["mes_ref"] = f"{params['mes'][:7]}-01"
+        filtros.append("mes_referencia = CAST(:mes_ref AS date)")
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT concessionaria,
+                   count(DISTINCT uc) AS ucs,
+                   sum(consumo_kwh) AS consumo_kwh,
+                   sum(compensacao_kwh) AS compensacao_kwh,
+                   sum(total_cobranca) AS total_cobranca,
+                   sum(economia_rs) AS economia_rs
+            FROM analytics_incremental {where}
+            GROUP BY concessionaria
+            ORDER BY concessionaria
+        """), valores).mappings().all()
+    return {"dados": [dict(r) for r in rows]}
+
+def consultar_documentos(params, parceiro=None):
+    filtros, valores = ["status = 'ok'"], {}
+    if params.get("uc"):
+        valores["uc"] = params["uc"]
+        filtros.append("uc = :uc")
+    if params.get("mes"):
+        valores["mes_ref"] = f"{params['mes'][:7]}-01"
+        filtros.append("mes_referencia = CAST(:mes_ref AS date)")
+    if len(filtros) == 1: raise ValueError("Informe uc e/ou mes.")
+    restringir(filtros, valores, parceiro, direto=False)
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT origem, chave, uc, mes_referencia, sha256, tamanho
+            FROM cache_documentos WHERE {' AND '.join(filtros)}
+            ORDER BY uc, mes_referencia, origem
+        """), valores).mappings().all()
+    return {"dados": [dict(r) for r in rows]}
+
+def consultar_previsoes(params, parceiro=None):
+    filtros, valores = [], {}
+    restringir(filtros, valores, parceiro, direto=False)
+    if params.get("uc"):
+        valores["uc"] = params["uc"]
+        filtros.append("uc = :uc")
+    if params.get("concessionaria"):
+        valores["concessionaria"] = params["concessionaria"]
+        filtros.append("concessionaria = :concessionaria")
+    if params.get("ate"):
+        # Emissões previstas até a data (AAAA-MM-DD)
+        valores["ate"] = params["ate"][:10]
+        filtros.append("data_emissao_prevista <= CAST(:ate AS date)")
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT * FROM previsoes_faturamento {where}
+            ORDER BY data_emissao_prevista, uc
+        """), valores).mappings().all()
+    return {"dados": [dict(r) for r in rows]}
+
+def rotear(caminho, params, parceiro=None):
+    partes = [p for p in caminho.split("/") if p]
+    if partes == ["documentos"]: return consultar_documentos(params, parceiro)
+    if partes == ["tabelao"]: return consultar_tabelao(params, parceiro)
+    if partes == ["previsoes"]: return consultar_previsoes(params, parceiro)
+    if len(partes) == 3 and partes[0] == "ucs" and partes[2] == "historico": return consultar_historico_uc(partes[1], parceiro)
+    if partes == ["distribuidoras", "resumo"]: return consultar_resumo_distribuidoras(params, parceiro)
+    return None
+
+# --- DOCUMENTOS EM CACHE (PDFs) ---
+# Ficam fora do cache LRU (são grandes); o ETag é o sha256 do conteúdo, então uma visualização
+# repetida é respondida com 304 só com a consulta ao cache_documentos, sem ler o arquivo.
+
+def buscar_documentos_cacheados(partes, params, parceiro=None):
+    """/documentos/<origem>/<chave> (a chave pode conter barras) ou /documentos/lote?mes=AAAA-MM."""
+    if partes == ["documentos", "lote"]:
+        if not params.get("mes"): raise ValueError("Informe mes=AAAA-MM.")
+        filtros, valores = ["mes_referencia = CAST(:mes_ref AS date)"], {"mes_ref": f"{params['mes'][:7]}-01"}
+        if params.get("origem"):
+            filtros.append("origem = :origem")
+            valores["origem"] = params["origem"]
+    else:
+        filtros = ["origem = :origem", "chave = :chave"]
+        valores = {"origem": partes[1], "chave": unquote("/".join(partes[2:]))}
+    restringir(filtros, valores, parceiro, direto=False)
+    with engine.connect() as conn:
+        return conn.execute(text(f"""
+            SELECT origem, chave, uc, mes_referencia, sha256, armazenamento, local
+            FROM cache_documentos WHERE status = 'ok' AND {' AND '.join(filtros)}
+            ORDER BY uc, origem
+        """), valores).mappings().all()
+
+def montar_zip(registros):
+    from .documentos_service import ler_documento
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as arquivo_zip:
+        for reg in registros:
+            # PDFs já são comprimidos: ZIP_STORED evita gastar CPU à toa
+            nome = f"{reg['uc']}_{reg['mes_referencia']:%Y-%m}_{reg['origem']}_{reg['sha256'][:8]}.pdf"
+            arquivo_zip.writestr(nome, ler_documento(reg))
+    return buffer.getvalue()
+
+# --- SERVIDOR HTTP ---
+
+class Handler(BaseHTTPRequestHandler):
+    def responder(self, status, corpo=b"", etag=None, tipo="application/json; charset=utf-8", imutavel=False):
+        self.send_response(status)
+        origem = self.headers.get("Origin")
+        if origem and origem in origens_permitidas():
+            self.send_header("Access-Control-Allow-Origin", origem)
+            self.send_header("Access-Control-Allow-Headers", "authorization, if-none-match, content-type")
+            self.send_header("Access-Control-Expose-Headers", "ETag")
+        self.send_header("Vary", "Origin, Authorization")
+        if etag:
+            self.send_header("ETag", etag)
+            # O navegador sempre revalida; a resposta vem como 304 enquanto não houver carga nova
+            self.send_header("Cache-Control", "private, max-age=86400, immutable" if imutavel else "no-cache")
+        if corpo:
+            self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        if corpo: self.wfile.write(corpo)
+
+    def do_OPTIONS(self):
+        self.responder(204)
+
+    def do_GET(self):
+        autorizado, parceiro = identificar(self.headers.get("Authorization"))
+        if not autorizado:
+            return self.responder(401, '{"error": "Não autorizado."}'.encode())
+
+        url = urlparse(self.path)
+        partes = [p for p in url.path.split("/") if p]
+        if len(partes) >= 2 and partes[0] == "documentos":
+            return self.servir_documentos(partes, {k: v[0] for k, v in parse_qs(url.query).items()}, parceiro)
+
+        chave = (parceiro, url.path, url.query)
+        entrada = cache.obter(chave)
+        if entrada is None:
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            try:
+                resultado = rotear(url.path, params, parceiro)
+            except (ValueError, TypeError) as e:
+                return self.responder(400, json.dumps({"error": str(e)}).encode())
+            except Exception as e:
+                print(f"❌ Erro em {self.path}: {e}", flush=True)
+                return self.responder(500, b'{"error": "Erro interno."}')
+            if resultado is None:
+                return self.responder(404, b'{"error": "Rota desconhecida."}')
+
+            corpo = json.dumps(resultado, default=serializar, ensure_ascii=False).encode()
+            entrada = (f'"{hashlib.sha1(corpo).hexdigest()}"', corpo)
+            cache.guardar(chave, entrada)
+
+        etag, corpo = entrada
+        if self.headers.get("If-None-Match") == etag:
+            return self.responder(304, etag=etag)
+        self.responder(200, corpo, etag)
+
+    def servir_documentos(self, partes, params, parceiro=None):
+        try:
+            registros = buscar_documentos_cacheados(partes, params, parceiro)
+        except ValueError as e:
+            return self.responder(400, json.dumps({"error": str(e)}).encode())
+        if not registros:
+            return self.responder(404, '{"error": "Documento ainda não está no cache."}'.encode())
+
+        lote = partes[1] == "lote"
+        if lote: etag = f'"{hashlib.sha1("".join(r["sha256"] for r in registros).encode()).hexdigest()}"'
+        else: etag = f'"{registros[0]["sha256"]}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.responder(304, etag=etag, imutavel=not lote)
+        try:
+            if lote:
+                corpo, tipo = montar_zip(registros), "application/zip"
+            else:
+                from .documentos_service import ler_documento
+                corpo, tipo = ler_documento(registros[0]), "application/pdf"
+        except Exception as e:
+            print(f"❌ Erro lendo documento {self.path}: {e}", flush=True)
+            return self.responder(500, b'{"error": "Erro interno."}')
+        self.responder(200, corpo, etag, tipo=tipo, imutavel=not lote)
+
+    def log_message(self, formato, *args):
+        pass
+
+def origens_permitidas():
+    return {o.strip() for o in (cfg("API_ORIGENS") or "").split(",") if o.strip()}
+
+def escutar_cargas():
+    """Fica em LISTEN no canal de cargas e limpa o cache a cada sinal dos conectores."""
+    while True:
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL_CARGA};")
+            # Reconectou: pode ter perdido sinais enquanto estava fora
+            cache.limpar()
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []): continue
+                conn.poll()
+                fontes = set()
+                while conn.notifies:
+                    fontes.add(conn.notifies.pop(0).payload)
+                if fontes:
+                    cache.limpar()
+                    print(f"🔔 Carga concluída ({', '.join(sorted(fontes))}): cache invalidado.", flush=True)
+        except Exception as e:
+            print(f"⚠️ Listener de cargas caiu ({e}). Reconectando em 10s...", flush=True)
+            time.sleep(10)
+
+def iniciar_api(porta=None):
+    # Sem token a API ficaria aberta: melhor não subir
+    exigir("API_TOKEN")
+    from .esquema import aplicar_migracoes
+    aplicar_migracoes(engine)
+    porta = porta or int(cfg("API_PORTA", cfg("PORT", "8080")))
+    threading.Thread(target=escutar_cargas, daemon=True).start()
+    servidor = ThreadingHTTPServer(("0.0.0.0", porta), Handler)
+    print(f"🚀 API de leitura ouvindo na porta {porta}", flush=True)
+    servidor.serve_forever()
@@ -1,14 +1,6 @@
 import requests
-import os
 import json
-from dotenv import load_dotenv
-
-load_dotenv()
-
-LUMI_URL = os.getenv("LUMI_BASE_URL")
-LUMI_EMAIL = os.getenv("LUMI_EMAIL")
-LUMI_SENHA = os.getenv("LUMI_SENHA")
-LUMI_ENDPOINT = os.getenv("LUMI_ENDPOINT_DADOS", "/faturas/dados")
+from .config import cfg
 
 # A lista exata que você pediu
 CAMPOS_TESTE = [
@@ -29,7 +21,7 @@ CAMPOS_TESTE = [
 
 def login_lumi():
     try:
-        resp = requests.post(f"{LUMI_URL}/login", json={"email": LUMI_EMAIL, "senha": LUMI_SENHA})
+        resp = requests.post(f"{cfg('LUMI_BASE_URL')}/login", json={"email": cfg("LUMI_EMAIL"), "senha": cfg("LUMI_SENHA")})
         return resp.json().get("token")
     except: return None
 
@@ -41,7 +33,7 @@ def audit_lumi_specific():
         return
 
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    full_url = f"{LUMI_URL}{LUMI_ENDPOINT}"
+    full_url = f"{cfg('LUMI_BASE_URL')}{cfg('LUMI_ENDPOINT_DADOS', '/faturas/dados')}"
     
     # Período curto para teste
     params = {
@@ -78,6 +70,3 @@ def audit_lumi_specific():
 
     except Exception as e:
         print(f"❌ Crash: {e}")
-
-if __name__ == "__main__":
-    audit_lumi_specific()
\ No newline at end of file
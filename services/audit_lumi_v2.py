@@ -1,14 +1,6 @@
 import requests
-import os
 import json
-from dotenv import load_dotenv
-
-load_dotenv()
-
-LUMI_URL = os.getenv("LUMI_BASE_URL")
-LUMI_EMAIL = os.getenv("LUMI_EMAIL")
-LUMI_SENHA = os.getenv("LUMI_SENHA")
-LUMI_ENDPOINT = os.getenv("LUMI_ENDPOINT_DADOS", "/faturas/dados")
+from .config import cfg
 
 # AQUI ESTÁ O SEGREDO:
 # Vamos pedir TODAS as variações possíveis na lista de campos.
@@ -36,7 +28,7 @@ def audit_lumi_cirurgico():
     # 1. Login
     print("🔑 Autenticando...")
     try:
-        resp_login = requests.post(f"{LUMI_URL}/login", json={"email": LUMI_EMAIL, "senha": LUMI_SENHA})
+        resp_login = requests.post(f"{cfg('LUMI_BASE_URL')}/login", json={"email": cfg("LUMI_EMAIL"), "senha": cfg("LUMI_SENHA")})
         if resp_login.status_code != 200:
             print(f"❌ Falha Login: {resp_login.text}")
             return
@@ -47,7 +39,7 @@ def audit_lumi_cirurgico():
 
     # 2. Requisição com a lista de campos explícita
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    full_url = f"{LUMI_URL}{LUMI_ENDPOINT}"
+    full_url = f"{cfg('LUMI_BASE_URL')}{cfg('LUMI_ENDPOINT_DADOS', '/faturas/dados')}"
     
     # Pegando um período recente para garantir dados
     params = {
@@ -108,6 +100,3 @@ def audit_lumi_cirurgico():
 
     except Exception as e:
         print(f"❌ Crash: {e}")
-
-if __name__ == "__main__":
-    audit_lumi_cirurgico()
\ No newline at end of file
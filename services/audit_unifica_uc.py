@@ -1,29 +1,25 @@
 import requests
-import os
-from dotenv import load_dotenv
+from .config import cfg
 
-load_dotenv()
-
-UNIFICA_URL = os.getenv("UNIFICA_BASE_URL")
-UNIFICA_TOKEN = os.getenv("UNIFICA_TOKEN")
 ENDPOINT = "/operacao/cobrancas"
 
 # A UC e Referência que queremos investigar
 ALVO_UC = "3001223734"
 MES_REF = "2026-02" # Convertido de 02/2026 para o padrão YYYY-MM exigido pela API
 
-def audit_specific_uc():
-    print(f"🕵️ INVESTIGANDO A UC: {ALVO_UC} | REF: {MES_REF}")
+def audit_specific_uc(uc=ALVO_UC, mes_ref=MES_REF):
+    print(f"🕵️ INVESTIGANDO A UC: {uc} | REF: {mes_ref}")
     
-    if UNIFICA_URL: 
-        url = UNIFICA_URL.rstrip("/") + ENDPOINT
+    unifica_url = cfg("UNIFICA_BASE_URL")
+    if unifica_url: 
+        url = unifica_url.rstrip("/") + ENDPOINT
     else:
         print("❌ Erro: UNIFICA_BASE_URL não encontrada no arquivo .env.")
         return
 
     # O Header precisa do Token Bearer, conforme documentação
     headers = {
-        "Authorization": f"Bearer {UNIFICA_TOKEN}", 
+        "Authorization": f"Bearer {cfg('UNIFICA_TOKEN')}", 
         "Content-Type": "application/json"
     }
     
@@ -37,8 +33,8 @@ def audit_specific_uc():
         params = {
             "page": page, 
             "per_page": 100,
-            "uc": ALVO_UC,
-            "date_ref": MES_REF
+            "uc": uc,
+            "date_ref": mes_ref
         }
         
         try:
@@ -79,6 +75,3 @@ def audit_specific_uc():
         except Exception as e:
             print(f"\n❌ Erro de conexão ou execução: {e}")
             break
-
-if __name__ == "__main__":
-    audit_specific_uc()
\ No newline at end of file
@@ -0,0 +1,124 @@
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from sqlalchemy import text
+from .config import Ajuste, engine
+from .esquema import aplicar_migracoes
+from .alteracoes import filtrar_alterados, nova_execucao, registrar_alteracoes
+from .analytics_service import marcar_alteradas, manter_analytics
+from .concorrencia import LimitadorTaxa
+from .sinais import sinalizar_fim_carga
+from .reconciliacao import FONTES, RECONCILIACAO_CONCORRENCIA, RECONCILIACAO_REQ_POR_SEGUNDO
+
+# Backfill direcionado: quando um campo novo entra num conector (ex.: uc_aneel, kwh_balance_credits,
+# creditos_estoque_tot), as linhas antigas ficam NULL/0 até a próxima varredura completa. Aqui uma
+# consulta acha as linhas afetadas, só os meses/UCs delas são buscados na API (mesmos filtros e
+# paralelismo da reconciliação) e só as colunas pedidas são atualizadas, num UPDATE único por lote.
+
+# Mês com mais UCs afetadas que isso é buscado inteiro (páginas em paralelo) em vez de UC a UC
+BACKFILL_UCS_POR_MES = Ajuste("BACKFILL_UCS_POR_MES", "100", int)
+LOTE_ESCRITA = 1000
+TIPOS_NUMERICOS = ("numeric", "double precision", "real", "integer", "bigint", "smallint")
+
+def tipos_colunas(conn, tabela):
+    return dict(conn.execute(text("""
+        SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = CAST(:tabela AS regclass) AND attnum > 0 AND NOT attisdropped
+    """), {"tabela": tabela}).all())
+
+def localizar_afetadas(conn, tabela, colunas, tipos, meses=None, ucs=None):
+    """
+    {mes: {ucs}} das linhas existentes dentro dos meses/UCs informados; com colunas-alvo, só as
+    que têm alguma delas vazia (NULL, ou 0 nas numéricas, que é o que os conectores gravam na falta).
+    """
+    filtros, params = ["true"], {}
+    if colunas:
+        vazias = [f"{c} IS NULL OR {c} = 0" if tipos[c].startswith(TIPOS_NUMERICOS) else f"{c} IS NULL" for c in colunas]
+        filtros.append(f"({' OR '.join(vazias)})")
+    if meses:
+        filtros.append("mes_referencia = ANY(CAST(:meses AS date[]))")
+        params["meses"] = [f"{m[:7]}-01" for m in meses]
+    if ucs:
+        filtros.append("uc = ANY(:ucs)")
+        params["ucs"] = list(ucs)
+    afetadas = defaultdict(set)
+    for uc, mes in conn.execute(text(f"""
+        SELECT uc, to_char(mes_referencia, 'YYYY-MM') FROM {tabela} WHERE {' AND '.join(filtros)}
+    """), params):
+        afetadas[mes].add(uc)
+    return afetadas
+
+def gravar_colunas(fonte, colunas, tipos, registros, execucao_id):
+    """Atualiza só `colunas` das linhas existentes que mudaram; linhas novas ficam para a sincronização."""
+    total = 0
+    nomes_chave = list(fonte.chave)
+    for i in range(0, len(registros), LOTE_ESCRITA):
+        lote = registros[i:i + LOTE_ESCRITA]
+        with engine.begin() as conn:
+            alterados = [(reg, dif) for reg, dif in filtrar_alterados(conn, fonte.tabela, fonte.chave, colunas, lote,
+                                                                     coluna_particao="mes_referencia")
+                         if not dif.nova]
+            if not alterados: continue
+            definicao = ", ".join(f"{c} {tipos[c]}" for c in nomes_chave + colunas)
+            atribuicoes = [f"{c} = v.{c}" for c in colunas]
+            if "updated_at" in tipos: atribuicoes.append("updated_at = now()")
+            dados = [{c: reg.get(c) for c in nomes_chave + colunas} for reg, _ in alterados]
+            conn.execute(text(f"""
+                UPDATE {fonte.tabela} t SET {", ".join(atribuicoes)}
+                FROM jsonb_to_recordset(CAST(:dados AS jsonb)) AS v({definicao})
+                WHERE {" AND ".join(f"t.{c} = v.{c}" for c in nomes_chave)}
+            """), {"dados": json.dumps(dados, default=lambda v: v.isoformat() if isinstance(v, (date, datetime)) else str(v))})
+            marcar_alteradas(conn, [(reg["uc"], reg["mes_referencia"]) for reg, _ in alterados], fonte.nome)
+            registrar_alteracoes(conn, execucao_id, fonte.nome, fonte.tabela, fonte.chave, alterados)
+        total += len(alterados)
+    return total
+
+def executar_backfill(fonte, colunas=None, meses=None, ucs=None, simular=False):
+    if fonte not in FONTES:
+        raise ValueError(f"Fonte inválida: {fonte}. Use {', '.join(FONTES)}.")
+    if not (colunas or meses or ucs):
+        raise ValueError("Informe colunas-alvo, meses ou UCs.")
+    aplicar_migracoes(engine)
+    inicio = time.time()
+    classe = FONTES[fonte]
+    limitador = LimitadorTaxa(RECONCILIACAO_REQ_POR_SEGUNDO())
+    fonte_api = classe(limitador)
+
+    invalidas = [c for c in colunas or () if c not in fonte_api.colunas]
+    if invalidas:
+        raise ValueError(f"Colunas fora do conector {fonte}: {', '.join(invalidas)}. Use {', '.join(fonte_api.colunas)}.")
+    ucs = {str(uc).strip() for uc in ucs or () if str(uc).strip()}
+
+    with engine.begin() as conn:
+        tipos = tipos_colunas(conn, classe.tabela)
+        afetadas = localizar_afetadas(conn, classe.tabela, colunas, tipos, meses, ucs)
+    # Sem colunas-alvo: todas as colunas do conector nas linhas dos meses/UCs informados
+    colunas = list(colunas or fonte_api.colunas)
+
+    linhas = sum(len(u) for u in afetadas.values())
+    print(f"🩹 Backfill {fonte} ({', '.join(colunas)}): {linhas} linhas afetadas em {len(afetadas)} meses.", flush=True)
+    if simular or not afetadas:
+        for mes in sorted(afetadas):
+            print(f"    {mes}: {len(afetadas[mes])} UCs")
+        return afetadas
+
+    execucao_id = nova_execucao(f"backfill-{fonte}")
+    atualizadas = 0
+    with ThreadPoolExecutor(max_workers=RECONCILIACAO_CONCORRENCIA()) as pool:
+        for mes in sorted(afetadas, reverse=True):
+            alvo = afetadas[mes]
+            # Poucas UCs: filtro uc + date_ref; muitas: o mês inteiro, com as páginas em paralelo
+            filtro_ucs = alvo if len(alvo) <= BACKFILL_UCS_POR_MES() else None
+            # Uma linha por chave (a API às vezes repete a fatura entre páginas)
+            registros = list({(r["uc"], str(r["mes_referencia"])[:10]): r
+                              for r in fonte_api.buscar(pool, mes, filtro_ucs) if r["uc"] in alvo}.values())
+            gravadas = gravar_colunas(fonte_api, colunas, tipos, registros, execucao_id)
+            atualizadas += gravadas
+            print(f"    ✅ {mes}: {len(registros)} de {len(alvo)} linhas encontradas na API, {gravadas} atualizadas.", flush=True)
+
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, fonte)
+    print(f"\n🏁 Backfill concluído: {atualizadas} linhas atualizadas em {time.time() - inicio:.1f}s.")
+    return atualizadas
@@ -0,0 +1,133 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy import text
+from .config import Ajuste, engine
+from .esquema import aplicar_migracoes
+from .concorrencia import LimitadorTaxa
+
+# Consultas simultâneas e teto de requisições por segundo à BrasilAPI
+CEP_CONCORRENCIA = Ajuste("CEP_CONCORRENCIA", "8", int)
+CEP_REQ_POR_SEGUNDO = Ajuste("CEP_REQ_POR_SEGUNDO", "5", float)
+# CEPs inválidos ficam no cache negativo por este prazo antes de uma nova tentativa
+CEP_DIAS_CACHE_NEGATIVO = Ajuste("CEP_DIAS_CACHE_NEGATIVO", "90", int)
+TAMANHO_LOTE = 500
+
+class CepInvalido(Exception):
+    """O provedor respondeu que o CEP não existe (vai para o cache negativo)."""
+
+# --- PROVEDORES DE CEP ---
+
+class ProvedorBrasilAPI:
+    URL = "https://brasilapi.com.br/api/cep/v2/{cep}"
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def consultar(self, cep):
+        resp = self.session.get(self.URL.format(cep=cep), timeout=20)
+        if resp.status_code in (400, 404):
+            raise CepInvalido(cep)
+        resp.raise_for_status()
+        data = resp.json()
+        coords = (data.get("location") or {}).get("coordinates") or {}
+        return {
+            "latitude": float(coords["latitude"]) if coords.get("latitude") else None,
+            "longitude": float(coords["longitude"]) if coords.get("longitude") else None,
+            "cidade": data.get("city"),
+            "uf": data.get("state"),
+        }
+
+class ProvedorLocal:
+    """Provedor em memória ({cep: {latitude, longitude, cidade, uf}}), para testes e cargas offline."""
+
+    def __init__(self, tabela):
+        self.tabela = tabela
+
+    def consultar(self, cep):
+        if cep not in self.tabela:
+            raise CepInvalido(cep)
+        return dict(self.tabela[cep])
+
+# --- FUNÇÕES ---
+
+def buscar_ceps_faltantes():
+    # Diferença de conjuntos direto no banco: CEPs do CRM que ainda não estão no cache
+    with engine.begin() as conn:
+        rows = conn.execute(text("""
+            SELECT cep FROM (
+                SELECT DISTINCT regexp_replace(cep_uc, '[^0-9]', '', 'g') AS cep
+                FROM view_crm_dashboard
+                WHERE cep_uc IS NOT NULL
+            ) crm
+            WHERE length(cep) = 8
+            EXCEPT
+            SELECT cep FROM cache_ceps
+            WHERE NOT invalido OR consultado_em > now() - make_interval(days => :dias)
+        """), {"dias": CEP_DIAS_CACHE_NEGATIVO()}).fetchall()
+    return [row[0] for row in rows]
+
+def consultar_cep(provedor, limitador, cep):
+    limitador.aguardar()
+    try:
+        dados = provedor.consultar(cep)
+        return {"cep": cep, "invalido": False, **dados}
+    except CepInvalido:
+        return {"cep": cep, "latitude": None, "longitude": None, "cidade": None, "uf": None, "invalido": True}
+
+def salvar_ceps(lista):
+    if not lista: return
+    agora = datetime.now()
+    stmt = text("""
+        INSERT INTO cache_ceps (cep, latitude, longitude, cidade, uf, invalido, consultado_em)
+        VALUES (:cep, :latitude, :longitude, :cidade, :uf, :invalido, :consultado_em)
+        ON CONFLICT (cep) DO UPDATE SET
+            latitude = EXCLUDED.latitude,
+            longitude = EXCLUDED.longitude,
+            cidade = EXCLUDED.cidade,
+            uf = EXCLUDED.uf,
+            invalido = EXCLUDED.invalido,
+            consultado_em = EXCLUDED.consultado_em;
+    """)
+    with engine.begin() as conn:
+        conn.execute(stmt, [{**item, "consultado_em": agora} for item in lista])
+    print(f"✅ Lote de {len(lista)} CEPs salvo no cache.", flush=True)
+
+def executar_sync_ceps(provedor=None):
+    aplicar_migracoes(engine)
+    print("🚀 Iniciando enriquecimento de CEPs...", flush=True)
+
+    faltantes = buscar_ceps_faltantes()
+    print(f"🛑 CEPs faltando: {len(faltantes)}", flush=True)
+    if not faltantes:
+        print("🎉 Nenhum CEP faltante. Tudo ok!")
+        return
+
+    provedor = provedor or ProvedorBrasilAPI()
+    limitador = LimitadorTaxa(CEP_REQ_POR_SEGUNDO())
+    lote, sucessos, invalidos, falhas = [], 0, 0, 0
+
+    with ThreadPoolExecutor(max_workers=CEP_CONCORRENCIA()) as pool:
+        futuros = {pool.submit(consultar_cep, provedor, limitador, cep): cep for cep in faltantes}
+        for futuro in as_completed(futuros):
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                # Erro transitório (rede, 429, 5xx): não grava nada, tenta de novo na próxima execução
+                print(f"⚠️ Falha ao consultar CEP {futuros[futuro]}: {e}", flush=True)
+                falhas += 1
+                continue
+
+            if resultado["invalido"]: invalidos += 1
+            else: sucessos += 1
+            lote.append(resultado)
+            if len(lote) >= TAMANHO_LOTE:
+                salvar_ceps(lote)
+                lote = []
+
+    salvar_ceps(lote)
+
+    print("\n📊 RESUMO FINAL")
+    print(f"Total processados: {len(faltantes)}")
+    print(f"Sucessos: {sucessos} | Inválidos (cache negativo): {invalidos} | Falhas: {falhas}")
+    print("🏁 Processo concluído!")
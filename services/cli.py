@@ -0,0 +1,263 @@
+import argparse
+import sys
+from .config import ConfiguracaoAusente, carregar_env
+
+# Ponto de entrada único: python -m services <comando>. Cada comando importa o seu módulo
+# só quando roda, então --help e os comandos pequenos não carregam requests, pandas etc.
+
+def cmd_sync(args):
+    if args.fonte == "unifica":
+        if args.fila:
+            from .unifica_service import executar_sync_unifica_fila
+            executar_sync_unifica_fila(args.rodada, args.trabalhadores)
+        else:
+            from .unifica_service import executar_sync_unifica
+            executar_sync_unifica([mes[:7] for mes in args.mes] or None)
+    elif args.fonte == "lumi":
+        from .lumi_service import executar_sync_lumi, executar_sync_lumi_abertas
+        if args.fila:
+            from .lumi_service import executar_sync_lumi_fila
+            executar_sync_lumi_fila(args.rodada, args.trabalhadores)
+        elif args.abertas: executar_sync_lumi_abertas()
+        else: executar_sync_lumi()
+    elif args.fonte == "rd":
+        if args.negocio:
+            from .rd_service_unico import atualizar_negocio_especifico
+            atualizar_negocio_especifico(args.negocio)
+        else:
+            from .rd_service import executar_sync_rd_completo
+            executar_sync_rd_completo()
+    elif args.fonte == "pipedrive":
+        from .pipedrive_service import importar_dados_pipedrive
+        importar_dados_pipedrive(completa=args.completa)
+    elif args.fonte == "ceps":
+        from .cep_service import executar_sync_ceps
+        executar_sync_ceps()
+
+def cmd_export(args):
+    if args.por:
+        from .exportar_tabelao import exportar_tabelao_fatiado
+        exportar_tabelao_fatiado(args.por, args.pasta, args.processos)
+    else:
+        from .exportar_tabelao import exportar_tabelao
+        exportar_tabelao()
+
+def cmd_backfill(args):
+    from .backfill import executar_backfill
+    ucs = list(args.uc)
+    if args.arquivo_ucs:
+        with open(args.arquivo_ucs, encoding="utf-8") as f:
+            ucs += [linha.strip() for linha in f if linha.strip()]
+    executar_backfill(args.fonte, args.coluna, args.mes, ucs, args.simular)
+
+def cmd_extratos(args):
+    from .extratos_comissao import gerar_extratos
+    gerar_extratos(args.mes, args.pasta, args.processos, args.forcar)
+
+def cmd_audit(args):
+    if args.alvo == "unifica":
+        from .audit_unifica_uc import audit_specific_uc
+        audit_specific_uc(args.uc, args.mes[:7])
+    elif args.alvo == "lumi":
+        from .audit_lumi_v2 import audit_lumi_cirurgico
+        audit_lumi_cirurgico()
+    elif args.alvo == "lumi-pagamentos":
+        from .audit_lumi_pagamentos import audit_lumi_specific
+        audit_lumi_specific()
+    elif args.alvo == "reconciliar":
+        from .reconciliacao import executar_reconciliacao
+        ucs = list(args.uc)
+        if args.arquivo_ucs:
+            with open(args.arquivo_ucs, encoding="utf-8") as f:
+                ucs += [linha.strip() for linha in f if linha.strip()]
+        executar_reconciliacao(args.fonte, args.mes, ucs, args.amostra, args.saida)
+
+def cmd_refresh(args):
+    from .config import engine
+    from .esquema import aplicar_migracoes
+    from .analytics_service import manter_analytics
+    from .sinais import sinalizar_fim_carga
+    aplicar_migracoes(engine)
+    manter_analytics(engine, completo=args.completo)
+    sinalizar_fim_carga(engine, "analytics")
+
+def cmd_migrate(args):
+    from .config import engine
+    from .esquema import aplicar_migracoes
+    print(f"📦 Versão do esquema: {aplicar_migracoes(engine)}")
+
+def cmd_particoes(args):
+    from .config import engine
+    from .esquema import aplicar_migracoes
+    from .particoes import manter_particoes
+    aplicar_migracoes(engine)
+    manter_particoes(engine, migrar=args.migrar, meses_a_frente=args.meses_a_frente)
+
+def cmd_documentos(args):
+    from .documentos_service import executar_prefetch_documentos
+    executar_prefetch_documentos(args.mes[:7] if args.mes else None, args.limite)
+
+def cmd_replica(args):
+    from . import replica_local
+    if args.acao == "sync":
+        replica_local.sincronizar_replica(args.arquivo, args.tabela or None, args.completa, args.reconciliar)
+    elif args.acao == "tabelao":
+        replica_local.exportar_tabelao_local(args.arquivo, args.saida)
+    elif args.acao == "audit":
+        replica_local.auditar_uc_local(args.uc, args.arquivo)
+    elif args.acao == "sql":
+        print(replica_local.consultar_local(args.consulta, args.arquivo).to_string(index=False))
+    elif args.acao == "status":
+        replica_local.status_replica(args.arquivo)
+
+def cmd_snapshots(args):
+    from .snapshots import gerar_snapshots
+    gerar_snapshots(args.destino, args.pasta)
+
+def cmd_previsoes(args):
+    from .previsoes import executar_previsoes
+    executar_previsoes(args.completo)
+
+def cmd_planejar(args):
+    from .planejador import executar_planejador
+    executar_planejador(args.orcamento_minutos, args.simular, args.tarefa or None)
+
+def cmd_api(args):
+    if args.emitir_token:
+        from .api_service import emitir_token
+        print(emitir_token(args.emitir_token))
+        return
+    from .api_service import iniciar_api
+    iniciar_api(args.porta)
+
+def montar_parser():
+    parser = argparse.ArgumentParser(prog="python -m services", description="Conectores e rotinas do Simplifica.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    sync = sub.add_parser("sync", help="Sincroniza uma fonte com o banco.")
+    fontes = sync.add_subparsers(dest="fonte", required=True)
+    unifica = fontes.add_parser("unifica", help="Cobranças da Unifica, por mês de referência.")
+    unifica.add_argument("--mes", action="append", default=[], metavar="AAAA-MM",
+                         help="Atualiza só este mês (pode repetir).")
+    lumi = fontes.add_parser("lumi", help="Faturas das contas Lumi.")
+    lumi.add_argument("--abertas", action="store_true", help="Só faturas não pagas ou não vencidas.")
+    for parser_fonte in (unifica, lumi):
+        parser_fonte.add_argument("--fila", action="store_true",
+                                  help="Modo fila: divide o trabalho com outros runners da mesma rodada.")
+        parser_fonte.add_argument("--rodada", help="Identificador da fila compartilhada (padrão: data de hoje).")
+        parser_fonte.add_argument("--trabalhadores", type=int, help="Unidades processadas em paralelo neste runner.")
+    rd = fontes.add_parser("rd", help="Negócios do RD Station e planilhas de comissão.")
+    rd.add_argument("--negocio", metavar="ID", help="Atualiza um único negócio.")
+    pipedrive = fontes.add_parser("pipedrive", help="Negócios do Pipedrive (incremental pelo update_time).")
+    pipedrive.add_argument("--completa", action="store_true",
+                           help="Força a varredura completa, particionada por etapa e status (remove negócios excluídos).")
+    fontes.add_parser("ceps", help="Geolocalização dos CEPs que faltam no cache.")
+    sync.set_defaults(func=cmd_sync)
+
+    exportar = sub.add_parser("export", help="Exporta o tabelão para Excel.")
+    exportar.add_argument("--por", choices=["concessionaria", "area_de_gestao"],
+                          help="Uma planilha por valor da coluna, geradas em paralelo, com manifesto.")
+    exportar.add_argument("--pasta", help="Pasta de saída da exportação fatiada.")
+    exportar.add_argument("--processos", type=int, help="Processos simultâneos (padrão: até 8).")
+    exportar.set_defaults(func=cmd_export)
+
+    extratos = sub.add_parser("extratos", help="Extratos de comissão por parceiro/indicador (um xlsx cada).")
+    extratos.add_argument("--mes", metavar="AAAA-MM", help="Mês de referência (padrão: mês anterior).")
+    extratos.add_argument("--pasta", help="Pasta de saída (padrão: Extratos_Comissao/AAAA-MM).")
+    extratos.add_argument("--processos", type=int, help="Processos simultâneos (padrão: até 8).")
+    extratos.add_argument("--forcar", action="store_true", help="Regera todos, mesmo sem alteração.")
+    extratos.set_defaults(func=cmd_extratos)
+
+    audit = sub.add_parser("audit", help="Inspeciona o retorno bruto das APIs.")
+    alvos = audit.add_subparsers(dest="alvo", required=True)
+    audit_unifica = alvos.add_parser("unifica", help="Cobranças de uma UC na Unifica.")
+    audit_unifica.add_argument("--uc", required=True)
+    audit_unifica.add_argument("--mes", required=True, metavar="AAAA-MM")
+    alvos.add_parser("lumi", help="Testa as variações de campos da Lumi.")
+    alvos.add_parser("lumi-pagamentos", help="Campos de pagamento de uma fatura da Lumi.")
+    reconciliar = alvos.add_parser("reconciliar", help="Compara a API com o banco coluna a coluna, em paralelo.")
+    reconciliar.add_argument("--fonte", required=True, choices=["unifica", "lumi"])
+    reconciliar.add_argument("--mes", metavar="AAAA-MM", help="Confere o mês inteiro (ou só ele, com UCs/amostra).")
+    reconciliar.add_argument("--uc", action="append", default=[], help="UC a conferir (pode repetir).")
+    reconciliar.add_argument("--arquivo-ucs", help="Arquivo com uma UC por linha.")
+    reconciliar.add_argument("--amostra", type=float, metavar="TAXA", help="Sorteia esta fração das UCs do banco (ex.: 0.05).")
+    reconciliar.add_argument("--saida", help="CSV com as divergências.")
+    audit.set_defaults(func=cmd_audit)
+
+    backfill = sub.add_parser("backfill", help="Preenche colunas novas (ou meses/UCs escolhidos) sem varredura completa.")
+    backfill.add_argument("fonte", choices=["unifica", "lumi"])
+    backfill.add_argument("--coluna", action="append", default=[],
+                          help="Coluna-alvo (pode repetir): só linhas com ela NULL/0 são buscadas e só ela é atualizada.")
+    backfill.add_argument("--mes", action="append", default=[], metavar="AAAA-MM", help="Restringe a este mês (pode repetir).")
+    backfill.add_argument("--uc", action="append", default=[], help="Restringe a esta UC (pode repetir).")
+    backfill.add_argument("--arquivo-ucs", help="Arquivo com uma UC por linha.")
+    backfill.add_argument("--simular", action="store_true", help="Só mostra quantas linhas seriam buscadas por mês.")
+    backfill.set_defaults(func=cmd_backfill)
+
+    refresh = sub.add_parser("refresh", help="Recalcula o analytics a partir das chaves pendentes.")
+    refresh.add_argument("--completo", action="store_true", help="Reconstrói o analytics inteiro.")
+    refresh.set_defaults(func=cmd_refresh)
+
+    migrate = sub.add_parser("migrate", help="Aplica as migrações pendentes.")
+    migrate.set_defaults(func=cmd_migrate)
+
+    particoes = sub.add_parser("particoes", help="Partições mensais de raw_unifica e raw_lumi.")
+    particoes.add_argument("--migrar", action="store_true",
+                           help="Converte as tabelas ainda não particionadas (cópia online).")
+    particoes.add_argument("--meses-a-frente", type=int, default=3, metavar="N",
+                           help="Partições futuras criadas com antecedência.")
+    particoes.set_defaults(func=cmd_particoes)
+
+    documentos = sub.add_parser("documentos", help="Baixa para o cache os PDFs de faturas e boletos.")
+    documentos.add_argument("--mes", metavar="AAAA-MM", help="Só os documentos deste mês de referência.")
+    documentos.add_argument("--limite", type=int, metavar="N", help="Baixa no máximo N documentos.")
+    documentos.set_defaults(func=cmd_documentos)
+
+    replica = sub.add_parser("replica", help="Réplica local (DuckDB) para auditorias e exportações.")
+    replica.add_argument("--arquivo", help="Arquivo da réplica (padrão: REPLICA_ARQUIVO ou replica_simplifica.duckdb).")
+    acoes = replica.add_subparsers(dest="acao", required=True)
+    replica_sync = acoes.add_parser("sync", help="Copia do Supabase só o que mudou desde a última vez.")
+    replica_sync.add_argument("--tabela", action="append", default=[], help="Só esta tabela (pode repetir).")
+    replica_sync.add_argument("--completa", action="store_true", help="Recopia as tabelas do zero.")
+    replica_sync.add_argument("--reconciliar", action="store_true",
+                              help="Compara todas as chaves com o Supabase agora (padrão: a cada REPLICA_RECONCILIACAO_DIAS).")
+    replica_tabelao = acoes.add_parser("tabelao", help="Gera o tabelão a partir da réplica.")
+    replica_tabelao.add_argument("--saida", help="Arquivo .xlsx de saída.")
+    replica_audit = acoes.add_parser("audit", help="Unifica, Lumi e analytics de uma UC, mês a mês.")
+    replica_audit.add_argument("--uc", required=True)
+    replica_sql = acoes.add_parser("sql", help="Consulta livre na réplica.")
+    replica_sql.add_argument("consulta")
+    acoes.add_parser("status", help="Marca d'água e linhas de cada tabela replicada.")
+    replica.set_defaults(func=cmd_replica)
+
+    snapshots = sub.add_parser("snapshots", help="Gera os arquivos estáticos do dashboard (com hash no nome).")
+    snapshots.add_argument("--destino", choices=["local", "supabase"],
+                           help="Pasta local (padrão: frontend/public/dados) ou bucket do Supabase Storage.")
+    snapshots.add_argument("--pasta", help="Pasta de saída do destino local.")
+    snapshots.set_defaults(func=cmd_snapshots)
+
+    previsoes = sub.add_parser("previsoes", help="Atualiza a previsão da próxima fatura de cada UC ativa.")
+    previsoes.add_argument("--completo", action="store_true", help="Recalcula todas as UCs, não só as alteradas.")
+    previsoes.set_defaults(func=cmd_previsoes)
+
+    planejar = sub.add_parser("planejar", help="Decide e roda as sincronizações que valem a pena agora (chamar de hora em hora).")
+    planejar.add_argument("--orcamento-minutos", type=float, help="Tempo disponível nesta chamada (padrão: 50).")
+    planejar.add_argument("--simular", action="store_true", help="Só mostra o plano, sem rodar nada.")
+    planejar.add_argument("--tarefa", action="append", default=[], help="Considera só esta tarefa (pode repetir).")
+    planejar.set_defaults(func=cmd_planejar)
+
+    api = sub.add_parser("api", help="Sobe a API de leitura do dashboard.")
+    api.add_argument("--porta", type=int)
+    api.add_argument("--emitir-token", metavar="PARCEIRO", help="Só imprime o token de leitura do parceiro (assinado com API_TOKEN).")
+    api.set_defaults(func=cmd_api)
+    return parser
+
+def main(argv=None):
+    args = montar_parser().parse_args(argv)
+    # O .env precisa estar carregado antes de importar o módulo do comando (constantes de ajuste)
+    carregar_env()
+    try:
+        args.func(args)
+    except ConfiguracaoAusente as e:
+        print(f"🛑 ERRO: {e}")
+        sys.exit(1)
@@ -0,0 +1,26 @@
+import threading
+import time
+
+# Utilitários de concorrência compartilhados pelos conectores
+
+class LimitadorTaxa:
+    """Token bucket thread-safe: no máximo `por_segundo` requisições/s, com rajadas de até `rajada`."""
+
+    def __init__(self, por_segundo, rajada=None):
+        self.por_segundo = float(por_segundo)
+        self.capacidade = float(rajada or max(1, por_segundo))
+        self.tokens = self.capacidade
+        self.ultimo = time.monotonic()
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.por_segundo)
+                self.ultimo = agora
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                espera = (1 - self.tokens) / self.por_segundo
+            time.sleep(espera)
@@ -0,0 +1,71 @@
+import os
+import threading
+
+# Configuração sob demanda: importar qualquer módulo de services/ não lê o .env, não abre
+# conexão e não chama API nenhuma. O .env é carregado na primeira leitura e o engine é
+# criado na primeira vez que alguém usa o banco.
+
+class ConfiguracaoAusente(RuntimeError):
+    pass
+
+_lock = threading.Lock()
+_env_carregado = False
+_engine = None
+
+def carregar_env():
+    global _env_carregado
+    if _env_carregado: return
+    from dotenv import load_dotenv
+    load_dotenv()
+    _env_carregado = True
+
+def cfg(nome, padrao=None):
+    carregar_env()
+    return os.getenv(nome, padrao)
+
+class Ajuste:
+    """
+    Parâmetro de ajuste com padrão (ex.: paralelismo, req/s). É lido do .env/ambiente a cada
+    chamada, nunca na importação: quem importa o módulo antes de carregar o .env (planejador,
+    scripts) ainda enxerga o valor configurado.
+    """
+    def __init__(self, nome, padrao, tipo=str):
+        self.nome, self.padrao, self.tipo = nome, padrao, tipo
+
+    def __call__(self):
+        return self.tipo(cfg(self.nome, self.padrao))
+
+def exigir(*nomes):
+    """Lê variáveis obrigatórias (uma devolve o valor, várias devolvem uma lista)."""
+    valores = [cfg(nome) for nome in nomes]
+    faltando = [nome for nome, valor in zip(nomes, valores) if not valor]
+    if faltando:
+        raise ConfiguracaoAusente(f"Variáveis ausentes no .env: {', '.join(faltando)}")
+    return valores[0] if len(valores) == 1 else valores
+
+def obter_engine():
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                from sqlalchemy import create_engine
+                # Timeout de conexão para o processo não ficar "pendurado" no banco; o pool
+                # comporta os conectores que gravam de várias threads ao mesmo tempo
+                _engine = create_engine(
+                    exigir("DATABASE_URL"),
+                    pool_pre_ping=True,
+                    pool_size=int(cfg("DB_POOL_SIZE", "10")),
+                    max_overflow=10,
+                    connect_args={'connect_timeout': 30}
+                )
+    return _engine
+
+class _EngineTardio:
+    """Repassa engine.begin(), engine.connect() etc. para o engine real, criado no primeiro uso."""
+    def __getattr__(self, nome):
+        return getattr(obter_engine(), nome)
+
+    def __repr__(self):
+        return "<engine sob demanda>" if _engine is None else repr(_engine)
+
+engine = _EngineTardio()
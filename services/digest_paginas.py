@@ -0,0 +1,67 @@
+import hashlib
+import json
+from sqlalchemy import text
+from .config import Ajuste
+
+# Detecção de páginas inalteradas: guarda, por fonte/partição/página, o sha256 do corpo bruto e os
+# ETag/Last-Modified que a API devolveu. Na execução seguinte a requisição vai condicional (quando
+# há validador) e, sem 304, o corpo é comparado pelo digest antes de decodificar o JSON. Página
+# igual não passa por json, normalização nem upsert.
+
+# Depois deste prazo a assinatura não vale mais e a página é reprocessada mesmo sem mudar
+# (cobre alterações feitas no banco por fora da sincronização)
+PAGINAS_VALIDADE_DIAS = Ajuste("PAGINAS_VALIDADE_DIAS", "7", int)
+
+def assinatura(resposta):
+    return {
+        "sha256": hashlib.sha256(resposta.content).hexdigest() if resposta.status_code != 304 else None,
+        "etag": resposta.headers.get("ETag"),
+        "last_modified": resposta.headers.get("Last-Modified"),
+    }
+
+class DigestPaginas:
+    """Assinaturas da execução anterior de uma partição e contagem de páginas puladas nesta."""
+
+    def __init__(self, engine, fonte, particao):
+        self.engine, self.fonte, self.particao = engine, fonte, particao
+        self.puladas = 0
+        with engine.begin() as conn:
+            self.anteriores = {
+                row["pagina"]: dict(row) for row in conn.execute(text("""
+                    SELECT pagina, sha256, etag, last_modified, meta, itens FROM paginas_digest
+                    WHERE fonte = :fonte AND particao = :particao
+                      AND atualizado_em > now() - make_interval(days => :validade)
+                """), {"fonte": fonte, "particao": particao, "validade": PAGINAS_VALIDADE_DIAS()}).mappings()
+            }
+
+    def condicionais(self, pagina):
+        """Cabeçalhos If-None-Match / If-Modified-Since para a página, se houver validador guardado."""
+        anterior = self.anteriores.get(pagina)
+        if not anterior: return {}
+        cabecalhos = {}
+        if anterior["etag"]: cabecalhos["If-None-Match"] = anterior["etag"]
+        if anterior["last_modified"]: cabecalhos["If-Modified-Since"] = anterior["last_modified"]
+        return cabecalhos
+
+    def inalterada(self, pagina, resposta):
+        """Registro da execução anterior quando a página não mudou (304 ou mesmo sha256); senão None."""
+        anterior = self.anteriores.get(pagina)
+        if not anterior: return None
+        if resposta.status_code == 304: return anterior
+        return anterior if hashlib.sha256(resposta.content).hexdigest() == anterior["sha256"] else None
+
+    def pular(self):
+        self.puladas += 1
+
+    def guardar(self, pagina, assinatura_pagina, meta, itens):
+        # Chamado depois da gravação da página: se o upsert falhar, a assinatura antiga continua
+        if not assinatura_pagina or not assinatura_pagina["sha256"]: return
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO paginas_digest (fonte, particao, pagina, sha256, etag, last_modified, meta, itens, atualizado_em)
+                VALUES (:fonte, :particao, :pagina, :sha256, :etag, :last_modified, CAST(:meta AS jsonb), :itens, now())
+                ON CONFLICT (fonte, particao, pagina) DO UPDATE SET
+                    sha256 = EXCLUDED.sha256, etag = EXCLUDED.etag, last_modified = EXCLUDED.last_modified,
+                    meta = EXCLUDED.meta, itens = EXCLUDED.itens, atualizado_em = EXCLUDED.atualizado_em;
+            """), {"fonte": self.fonte, "particao": self.particao, "pagina": pagina, **assinatura_pagina,
+                   "meta": json.dumps(meta or {}), "itens": itens})
@@ -0,0 +1,244 @@
+import hashlib
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+from sqlalchemy import text
+from .config import Ajuste, cfg, engine, exigir
+from .esquema import aplicar_migracoes
+from .concorrencia import LimitadorTaxa
+
+# Pré-carregamento dos PDFs apontados pelas tabelas raw (raw_unifica.link_fatura e
+# link_fatura_concessionaria = file_keys da Plataforma de Gestão; raw_lumi.link_boleto = drive_id da Lumi). Cada arquivo é guardado pelo
+# sha256 do conteúdo (arquivos iguais ocupam espaço uma vez só) e registrado em cache_documentos,
+# de onde a API de leitura e as edge functions servem as próximas visualizações.
+
+DOCUMENTOS_CONCORRENCIA = Ajuste("DOCUMENTOS_CONCORRENCIA", "6", int)
+DOCUMENTOS_REQ_POR_SEGUNDO = Ajuste("DOCUMENTOS_REQ_POR_SEGUNDO", "4", float)
+# Documentos que o upstream ainda não tem (boleto não gerado etc.) são tentados de novo após este prazo
+DOCUMENTOS_HORAS_INDISPONIVEL = Ajuste("DOCUMENTOS_HORAS_INDISPONIVEL", "24", int)
+# Boletos de faturas em aberto podem ser reemitidos: são baixados de novo após este prazo
+DOCUMENTOS_HORAS_REVALIDAR = Ajuste("DOCUMENTOS_HORAS_REVALIDAR", "24", int)
+MAX_TENTATIVAS_ERRO = 5
+# Status de pagamento (Unifica e Asaas/Lumi) de faturas que não mudam mais
+STATUS_QUITADOS = ("PAID", "PAGO", "CANCELED", "CANCELADO", "RECEIVED", "CONFIRMED", "RECEIVED_IN_CASH",
+                   "REFUNDED", "DELETED", "CANCELLED")
+
+class DocumentoIndisponivel(Exception):
+    """O upstream respondeu, mas o documento ainda não existe."""
+
+# --- ARMAZENAMENTO ENDEREÇADO POR CONTEÚDO ---
+
+def caminho_conteudo(sha256):
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf"
+
+class ArmazenamentoLocal:
+    nome = "local"
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+
+    def _arquivo(self, local):
+        return os.path.join(self.pasta, *local.split("/"))
+
+    def guardar(self, sha256, conteudo):
+        local = caminho_conteudo(sha256)
+        arquivo = self._arquivo(local)
+        if not os.path.exists(arquivo):
+            os.makedirs(os.path.dirname(arquivo), exist_ok=True)
+            # Grava em arquivo temporário e renomeia: outra thread nunca lê um PDF pela metade
+            temporario = f"{arquivo}.{threading.get_ident()}.tmp"
+            with open(temporario, "wb") as f:
+                f.write(conteudo)
+            os.replace(temporario, arquivo)
+        return local
+
+    def ler(self, local):
+        with open(self._arquivo(local), "rb") as f:
+            return f.read()
+
+class ArmazenamentoSupabase:
+    """Bucket do Supabase Storage (API REST, com a service role key)."""
+    nome = "supabase"
+
+    def __init__(self, url, chave, bucket):
+        self.base = f"{url.rstrip('/')}/storage/v1/object"
+        self.bucket = bucket
+        self.headers = {"Authorization": f"Bearer {chave}", "apikey": chave}
+
+    def guardar(self, sha256, conteudo):
+        local = caminho_conteudo(sha256)
+        resp = requests.post(
+            f"{self.base}/{self.bucket}/{local}", data=conteudo, timeout=60,
+            headers={**self.headers, "Content-Type": "application/pdf", "x-upsert": "false"}
+        )
+        # 409/400 "Duplicate": o mesmo conteúdo já foi enviado antes (deduplicação)
+        if resp.status_code not in (200, 201) and "Duplicate" not in resp.text:
+            resp.raise_for_status()
+        return local
+
+    def ler(self, local):
+        resp = requests.get(f"{self.base}/{self.bucket}/{local}", headers=self.headers, timeout=60)
+        resp.raise_for_status()
+        return resp.content
+
+def obter_armazenamento(nome=None):
+    nome = nome or cfg("DOCUMENTOS_ARMAZENAMENTO", "local")
+    if nome == "supabase":
+        url, chave = exigir("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY")
+        return ArmazenamentoSupabase(url, chave, cfg("DOCUMENTOS_BUCKET", "documentos"))
+    return ArmazenamentoLocal(cfg("DOCUMENTOS_PASTA", "documentos_cache"))
+
+# --- FONTES DOS DOCUMENTOS ---
+
+class FonteUnifica:
+    origem = "unifica"
+
+    def __init__(self):
+        url, token = exigir("UNIFICA_BASE_URL", "UNIFICA_TOKEN")
+        self.base = url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def baixar(self, doc):
+        resp = self.session.get(f"{self.base}/aws/get-file-url/{quote(doc['chave'], safe='')}", timeout=30)
+        if resp.status_code == 404: raise DocumentoIndisponivel(doc["chave"])
+        resp.raise_for_status()
+        dados = resp.json()
+        url = (dados.get("data") or {}).get("url") or dados.get("url")
+        if not url: raise DocumentoIndisponivel(doc["chave"])
+        arquivo = requests.get(url, timeout=60)
+        if arquivo.status_code in (403, 404): raise DocumentoIndisponivel(doc["chave"])
+        arquivo.raise_for_status()
+        return arquivo.content
+
+class FonteUnificaConcessionaria(FonteUnifica):
+    origem = "unifica_concessionaria"
+
+class FonteLumiBoleto:
+    origem = "lumi_boleto"
+
+    def __init__(self):
+        from .lumi_service import contas_lumi, logar_conta
+        self.base = exigir("LUMI_BASE_URL")
+        self.headers_por_conta = {conta["nome"]: logar_conta(conta) for conta in contas_lumi()}
+
+    def baixar(self, doc):
+        headers = self.headers_por_conta.get(doc["conta"])
+        if not headers: raise RuntimeError(f"Sem login na conta {doc['conta']}")
+        resp = requests.post(f"{self.base}/pagamentos/preview-cobranca/location",
+                             json={"drive_id": doc["chave"]}, headers=headers, timeout=60)
+        resp.raise_for_status()
+        dados = resp.json()
+        # A Lumi responde status "successo" (sic) e os bytes do PDF como lista de inteiros
+        bytes_pdf = ((dados.get("data") or {}).get("toRender") or {}).get("data")
+        if not bytes_pdf: raise DocumentoIndisponivel(doc["chave"])
+        return bytes(bytes_pdf)
+
+# --- FUNÇÕES ---
+
+def buscar_documentos_faltantes(mes=None, limite=None):
+    filtro_mes = "AND mes_referencia = CAST(:mes AS date)" if mes else ""
+    clausula_limite = "LIMIT :limite" if limite else ""
+    with engine.begin() as conn:
+        rows = conn.execute(text(f"""
+            WITH referenciados AS (
+                SELECT 'unifica' AS origem, link_fatura AS chave, uc, mes_referencia, NULL AS conta,
+                       coalesce(upper(status_pagamento), '') NOT IN :quitados OR vencimento >= current_date AS aberta
+                FROM raw_unifica WHERE coalesce(link_fatura, '') <> '' {filtro_mes}
+                UNION ALL
+                -- A fatura da distribuidora não é reemitida
+                SELECT 'unifica_concessionaria', link_fatura_concessionaria, uc, mes_referencia, NULL, false
+                FROM raw_unifica WHERE coalesce(link_fatura_concessionaria, '') <> '' {filtro_mes}
+                UNION ALL
+                SELECT 'lumi_boleto', link_boleto, uc, mes_referencia, origem_conta,
+                       coalesce(upper(status_pagamento), '') NOT IN :quitados OR vencimento >= current_date
+                FROM raw_lumi WHERE coalesce(link_boleto, '') <> '' {filtro_mes}
+            )
+            SELECT DISTINCT ON (r.origem, r.chave) r.origem, r.chave, r.uc, r.mes_referencia, r.conta
+            FROM referenciados r
+            LEFT JOIN cache_documentos c ON c.origem = r.origem AND c.chave = r.chave
+            WHERE c.chave IS NULL
+               OR (c.status = 'indisponivel' AND c.atualizado_em < now() - make_interval(hours => :horas))
+               OR (c.status = 'erro' AND c.tentativas < :max_tentativas)
+               OR (c.status = 'ok' AND r.aberta AND c.atualizado_em < now() - make_interval(hours => :revalidar))
+            ORDER BY r.origem, r.chave, r.mes_referencia DESC, r.aberta DESC
+            {clausula_limite}
+        """), {"mes": f"{mes[:7]}-01" if mes else None, "horas": DOCUMENTOS_HORAS_INDISPONIVEL(),
+               "max_tentativas": MAX_TENTATIVAS_ERRO, "limite": limite,
+               "revalidar": DOCUMENTOS_HORAS_REVALIDAR(), "quitados": STATUS_QUITADOS}).mappings().all()
+    return [dict(row) for row in rows]
+
+def registrar_documento(doc, status, sha256=None, tamanho=None, armazenamento=None, local=None, erro=None):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO cache_documentos (origem, chave, uc, mes_referencia, status, sha256, tamanho,
+                                          armazenamento, local, erro, tentativas, atualizado_em)
+            VALUES (:origem, :chave, :uc, :mes, :status, :sha256, :tamanho, :armazenamento, :local, :erro,
+                    CASE WHEN :status = 'erro' THEN 1 ELSE 0 END, now())
+            ON CONFLICT (origem, chave) DO UPDATE SET
+                uc = EXCLUDED.uc,
+                mes_referencia = EXCLUDED.mes_referencia,
+                status = EXCLUDED.status,
+                sha256 = EXCLUDED.sha256,
+                tamanho = EXCLUDED.tamanho,
+                armazenamento = EXCLUDED.armazenamento,
+                local = EXCLUDED.local,
+                erro = EXCLUDED.erro,
+                tentativas = CASE WHEN EXCLUDED.status = 'erro' THEN cache_documentos.tentativas + 1 ELSE 0 END,
+                atualizado_em = EXCLUDED.atualizado_em;
+        """), {"origem": doc["origem"], "chave": doc["chave"], "uc": doc["uc"], "mes": doc["mes_referencia"],
+               "status": status, "sha256": sha256, "tamanho": tamanho, "armazenamento": armazenamento,
+               "local": local, "erro": erro})
+
+def baixar_documento(fonte, armazenamento, limitador, doc):
+    limitador.aguardar()
+    try:
+        conteudo = fonte.baixar(doc)
+    except DocumentoIndisponivel:
+        registrar_documento(doc, "indisponivel")
+        return "indisponivel"
+    except Exception as e:
+        registrar_documento(doc, "erro", erro=str(e)[:500])
+        return "erro"
+
+    sha256 = hashlib.sha256(conteudo).hexdigest()
+    local = armazenamento.guardar(sha256, conteudo)
+    registrar_documento(doc, "ok", sha256, len(conteudo), armazenamento.nome, local)
+    return "ok"
+
+def executar_prefetch_documentos(mes=None, limite=None, armazenamento=None):
+    aplicar_migracoes(engine)
+    print("🚀 Iniciando pré-carregamento de documentos...", flush=True)
+
+    faltantes = buscar_documentos_faltantes(mes, limite)
+    if not faltantes:
+        print("✅ Todos os documentos já estão no cache.")
+        return
+
+    armazenamento = armazenamento or obter_armazenamento()
+    fontes = {}
+    for classe in (FonteUnifica, FonteUnificaConcessionaria, FonteLumiBoleto):
+        if any(doc["origem"] == classe.origem for doc in faltantes):
+            fontes[classe.origem] = classe()
+    limitador = LimitadorTaxa(DOCUMENTOS_REQ_POR_SEGUNDO())
+
+    print(f"📄 {len(faltantes)} documentos para baixar ({DOCUMENTOS_CONCORRENCIA()} simultâneos)...", flush=True)
+    contagem = {"ok": 0, "indisponivel": 0, "erro": 0}
+    with ThreadPoolExecutor(max_workers=DOCUMENTOS_CONCORRENCIA()) as pool:
+        futuros = [
+            pool.submit(baixar_documento, fontes[doc["origem"]], armazenamento, limitador, doc)
+            for doc in faltantes
+        ]
+        for i, futuro in enumerate(as_completed(futuros), 1):
+            contagem[futuro.result()] += 1
+            if i % 100 == 0: print(f"    ⏳ {i}/{len(faltantes)}", flush=True)
+
+    print("\n📊 RESUMO FINAL")
+    print(f"Baixados: {contagem['ok']} | Indisponíveis: {contagem['indisponivel']} | Erros: {contagem['erro']}")
+    print("🏁 Processo concluído!")
+
+def ler_documento(registro):
+    """Bytes de um documento já em cache (registro = linha de cache_documentos)."""
+    return obter_armazenamento(registro["armazenamento"]).ler(registro["local"])
@@ -0,0 +1,72 @@
+import os
+import re
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+# Migrações versionadas do banco, compartilhadas por todos os serviços.
+# Cada arquivo em services/migracoes/ se chama NNNN_descricao.sql e é aplicado uma única vez,
+# em ordem, registrando a versão na tabela schema_version.
+PASTA_MIGRACOES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migracoes")
+
+# Chave do pg_advisory_xact_lock que serializa execuções concorrentes (cron + workflow_dispatch)
+LOCK_MIGRACOES = 26_0001
+
+def listar_migracoes():
+    migracoes = []
+    for nome_arquivo in sorted(os.listdir(PASTA_MIGRACOES)):
+        m = re.match(r"^(\d+)_(.+)\.sql$", nome_arquivo)
+        if not m: continue
+        migracoes.append((int(m.group(1)), m.group(2), os.path.join(PASTA_MIGRACOES, nome_arquivo)))
+    return sorted(migracoes)
+
+def versao_atual(conn):
+    try:
+        return conn.execute(text("SELECT coalesce(max(versao), 0) FROM schema_version")).scalar()
+    except ProgrammingError:
+        # schema_version ainda não existe: banco anterior ao sistema de migrações
+        conn.rollback()
+        return 0
+
+def aplicar_migracoes(engine):
+    migracoes = listar_migracoes()
+    ultima = migracoes[-1][0] if migracoes else 0
+
+    # Caminho comum: uma única consulta, nenhum lock de DDL
+    with engine.connect() as conn:
+        versao = versao_atual(conn)
+    if versao >= ultima:
+        return versao
+
+    print(f"🛠️ Banco na versão {versao}, aplicando migrações até a {ultima}...")
+    for numero, nome, caminho in migracoes:
+        if numero <= versao: continue
+        with open(caminho, "r", encoding="utf-8") as f:
+            sql = f.read()
+
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:chave)"), {"chave": LOCK_MIGRACOES})
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    versao INTEGER PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """))
+            # Outro processo pode ter aplicado enquanto esperávamos o lock
+            ja_aplicada = conn.execute(
+                text("SELECT 1 FROM schema_version WHERE versao = :v"), {"v": numero}
+            ).first()
+            if ja_aplicada:
+                versao = numero
+                continue
+
+            conn.exec_driver_sql(sql)
+            conn.execute(
+                text("INSERT INTO schema_version (versao, nome) VALUES (:v, :n)"),
+                {"v": numero, "n": nome}
+            )
+        versao = numero
+        print(f"    ✅ Migração {numero:04d} ({nome}) aplicada.", flush=True)
+
+    print("✅ Estrutura do banco atualizada.")
+    return versao
@@ -1,83 +1,113 @@
-import pandas as pd
+import hashlib
+import json
 import os
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from multiprocessing import get_context
+from .config import obter_engine
 
-# Carrega configurações
-load_dotenv()
-DB_URL = os.getenv("DATABASE_URL")
+# Renomear colunas para ficar bonito no Excel
+RENOMEAR_COLUNAS = {
+    "uc": "UC",
+    "mes_referencia": "Mês Ref",
+    "nome_cliente": "Cliente",
+    "concessionaria": "Concessionária",
+    "area_de_gestao": "Área de Gestão",
+    "objetivo_etapa": "Etapa (RD)",
+    "fonte_dados": "Origem do Dado",
+    "status": "Status Pagamento",
+    "consumo_crm_mwh": "Consumo RD (MWh)",
+    "consumo_kwh": "Consumo Fatura (kWh)",
+    "compensacao_kwh": "Compensação Fatura (kWh)",
+    "eficiencia_compensacao": "Eficiência (%)",
+    "tarifa_estimada": "Tarifa Estimada (RD)",
+    "tarifa_real": "Tarifa Real (Fatura)",
+    "is_consorcio": "Troca Titularidade?",          # <--- NOVA EXPORTADA
+    "boleto_simplifica": "Boleto Simplifica (R$)",  # <--- NOVA EXPORTADA
+    "valor_fatura_distribuidora": "Fatura Concessionária (R$)", # <--- NOVA EXPORTADA
+    # Consumo do RD x tarifa estimada do RD, por mês: não é a previsão da próxima fatura
+    "valor_estimado": "Valor Estimado no RD (R$)",
+    "valor_real_cobranca": "Valor Realizado (R$)",
+    "total_cobranca": "Total Final (R$)",
+    "economia_rs": "Economia (R$)",
+    "data_ganho": "Data de Ganho",
+    "data_protocolo": "Data do 1º Protocolo",
+    "data_cancelamento": "Data de Cancelamento",
+    "dia_leitura": "Dia Leitura Base",
+    # Previsão da próxima fatura da UC, lida da previsoes_faturamento (ver COLUNAS_PREVISAO)
+    "emissao_prevista": "Próxima Emissão Prevista",
+    "consumo_previsto_kwh": "Consumo Previsto (kWh)",
+    "valor_previsto": "Valor Previsto (R$)",
+    "data_emissao": "Data Emissão Real",
+    "vencimento": "Vencimento"
+}
 
-if not DB_URL:
-    print("🛑 ERRO: DATABASE_URL não encontrada.")
-    exit()
+RENOMEAR_PREVISOES = {
+    "uc": "UC",
+    "concessionaria": "Concessionária",
+    "mes_previsto": "Mês Previsto",
+    "data_leitura_prevista": "Leitura Prevista",
+    "data_emissao_prevista": "Emissão Prevista",
+    "consumo_previsto_kwh": "Consumo Previsto (kWh)",
+    "tarifa_estimada": "Tarifa Estimada (R$/kWh)",
+    "valor_previsto": "Valor Previsto (R$)"
+}
+
+# Nova Ordem das Colunas no Excel
+COLUNAS_FINAIS = [
+    "UC", "Cliente", "Mês Ref", "Concessionária", "Área de Gestão",
+    "Etapa (RD)", "Origem do Dado", "Status Pagamento",
+    "Consumo RD (MWh)", "Consumo Fatura (kWh)", "Compensação Fatura (kWh)", "Eficiência (%)",
+    "Troca Titularidade?", "Tarifa Estimada (RD)", "Tarifa Real (Fatura)",
+    "Boleto Simplifica (R$)", "Fatura Concessionária (R$)",
+    "Valor Estimado no RD (R$)", "Valor Realizado (R$)", "Total Final (R$)", "Economia (R$)",
+    "Data de Ganho", "Data do 1º Protocolo", "Data de Cancelamento",
+    "Dia Leitura Base", "Data Emissão Real", "Vencimento",
+    "Próxima Emissão Prevista", "Consumo Previsto (kWh)", "Valor Previsto (R$)"
+]
+
+# As previsões vêm prontas da previsoes_faturamento (uma por UC), não do cálculo da view
+# (a data_emissao_prevista da analytics_completo fica fora da exportação)
+ORIGEM_TABELAO = "analytics_completo a LEFT JOIN previsoes_faturamento p ON p.uc = a.uc::text"
+COLUNAS_PREVISAO = {
+    "emissao_prevista": "p.data_emissao_prevista",
+    "consumo_previsto_kwh": "p.consumo_previsto_kwh",
+    "valor_previsto": "p.valor_previsto",
+}
+
+# Recortes aceitos pela exportação fatiada (coluna da analytics_completo)
+DIMENSOES_FATIA = ("concessionaria", "area_de_gestao")
+SEM_VALOR = "(sem valor)"
 
 def exportar_tabelao():
+    # pandas/openpyxl só são carregados quando a exportação roda de fato
+    import pandas as pd
+
     print("🚀 Iniciando extração do Tabelão Completo...")
-    
-    engine = create_engine(DB_URL)
-    
+
+    engine = obter_engine()
+
     try:
-        # Busca direta da VIEW consolidada
-        query = """
-        SELECT * FROM analytics_completo 
-        ORDER BY mes_referencia DESC, nome_cliente ASC
+        # VIEW consolidada + previsão gravada de cada UC
+        previsao = ", ".join(f"{expressao} AS {coluna}" for coluna, expressao in COLUNAS_PREVISAO.items())
+        query = f"""
+        SELECT a.*, {previsao} FROM {ORIGEM_TABELAO}
+        ORDER BY a.mes_referencia DESC, a.nome_cliente ASC
         """
-        
+
         print("⏳ Baixando dados do Supabase (isso pode levar alguns segundos)...")
         df = pd.read_sql(query, engine)
-        
+
         if df.empty:
             print("⚠️ A tabela está vazia.")
             return
 
         print("🎨 Formatando planilha...")
-        
-        # Renomear colunas para ficar bonito no Excel
-        df = df.rename(columns={
-            "uc": "UC",
-            "mes_referencia": "Mês Ref",
-            "nome_cliente": "Cliente",
-            "concessionaria": "Concessionária",
-            "area_de_gestao": "Área de Gestão",
-            "objetivo_etapa": "Etapa (RD)",
-            "fonte_dados": "Origem do Dado",
-            "status": "Status Pagamento",
-            "consumo_crm_mwh": "Consumo RD (MWh)",
-            "consumo_kwh": "Consumo Fatura (kWh)",
-            "compensacao_kwh": "Compensação Fatura (kWh)",
-            "eficiencia_compensacao": "Eficiência (%)",
-            "tarifa_estimada": "Tarifa Estimada (RD)",
-            "tarifa_real": "Tarifa Real (Fatura)",
-            "is_consorcio": "Troca Titularidade?",          # <--- NOVA EXPORTADA
-            "boleto_simplifica": "Boleto Simplifica (R$)",  # <--- NOVA EXPORTADA
-            "valor_fatura_distribuidora": "Fatura Concessionária (R$)", # <--- NOVA EXPORTADA
-            "valor_estimado": "Valor Estimado (R$)",
-            "valor_real_cobranca": "Valor Realizado (R$)",
-            "total_cobranca": "Total Final (R$)",
-            "economia_rs": "Economia (R$)",
-            "data_ganho": "Data de Ganho",
-            "data_protocolo": "Data do 1º Protocolo",
-            "data_cancelamento": "Data de Cancelamento",
-            "dia_leitura": "Dia Leitura Base",
-            "data_emissao_prevista": "Data Emissão Prevista",
-            "data_emissao": "Data Emissão Real",
-            "vencimento": "Vencimento"
-        })
-
-        # Nova Ordem das Colunas no Excel
-        colunas_finais = [
-            "UC", "Cliente", "Mês Ref", "Concessionária", "Área de Gestão", 
-            "Etapa (RD)", "Origem do Dado", "Status Pagamento", 
-            "Consumo RD (MWh)", "Consumo Fatura (kWh)", "Compensação Fatura (kWh)", "Eficiência (%)",
-            "Troca Titularidade?", "Tarifa Estimada (RD)", "Tarifa Real (Fatura)",
-            "Boleto Simplifica (R$)", "Fatura Concessionária (R$)", 
-            "Valor Estimado (R$)", "Valor Realizado (R$)", "Total Final (R$)", "Economia (R$)",
-            "Data de Ganho", "Data do 1º Protocolo", "Data de Cancelamento",
-            "Dia Leitura Base", "Data Emissão Prevista", "Data Emissão Real", "Vencimento"
-        ]
-        
-        cols_existentes = [c for c in colunas_finais if c in df.columns]
+
+        df = df.rename(columns=RENOMEAR_COLUNAS)
+        cols_existentes = [c for c in COLUNAS_FINAIS if c in df.columns]
         df = df[cols_existentes]
 
         # Formata percentual
@@ -86,9 +116,18 @@ def exportar_tabelao():
 
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
         arquivo_saida = f"Tabelao_Auditoria_{timestamp}.xlsx"
-        
-        df.to_excel(arquivo_saida, index=False)
-        
+
+        # Aba com o detalhe das mesmas previsões (leitura, tarifa, mês previsto)
+        previsoes = pd.read_sql("""
+            SELECT uc, concessionaria, mes_previsto, data_leitura_prevista, data_emissao_prevista,
+                   consumo_previsto_kwh, tarifa_estimada, valor_previsto
+            FROM previsoes_faturamento ORDER BY data_emissao_prevista, uc
+        """, engine).rename(columns=RENOMEAR_PREVISOES)
+
+        with pd.ExcelWriter(arquivo_saida) as planilha:
+            df.to_excel(planilha, sheet_name="Tabelão", index=False)
+            previsoes.to_excel(planilha, sheet_name="Previsões", index=False)
+
         print(f"\n✅ SUCESSO! Arquivo gerado na pasta raiz:")
         print(f"📂 {os.path.abspath(arquivo_saida)}")
         print(f"📊 Total de linhas: {len(df)}")
@@ -96,5 +135,122 @@ def exportar_tabelao():
     except Exception as e:
         print(f"❌ Erro ao exportar: {e}")
 
-if __name__ == "__main__":
-    exportar_tabelao()
\ No newline at end of file
+# --- EXPORTAÇÃO FATIADA (uma planilha por concessionária ou área de gestão) ---
+
+def _nome_arquivo(valor):
+    limpo = re.sub(r"[^\w\-]+", "_", valor, flags=re.UNICODE).strip("_")
+    return limpo[:80] or "fatia"
+
+def _celula(valor, percentual=False):
+    if percentual and valor is not None: return float(valor) * 100
+    # openpyxl não grava datas com fuso horário
+    if isinstance(valor, datetime) and valor.tzinfo: return valor.replace(tzinfo=None)
+    return valor
+
+def _colunas_exportadas(conn):
+    """[(coluna, expressão no SELECT)] na ordem de COLUNAS_FINAIS."""
+    from sqlalchemy import text
+    existentes = set(conn.execute(text("SELECT * FROM analytics_completo LIMIT 0")).keys())
+    expressoes = {**{c: f"a.{c}" for c in existentes}, **COLUNAS_PREVISAO}
+    por_titulo = {titulo: coluna for coluna, titulo in RENOMEAR_COLUNAS.items()}
+    return [(por_titulo[titulo], expressoes[por_titulo[titulo]]) for titulo in COLUNAS_FINAIS
+            if por_titulo[titulo] in expressoes]
+
+def exportar_fatia(dimensao, valor, caminho):
+    """
+    Roda em um processo do pool: consulta só a fatia (cursor no servidor, sem carregar tudo em
+    memória) e grava direto no xlsx em modo write-only. Retorna a entrada do manifesto.
+    """
+    from openpyxl import Workbook
+    from sqlalchemy import text
+
+    inicio = time.time()
+    engine = obter_engine()
+    livro = Workbook(write_only=True)
+    aba = livro.create_sheet(title=_nome_arquivo(valor)[:31])
+    linhas = 0
+    with engine.connect() as conn:
+        exportadas = _colunas_exportadas(conn)
+        colunas = [coluna for coluna, _ in exportadas]
+        aba.append([RENOMEAR_COLUNAS[c] for c in colunas])
+        resultado = conn.execution_options(stream_results=True, yield_per=2000).execute(text(f"""
+            SELECT {", ".join(f"{expressao} AS {coluna}" for coluna, expressao in exportadas)} FROM {ORIGEM_TABELAO}
+            WHERE coalesce(a.{dimensao}::text, :sem_valor) = :valor
+            ORDER BY a.mes_referencia DESC, a.nome_cliente ASC
+        """), {"valor": valor, "sem_valor": SEM_VALOR})
+        for row in resultado:
+            aba.append([_celula(v, c == "eficiencia_compensacao") for c, v in zip(colunas, row)])
+            linhas += 1
+    livro.save(caminho)
+    engine.dispose()
+
+    with open(caminho, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    return {
+        "valor": valor, "arquivo": os.path.basename(caminho), "linhas": linhas,
+        "sha256": sha256, "segundos": round(time.time() - inicio, 1)
+    }
+
+def exportar_tabelao_fatiado(dimensao, pasta=None, processos=None):
+    from sqlalchemy import text
+
+    if dimensao not in DIMENSOES_FATIA:
+        raise ValueError(f"Dimensão inválida: {dimensao}. Use {', '.join(DIMENSOES_FATIA)}.")
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+    pasta = pasta or f"Tabelao_por_{dimensao}_{timestamp}"
+    os.makedirs(pasta, exist_ok=True)
+
+    # Maiores fatias primeiro: o tempo total fica perto do tempo da maior delas
+    with obter_engine().connect() as conn:
+        fatias = conn.execute(text(f"""
+            SELECT coalesce({dimensao}::text, :sem_valor) AS valor, count(*) AS linhas
+            FROM analytics_completo GROUP BY 1 ORDER BY 2 DESC
+        """), {"sem_valor": SEM_VALOR}).all()
+    obter_engine().dispose()
+    if not fatias:
+        print("⚠️ A tabela está vazia.")
+        return None
+
+    print(f"🚀 Exportando {len(fatias)} fatias por {dimensao} em paralelo...", flush=True)
+    inicio = time.time()
+    entradas, falhas = [], []
+    # spawn: cada processo abre as próprias conexões (nada herdado do pool do processo pai)
+    with ProcessPoolExecutor(max_workers=processos or min(len(fatias), os.cpu_count() or 2, 8),
+                             mp_context=get_context("spawn")) as pool:
+        futuros, usados = {}, set()
+        for valor, _ in fatias:
+            nome = _nome_arquivo(valor)
+            # Valores diferentes que viram o mesmo nome de arquivo (acentos, barras) ganham sufixo
+            while nome.lower() in usados: nome += "_"
+            usados.add(nome.lower())
+            futuros[pool.submit(exportar_fatia, dimensao, valor, os.path.join(pasta, f"{nome}.xlsx"))] = valor
+        for futuro in as_completed(futuros):
+            valor = futuros[futuro]
+            try:
+                entrada = futuro.result()
+                entradas.append(entrada)
+                print(f"    ✅ {valor}: {entrada['linhas']} linhas ({entrada['segundos']}s)", flush=True)
+            except Exception as e:
+                falhas.append({"valor": valor, "erro": str(e)})
+                print(f"    ❌ {valor}: {e}", flush=True)
+
+    esperado = dict(fatias)
+    for entrada in entradas:
+        # A view pode ter mudado entre a contagem e a consulta da fatia (carga rodando)
+        entrada["linhas_previstas"] = esperado[entrada["valor"]]
+
+    manifesto = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "dimensao": dimensao,
+        "fatias": sorted(entradas, key=lambda e: e["valor"]),
+        "falhas": falhas,
+        "total_linhas": sum(e["linhas"] for e in entradas),
+    }
+    caminho_manifesto = os.path.join(pasta, "manifesto.json")
+    with open(caminho_manifesto, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+
+    print(f"\n✅ {len(entradas)} planilhas em {time.time() - inicio:.1f}s ({manifesto['total_linhas']} linhas).")
+    print(f"📂 {os.path.abspath(pasta)}")
+    if falhas: print(f"⚠️ {len(falhas)} fatias falharam (ver manifesto.json).")
+    return manifesto
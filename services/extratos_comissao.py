@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+from multiprocessing import get_context
+from sqlalchemy import text
+from .config import engine
+from .esquema import aplicar_migracoes
+
+# Extratos de comissão: um xlsx por parceiro/indicador e mês, com uma linha por UC. Uma única
+# consulta traz as linhas de todos os beneficiários (faturas da analytics_incremental + regras de
+# recorrência + indicação do Pipedrive); os arquivos são montados em um pool de processos só para
+# quem teve alguma linha diferente da última geração.
+
+COLUNAS_EXTRATO = [
+    ("papel", "Papel"),
+    ("uc", "UC"),
+    ("cliente", "Cliente"),
+    ("concessionaria", "Concessionária"),
+    ("parceiro_unidade", "Unidade do Parceiro"),
+    ("consumo_kwh", "Consumo (kWh)"),
+    ("compensacao_kwh", "Compensação (kWh)"),
+    ("total_cobranca", "Total Cobrado (R$)"),
+    ("percentual", "Comissão (%)"),
+    ("comissao", "Comissão (R$)"),
+]
+
+# Parceiro e indicador de cada UC: a regra de recorrência (planilha) tem precedência; sem regra,
+# vale o que está no negócio ganho do Pipedrive (linha sem percentual, comissão a definir). O
+# percentual da regra só vale junto com o nome da própria regra, nunca para o nome do Pipedrive
+SQL_LINHAS = """
+    WITH pipedrive AS (
+        SELECT DISTINCT ON (uc) uc, organizacao, nome_quem_indicou, parceiro_unidade, parceiro_nome
+        FROM raw_pipedrive WHERE uc IS NOT NULL
+        ORDER BY uc, updated_at DESC NULLS LAST
+    ),
+    base AS (
+        SELECT a.uc::text AS uc, p.organizacao AS cliente, a.concessionaria, p.parceiro_unidade,
+               a.consumo_kwh, a.compensacao_kwh, a.total_cobranca,
+               coalesce(nullif(trim(r.parceiro_nome), ''), nullif(trim(p.parceiro_nome), '')) AS parceiro,
+               CASE WHEN nullif(trim(r.parceiro_nome), '') IS NOT NULL THEN r.perc_parceiro END AS perc_parceiro,
+               coalesce(nullif(trim(r.indicador_nome), ''), nullif(trim(p.nome_quem_indicou), '')) AS indicador,
+               CASE WHEN nullif(trim(r.indicador_nome), '') IS NOT NULL THEN r.perc_indicador END AS perc_indicador
+        FROM analytics_incremental a
+        LEFT JOIN regras_recorrencia_uc r ON r.uc = a.uc::text
+        LEFT JOIN pipedrive p ON p.uc = a.uc::text
+        WHERE a.mes_referencia::date = CAST(:mes AS date)
+    )
+    SELECT parceiro AS beneficiario, 'Parceiro' AS papel, uc, cliente, concessionaria, parceiro_unidade,
+           consumo_kwh, compensacao_kwh, total_cobranca, perc_parceiro AS percentual,
+           round(total_cobranca * perc_parceiro / 100, 2) AS comissao
+    FROM base WHERE parceiro IS NOT NULL
+    UNION ALL
+    SELECT indicador, 'Indicador', uc, cliente, concessionaria, parceiro_unidade,
+           consumo_kwh, compensacao_kwh, total_cobranca, perc_indicador,
+           round(total_cobranca * perc_indicador / 100, 2)
+    FROM base WHERE indicador IS NOT NULL
+    ORDER BY 1, 2, 3
+"""
+
+def _nome_arquivo(valor):
+    # O hash do nome original deixa o arquivo estável por beneficiário: nomes diferentes que
+    # viram o mesmo texto limpo (acentos, barras) não se sobrescrevem, nem entre gerações
+    limpo = re.sub(r"[^\w\-]+", "_", valor, flags=re.UNICODE).strip("_")
+    sufixo = hashlib.sha1(valor.encode("utf-8")).hexdigest()[:8]
+    return f"{limpo[:80] or 'beneficiario'}_{sufixo}"
+
+def _valor_json(valor):
+    if isinstance(valor, Decimal): return str(valor)
+    if isinstance(valor, (date, datetime)): return valor.isoformat()
+    return str(valor)
+
+def assinar(linhas):
+    corpo = json.dumps(linhas, ensure_ascii=False, separators=(",", ":"), default=_valor_json)
+    return hashlib.sha256(corpo.encode("utf-8")).hexdigest()
+
+def carregar_linhas(mes):
+    """{beneficiario: [linha, ...]} de todos os beneficiários do mês, numa consulta só."""
+    por_beneficiario = defaultdict(list)
+    with engine.connect() as conn:
+        resultado = conn.execute(text(SQL_LINHAS), {"mes": f"{mes}-01"})
+        for row in resultado.mappings():
+            linha = dict(row)
+            por_beneficiario[linha.pop("beneficiario")].append(linha)
+    return por_beneficiario
+
+def gerar_extrato(beneficiario, mes, linhas, caminho):
+    """Roda em um processo do pool: só monta o xlsx a partir das linhas recebidas (sem banco)."""
+    from openpyxl import Workbook
+
+    inicio = time.time()
+    livro = Workbook(write_only=True)
+    aba = livro.create_sheet(title="Extrato")
+    aba.append([f"Extrato de comissão - {beneficiario}"])
+    aba.append([f"Mês de referência: {mes}"])
+    aba.append([])
+    aba.append([titulo for _, titulo in COLUNAS_EXTRATO])
+    total = Decimal(0)
+    for linha in linhas:
+        aba.append([float(v) if isinstance(v, Decimal) else v for v in (linha[c] for c, _ in COLUNAS_EXTRATO)])
+        total += linha["comissao"] or 0
+    aba.append([])
+    aba.append(["Total"] + [None] * (len(COLUNAS_EXTRATO) - 2) + [float(total)])
+    livro.save(caminho)
+    return {"beneficiario": beneficiario, "arquivo": os.path.basename(caminho), "linhas": len(linhas),
+            "total_comissao": float(total), "segundos": round(time.time() - inicio, 1)}
+
+def mes_anterior():
+    hoje = date.today()
+    return f"{hoje.year - (hoje.month == 1)}-{(hoje.month - 2) % 12 + 1:02d}"
+
+def remover_extratos(mes, pasta, registros):
+    """Beneficiários que não têm mais linhas no mês: o arquivo e o registro da última geração saem."""
+    if not registros: return
+    for registro in registros:
+        caminho = os.path.join(pasta, registro.arquivo)
+        if os.path.exists(caminho): os.remove(caminho)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            DELETE FROM extratos_comissao WHERE mes_referencia = CAST(:mes AS date) AND beneficiario = ANY(:beneficiarios)
+        """), {"mes": f"{mes}-01", "beneficiarios": [r.beneficiario for r in registros]})
+    print(f"🗑️ {len(registros)} extratos removidos (beneficiários sem linhas no mês).", flush=True)
+
+def gerar_extratos(mes=None, pasta=None, processos=None, forcar=False):
+    aplicar_migracoes(engine)
+    mes = (mes or mes_anterior())[:7]
+    pasta = pasta or os.path.join("Extratos_Comissao", mes)
+    os.makedirs(pasta, exist_ok=True)
+    inicio = time.time()
+
+    print(f"🚀 Extratos de comissão de {mes}: consultando faturas e regras...", flush=True)
+    por_beneficiario = carregar_linhas(mes)
+
+    with engine.begin() as conn:
+        anteriores = {row.beneficiario: row for row in conn.execute(text("""
+            SELECT beneficiario, sha256_entradas, arquivo FROM extratos_comissao WHERE mes_referencia = CAST(:mes AS date)
+        """), {"mes": f"{mes}-01"})}
+    remover_extratos(mes, pasta, [anteriores[b] for b in anteriores if b not in por_beneficiario])
+    if not por_beneficiario:
+        print("⚠️ Nenhuma UC com parceiro ou indicador no mês.")
+        return None
+
+    # Só quem teve alguma linha diferente (fatura, regra ou indicação) desde a última geração
+    pendentes = []
+    for beneficiario, linhas in sorted(por_beneficiario.items()):
+        nome = _nome_arquivo(beneficiario)
+        assinatura = assinar(linhas)
+        anterior = anteriores.get(beneficiario)
+        if not forcar and anterior and anterior.sha256_entradas == assinatura \
+                and os.path.exists(os.path.join(pasta, anterior.arquivo)):
+            continue
+        pendentes.append((beneficiario, linhas, assinatura, os.path.join(pasta, f"{nome}.xlsx")))
+
+    puladas = len(por_beneficiario) - len(pendentes)
+    print(f"📋 {len(por_beneficiario)} beneficiários: {len(pendentes)} a gerar, {puladas} sem alteração.", flush=True)
+
+    geradas, falhas = [], []
+    if pendentes:
+        # spawn: o processo filho não herda conexões; ele nem abre banco, só recebe as linhas
+        with ProcessPoolExecutor(max_workers=processos or min(len(pendentes), os.cpu_count() or 2, 8),
+                                 mp_context=get_context("spawn")) as pool:
+            futuros = {pool.submit(gerar_extrato, beneficiario, mes, linhas, caminho): (beneficiario, assinatura)
+                       for beneficiario, linhas, assinatura, caminho in pendentes}
+            for futuro in as_completed(futuros):
+                beneficiario, assinatura = futuros[futuro]
+                try:
+                    entrada = futuro.result()
+                    entrada["sha256_entradas"] = assinatura
+                    geradas.append(entrada)
+                except Exception as e:
+                    falhas.append(beneficiario)
+                    print(f"    ❌ {beneficiario}: {e}", flush=True)
+
+    # Extrato regerado com outro nome (ex.: arquivos de antes do sufixo por beneficiário)
+    for entrada in geradas:
+        anterior = anteriores.get(entrada["beneficiario"])
+        if anterior and anterior.arquivo != entrada["arquivo"]:
+            caminho = os.path.join(pasta, anterior.arquivo)
+            if os.path.exists(caminho): os.remove(caminho)
+
+    if geradas:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO extratos_comissao (mes_referencia, beneficiario, sha256_entradas, arquivo, linhas, total_comissao, gerado_em)
+                VALUES (CAST(:mes AS date), :beneficiario, :sha256_entradas, :arquivo, :linhas, :total_comissao, now())
+                ON CONFLICT (mes_referencia, beneficiario) DO UPDATE SET
+                    sha256_entradas = EXCLUDED.sha256_entradas, arquivo = EXCLUDED.arquivo, linhas = EXCLUDED.linhas,
+                    total_comissao = EXCLUDED.total_comissao, gerado_em = EXCLUDED.gerado_em;
+            """), [{**e, "mes": f"{mes}-01"} for e in geradas])
+
+    print(f"\n✅ {len(geradas)} extratos gerados e {puladas} mantidos em {time.time() - inicio:.1f}s.")
+    print(f"📂 {os.path.abspath(pasta)}")
+    if falhas: print(f"⚠️ {len(falhas)} extratos falharam: {', '.join(falhas)}")
+    return geradas
@@ -0,0 +1,186 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import text
+from .config import Ajuste
+from .concorrencia import LimitadorTaxa
+
+# Modo fila: o trabalho de uma sincronização vira unidades em fila_trabalho e qualquer número de
+# runners (ou threads) as reivindica com FOR UPDATE SKIP LOCKED. Quem pega uma unidade fica com ela
+# enquanto renovar a concessão; se o processo morrer, a concessão vence e outro runner retoma
+# (a partir do checkpoint da própria fonte, quando ela tem um).
+
+FILA_CONCESSAO_SEGUNDOS = Ajuste("FILA_CONCESSAO_SEGUNDOS", "180", int)
+FILA_MAX_TENTATIVAS = Ajuste("FILA_MAX_TENTATIVAS", "3", int)
+
+def rodada_padrao():
+    # Execuções do mesmo dia (cron + workflow_dispatch) dividem a mesma fila
+    return datetime.now().strftime("%Y-%m-%d")
+
+def novo_dono():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def publicar_unidades(engine, fonte, rodada, unidades):
+    """unidades: lista de (unidade, parametros, prioridade). Unidades já publicadas na rodada ficam como estão."""
+    if not unidades: return 0
+    with engine.begin() as conn:
+        resultado = conn.execute(text("""
+            INSERT INTO fila_trabalho (fonte, rodada, unidade, parametros, prioridade)
+            VALUES (:fonte, :rodada, :unidade, CAST(:parametros AS jsonb), :prioridade)
+            ON CONFLICT (fonte, rodada, unidade) DO NOTHING
+        """), [{"fonte": fonte, "rodada": rodada, "unidade": unidade,
+                "parametros": json.dumps(parametros or {}), "prioridade": prioridade}
+               for unidade, parametros, prioridade in unidades])
+    return resultado.rowcount
+
+def reivindicar(engine, fonte, rodada, dono):
+    """Próxima unidade livre (ou com concessão vencida) da rodada, ou None quando a fila acabou."""
+    with engine.begin() as conn:
+        # Concessão vencida sem tentativas restantes (o runner morreu em todas): não volta para a
+        # fila e não pode ficar 'em_andamento' para sempre, senão a rodada nunca termina
+        conn.execute(text("""
+            UPDATE fila_trabalho
+            SET estado = 'falhou', dono = NULL, concessao_ate = NULL,
+                erro = coalesce(erro, 'Concessão vencida após o máximo de tentativas')
+            WHERE fonte = :fonte AND rodada = :rodada AND estado = 'em_andamento'
+              AND concessao_ate < now() AND tentativas >= :max_tentativas
+        """), {"fonte": fonte, "rodada": rodada, "max_tentativas": FILA_MAX_TENTATIVAS()})
+        row = conn.execute(text("""
+            UPDATE fila_trabalho f
+            SET estado = 'em_andamento', dono = :dono, tentativas = f.tentativas + 1,
+                concessao_ate = now() + make_interval(secs => :concessao)
+            FROM (
+                SELECT fonte, rodada, unidade FROM fila_trabalho
+                WHERE fonte = :fonte AND rodada = :rodada
+                  AND (estado = 'pendente' OR (estado = 'em_andamento' AND concessao_ate < now()))
+                  AND tentativas < :max_tentativas
+                ORDER BY prioridade, unidade
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            ) livre
+            WHERE f.fonte = livre.fonte AND f.rodada = livre.rodada AND f.unidade = livre.unidade
+            RETURNING f.unidade, f.parametros, f.tentativas
+        """), {"fonte": fonte, "rodada": rodada, "dono": dono,
+               "concessao": FILA_CONCESSAO_SEGUNDOS(), "max_tentativas": FILA_MAX_TENTATIVAS()}).mappings().first()
+    return dict(row) if row else None
+
+def renovar(engine, fonte, rodada, unidade, dono):
+    """Estende a concessão. False = a unidade venceu e foi pega por outro runner."""
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            UPDATE fila_trabalho SET concessao_ate = now() + make_interval(secs => :concessao)
+            WHERE fonte = :fonte AND rodada = :rodada AND unidade = :unidade
+              AND dono = :dono AND estado = 'em_andamento'
+        """), {"fonte": fonte, "rodada": rodada, "unidade": unidade, "dono": dono,
+               "concessao": FILA_CONCESSAO_SEGUNDOS()}).rowcount == 1
+
+def finalizar(engine, fonte, rodada, unidade, dono, concluida, erro=None):
+    # Não concluída (prazo esgotado, erro): volta para a fila; após o máximo de tentativas, 'falhou'
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE fila_trabalho SET
+                estado = CASE WHEN :concluida THEN 'concluida'
+                              WHEN :erro IS NOT NULL AND tentativas >= :max_tentativas THEN 'falhou'
+                              ELSE 'pendente' END,
+                tentativas = CASE WHEN :concluida OR :erro IS NOT NULL THEN tentativas ELSE tentativas - 1 END,
+                concluida_em = CASE WHEN :concluida THEN now() END,
+                dono = NULL, concessao_ate = NULL, erro = :erro
+            WHERE fonte = :fonte AND rodada = :rodada AND unidade = :unidade AND dono = :dono
+        """), {"fonte": fonte, "rodada": rodada, "unidade": unidade, "dono": dono, "concluida": concluida,
+               "erro": erro, "max_tentativas": FILA_MAX_TENTATIVAS()})
+
+def bater_ponto(engine, fonte, rodada, dono, saindo=False):
+    """Registra o trabalhador como vivo e devolve quantos estão vivos na fonte."""
+    with engine.begin() as conn:
+        if saindo:
+            conn.execute(text("DELETE FROM fila_trabalhadores WHERE dono = :dono"), {"dono": dono})
+            return 0
+        conn.execute(text("""
+            INSERT INTO fila_trabalhadores (dono, fonte, rodada) VALUES (:dono, :fonte, :rodada)
+            ON CONFLICT (dono) DO UPDATE SET batimento_em = now()
+        """), {"dono": dono, "fonte": fonte, "rodada": rodada})
+        return conn.execute(text("""
+            SELECT count(*) FROM fila_trabalhadores
+            WHERE fonte = :fonte AND batimento_em > now() - make_interval(secs => :concessao)
+        """), {"fonte": fonte, "concessao": FILA_CONCESSAO_SEGUNDOS()}).scalar()
+
+class LimitadorCompartilhado(LimitadorTaxa):
+    """Orçamento de requisições/s de uma fonte dividido igualmente entre os trabalhadores vivos."""
+
+    def __init__(self, por_segundo_total):
+        super().__init__(por_segundo_total)
+        self.total = float(por_segundo_total)
+
+    def dividir(self, trabalhadores):
+        with self.lock:
+            self.por_segundo = self.total / max(1, trabalhadores)
+            self.capacidade = max(1.0, self.por_segundo)
+            self.tokens = min(self.tokens, self.capacidade)
+
+def resumo_fila(engine, fonte, rodada):
+    with engine.begin() as conn:
+        return dict(conn.execute(text("""
+            SELECT estado, count(*) FROM fila_trabalho WHERE fonte = :fonte AND rodada = :rodada GROUP BY estado
+        """), {"fonte": fonte, "rodada": rodada}).all())
+
+def executar_trabalhador(engine, fonte, rodada, processar, limitador, paralelismo=1, prazo=None):
+    """
+    Reivindica e processa unidades até a fila da rodada acabar (ou o prazo vencer).
+    processar(unidade, parametros, parar) -> bool (True = unidade concluída); `parar` é um
+    threading.Event acionado quando a concessão é perdida ou o prazo vence.
+    """
+    dono = novo_dono()
+    ativas = {}
+    encerrar = threading.Event()
+
+    def batimentos():
+        # Renova as concessões e redivide o orçamento da fonte a cada terço da concessão
+        while not encerrar.wait(FILA_CONCESSAO_SEGUNDOS() / 3):
+            try:
+                limitador.dividir(bater_ponto(engine, fonte, rodada, dono))
+                for (unidade, sub_dono), parar in list(ativas.items()):
+                    if prazo and time.time() > prazo: parar.set()
+                    if not renovar(engine, fonte, rodada, unidade, sub_dono):
+                        print(f"\n⚠️ Concessão de {unidade} perdida; outro runner assume.", flush=True)
+                        parar.set()
+            except Exception as e:
+                print(f"\n⚠️ Falha ao renovar concessões: {e}", flush=True)
+
+    def laco(indice):
+        sub_dono = f"{dono}-{indice}"
+        processadas = 0
+        while not (prazo and time.time() > prazo):
+            tarefa = reivindicar(engine, fonte, rodada, sub_dono)
+            if not tarefa: break
+            unidade, parar = tarefa["unidade"], threading.Event()
+            ativas[(unidade, sub_dono)] = parar
+            try:
+                concluida = bool(processar(unidade, tarefa["parametros"], parar))
+                finalizar(engine, fonte, rodada, unidade, sub_dono, concluida and not parar.is_set())
+                processadas += 1
+            except Exception as e:
+                print(f"\n❌ Erro na unidade {unidade}: {e}", flush=True)
+                finalizar(engine, fonte, rodada, unidade, sub_dono, False, str(e)[:500])
+            finally:
+                ativas.pop((unidade, sub_dono), None)
+        return processadas
+
+    limitador.dividir(bater_ponto(engine, fonte, rodada, dono))
+    vigia = threading.Thread(target=batimentos, daemon=True)
+    vigia.start()
+    try:
+        with ThreadPoolExecutor(max_workers=paralelismo) as pool:
+            processadas = sum(pool.map(laco, range(paralelismo)))
+    finally:
+        encerrar.set()
+        bater_ponto(engine, fonte, rodada, dono, saindo=True)
+
+    estados = resumo_fila(engine, fonte, rodada)
+    print(f"\n📋 Fila {fonte}/{rodada}: este runner processou {processadas} unidades | "
+          + " | ".join(f"{estado}: {qtd}" for estado, qtd in sorted(estados.items())), flush=True)
+    return estados
@@ -1,32 +1,33 @@
 import requests
-import os
 import json
+import threading
 import time
-from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-
-# Carrega variáveis de ambiente
-load_dotenv()
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from .config import Ajuste, cfg, engine, exigir
+from .esquema import aplicar_migracoes
+from .particoes import garantir_particoes
+from .alteracoes import filtrar_alterados, nova_execucao, registrar_alteracoes
+from .analytics_service import marcar_alteradas, manter_analytics
+from .sinais import sinalizar_fim_carga
 
 # --- CONFIGURAÇÕES ---
-LUMI_URL = os.getenv("LUMI_BASE_URL")
-LUMI_ENDPOINT = os.getenv("LUMI_ENDPOINT_DADOS", "/faturas/dados") 
-DB_URL = os.getenv("DATABASE_URL")
 
 # Lista de Contas para baixar (Multi-Tenant)
-CONTAS = [
-    {
-        "nome": "LUMI",  
-        "email": os.getenv("LUMI_EMAIL"),
-        "senha": os.getenv("LUMI_SENHA")
-    },
-    {
-        "nome": "LUMI_COOP", 
-        "email": os.getenv("LUMI_COOP_EMAIL"),
-        "senha": os.getenv("LUMI_COOP_SENHA")
-    }
-]
+def contas_lumi():
+    return [
+        {
+            "nome": "LUMI",  
+            "email": cfg("LUMI_EMAIL"),
+            "senha": cfg("LUMI_SENHA")
+        },
+        {
+            "nome": "LUMI_COOP", 
+            "email": cfg("LUMI_COOP_EMAIL"),
+            "senha": cfg("LUMI_COOP_SENHA")
+        }
+    ]
 
 # Campos que pedimos para a API da Lumi (ADICIONADO data_emissao)
 CAMPOS_LUMI = [
@@ -37,15 +38,39 @@ CAMPOS_LUMI = [
     "creditos_estoque_tot", "data_emissao"
 ]
 
-# Conexão com Banco
-engine = create_engine(DB_URL, pool_pre_ping=True)
+# Status do Asaas em que a cobrança não muda mais (pagas, estornadas ou canceladas)
+STATUS_FECHADOS = ("RECEIVED", "CONFIRMED", "RECEIVED_IN_CASH", "REFUNDED", "DELETED", "CANCELLED")
+
+# Congelamento de períodos fechados: um mês (por conta) com todas as faturas pagas/canceladas e
+# sem nenhuma alteração por N execuções seguidas sai da rotina; a verificação revisita poucos
+# meses congelados por execução, os mais antigos primeiro
+LUMI_EXECUCOES_PARA_CONGELAR = Ajuste("LUMI_EXECUCOES_PARA_CONGELAR", "3", int)
+LUMI_VERIFICACOES_POR_EXECUCAO = Ajuste("LUMI_VERIFICACOES_POR_EXECUCAO", "2", int)
+LUMI_DIAS_ENTRE_VERIFICACOES = Ajuste("LUMI_DIAS_ENTRE_VERIFICACOES", "30", int)
+# Meses em aberto contíguos são pedidos juntos, até este tamanho de período por requisição
+LUMI_MESES_POR_REQUISICAO = 12
+# Meses recentes ainda recebem faturas novas: nunca congelam, mesmo vazios ou todos pagos
+LUMI_MESES_SEM_CONGELAR = 2
+# Descoberta do início do histórico de uma conta nova: anos sondados para trás até um ano vazio
+LUMI_ANO_MINIMO = 2015
+
+# Modo fila: períodos baixados em paralelo por runner e teto de requisições/s somando todos os runners
+LUMI_PARALELISMO = Ajuste("LUMI_PARALELISMO", "2", int)
+LUMI_REQ_POR_SEGUNDO = Ajuste("LUMI_REQ_POR_SEGUNDO", "1", float)
+
+CHAVE_LUMI = {"uc": "text", "mes_referencia": "date"}
+COLUNAS_LUMI = [
+    "nome_cliente", "consumo_kwh", "energia_compensada", "valor_total_fatura", "economia_total",
+    "remuneracao_geracao", "data_envio", "data_emissao", "status_pagamento", "vencimento",
+    "origem_conta", "asaas_id", "creditos_estoque_tot"
+]
 
 # --- FUNÇÕES AUXILIARES ---
 
 def login_lumi(email, senha):
     try:
         if not email or not senha: return None
-        resp = requests.post(f"{LUMI_URL}/login", json={"email": email, "senha": senha}, timeout=30)
+        resp = requests.post(f"{exigir('LUMI_BASE_URL')}/login", json={"email": email, "senha": senha}, timeout=30)
         return resp.json().get("token") if resp.status_code == 200 else None
     except Exception as e:
         print(f"❌ Erro de conexão no login: {e}", flush=True)
@@ -85,8 +110,12 @@ def processar_fatura(item, nome_conta):
         "origem_conta": nome_conta 
     }
 
-def salvar_em_lotes(lista_faturas, nome_conta):
-    if not lista_faturas: return
+def salvar_em_lotes(lista_faturas, nome_conta, execucao_id):
+    """
+    Retorna os meses (AAAA-MM) com alguma fatura alterada, ou None se a gravação falhou.
+    execucao_id identifica a execução no feed de alterações (log_alteracoes).
+    """
+    if not lista_faturas: return set()
     
     dados_prontos = []
     for item in lista_faturas:
@@ -96,7 +125,8 @@ def salvar_em_lotes(lista_faturas, nome_conta):
                 dados_prontos.append(fat)
         except: pass
 
-    if not dados_prontos: return
+    # Nenhuma fatura aproveitável não é falha: nada mudou
+    if not dados_prontos: return set()
 
     stmt = text("""
         INSERT INTO raw_lumi (
@@ -130,66 +160,298 @@ def salvar_em_lotes(lista_faturas, nome_conta):
 
     try:
         with engine.begin() as conn: 
-            conn.execute(stmt, dados_prontos)
-        print(f"    ✅ [{nome_conta}] Lote salvo: {len(dados_prontos)} registros.", flush=True)
+            # Só regrava o que mudou desde a última carga (e registra as chaves para o analytics)
+            alterados = filtrar_alterados(conn, "raw_lumi", CHAVE_LUMI, COLUNAS_LUMI, dados_prontos, coluna_particao="mes_referencia")
+            if alterados:
+                conn.execute(stmt, [fat for fat, _ in alterados])
+                marcar_alteradas(conn, [(fat["uc"], fat["mes_referencia"]) for fat, _ in alterados], "lumi")
+                registrar_alteracoes(conn, execucao_id, "lumi", "raw_lumi", CHAVE_LUMI, alterados)
+        print(f"    ✅ [{nome_conta}] Lote salvo: {len(alterados)} de {len(dados_prontos)} registros alterados.", flush=True)
+        return {fat["mes_referencia"][:7] for fat, _ in alterados}
     except Exception as e:
         print(f"    ❌ Erro ao salvar no banco: {e}", flush=True)
+        return None
+
+def baixar_periodo(headers, inicio, fim):
+    full_url = f"{exigir('LUMI_BASE_URL')}{cfg('LUMI_ENDPOINT_DADOS', '/faturas/dados')}"
+    params = {"inicio": inicio, "fim": fim, "campo": CAMPOS_LUMI}
+
+    resp = requests.get(full_url, headers=headers, params=params, timeout=120)
+    if resp.status_code != 200:
+        # Erro não pode virar "período vazio": um mês vazio conta como fechado para o congelamento
+        raise RuntimeError(f"Erro API ({resp.status_code}) para o período {inicio} a {fim}")
+
+    dados = resp.json()
+    lista = []
+
+    if isinstance(dados, list): lista = dados
+    elif isinstance(dados, dict):
+        lista = dados.get("data", [])
+        if isinstance(lista, dict) and "rows" in lista: lista = lista["rows"]
+    return lista
+
+def logar_conta(conta):
+    if not conta["email"] or not conta["senha"]:
+        print(f"⚠️ Pulei conta {conta['nome']} (sem credenciais)", flush=True)
+        return None
+
+    print(f"\n🔑 Logando: {conta['nome']}...", flush=True)
+    token = login_lumi(conta["email"], conta["senha"])
+
+    if not token:
+        print(f"❌ Falha no login da conta {conta['nome']}. Verifique credenciais ou bloqueio de IP.", flush=True)
+        return None
+    return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+# =====================================================
+# PLANEJAMENTO: faixa de meses da conta e congelamento
+# =====================================================
+def listar_meses(inicio, fim):
+    ano, mes = map(int, inicio.split("-"))
+    ano_fim, mes_fim = map(int, fim.split("-"))
+    meses = []
+    while (ano, mes) <= (ano_fim, mes_fim):
+        meses.append(f"{ano:04d}-{mes:02d}")
+        mes += 1
+        if mes > 12: ano, mes = ano + 1, 1
+    return meses
+
+def ultimo_dia(mes):
+    ano, m = map(int, mes.split("-"))
+    return (datetime(ano + m // 12, m % 12 + 1, 1) - timedelta(days=1)).strftime("%Y-%m-%d")
+
+def fonte_conta(nome_conta):
+    return f"lumi:{nome_conta}"
+
+def descobrir_inicio(nome_conta, headers):
+    """Primeiro mês da conta: o menor já gravado; conta nova é sondada ano a ano para trás."""
+    with engine.begin() as conn:
+        primeiro = conn.execute(text("""
+            SELECT to_char(min(mes_referencia), 'YYYY-MM') FROM raw_lumi WHERE origem_conta = :conta
+        """), {"conta": nome_conta}).scalar()
+    if primeiro: return primeiro
+
+    ano, inicio = datetime.now().year, None
+    while ano >= LUMI_ANO_MINIMO:
+        lista = baixar_periodo(headers, f"{ano}-01-01", f"{ano}-12-31")
+        meses = sorted(m[:7] for m in (tratar_data(item.get("mes_referencia")) for item in lista) if m)
+        if not meses: break
+        inicio = meses[0]
+        ano -= 1
+    print(f"    🔎 {nome_conta}: histórico começa em {inicio or 'este ano'}.", flush=True)
+    return inicio or f"{datetime.now().year}-01"
+
+def planejar_periodos(nome_conta, inicio):
+    """Períodos a baixar: faixas contíguas de meses em aberto + alguns meses congelados para verificação."""
+    meses = listar_meses(inicio, datetime.now().strftime("%Y-%m"))
+    with engine.begin() as conn:
+        congelados = {
+            row.particao: row.ultima_verificacao or row.congelada_em
+            for row in conn.execute(text("""
+                SELECT particao, congelada_em, ultima_verificacao FROM sync_particoes
+                WHERE fonte = :fonte AND congelada_em IS NOT NULL
+            """), {"fonte": fonte_conta(nome_conta)})
+        }
+
+    periodos, faixa = [], []
+    for mes in meses:
+        if mes in congelados or len(faixa) == LUMI_MESES_POR_REQUISICAO:
+            if faixa: periodos.append({"inicio": faixa[0], "fim": faixa[-1], "verificacao": False})
+            faixa = []
+        if mes not in congelados: faixa.append(mes)
+    if faixa: periodos.append({"inicio": faixa[0], "fim": faixa[-1], "verificacao": False})
+
+    limite = datetime.now().astimezone() - timedelta(days=LUMI_DIAS_ENTRE_VERIFICACOES())
+    vencidos = sorted((visto, mes) for mes, visto in congelados.items() if mes in meses and visto < limite)
+    for _, mes in vencidos[:LUMI_VERIFICACOES_POR_EXECUCAO()]:
+        periodos.append({"inicio": mes, "fim": mes, "verificacao": True})
+
+    print(f"    🧊 {nome_conta}: {len(meses) - len(congelados)} meses em aberto em "
+          f"{sum(not p['verificacao'] for p in periodos)} requisições, {len(congelados)} congelados "
+          f"({min(len(vencidos), LUMI_VERIFICACOES_POR_EXECUCAO())} em verificação).", flush=True)
+    return periodos
+
+def atualizar_congelamento(nome_conta, meses, lista, meses_alterados, verificacao):
+    """Conta execuções estáveis por mês e congela/descongela conforme o resultado desta leitura."""
+    status_por_mes = defaultdict(list)
+    for item in lista:
+        mes = (tratar_data(item.get("mes_referencia")) or "")[:7]
+        status_por_mes[mes].append(str(item.get("status_cobranca_asaas") or "").upper())
+
+    hoje = datetime.now()
+    indice = hoje.year * 12 + hoje.month - LUMI_MESES_SEM_CONGELAR
+    recentes = f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+    registros = []
+    for mes in meses:
+        fechado = mes < recentes and all(status in STATUS_FECHADOS for status in status_por_mes[mes])
+        estavel = fechado and meses_alterados is not None and mes not in meses_alterados
+        registros.append({"fonte": fonte_conta(nome_conta), "mes": mes, "reg": len(status_por_mes[mes]),
+                          "estavel": estavel, "verificacao": verificacao, "limite": LUMI_EXECUCOES_PARA_CONGELAR()})
+        if verificacao and not estavel:
+            print(f"    🔥 {nome_conta} {mes}: mudou desde o congelamento, volta para a rotina.", flush=True)
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO sync_particoes (fonte, particao, registros, ultima_tentativa, ultima_sync_completa,
+                                        execucoes_estaveis, congelada_em, ultima_verificacao)
+            VALUES (:fonte, :mes, :reg, now(), now(), CASE WHEN :estavel THEN 1 ELSE 0 END,
+                    CASE WHEN :estavel AND :limite <= 1 THEN now() END, CASE WHEN :verificacao THEN now() END)
+            ON CONFLICT (fonte, particao) DO UPDATE SET
+                registros = EXCLUDED.registros,
+                ultima_tentativa = EXCLUDED.ultima_tentativa,
+                ultima_sync_completa = EXCLUDED.ultima_sync_completa,
+                execucoes_estaveis = CASE WHEN :estavel THEN sync_particoes.execucoes_estaveis + 1 ELSE 0 END,
+                congelada_em = CASE
+                    WHEN NOT :estavel THEN NULL
+                    WHEN sync_particoes.congelada_em IS NOT NULL THEN sync_particoes.congelada_em
+                    WHEN sync_particoes.execucoes_estaveis + 1 >= :limite THEN now()
+                END,
+                ultima_verificacao = coalesce(EXCLUDED.ultima_verificacao, sync_particoes.ultima_verificacao);
+        """), registros)
+
+def sincronizar_periodo(nome_conta, headers, periodo, execucao_id):
+    inicio, fim = periodo["inicio"], periodo["fim"]
+    rotulo = "verificação" if periodo["verificacao"] else "período"
+    print(f"    📅 {nome_conta} - {rotulo} {inicio} a {fim}...", flush=True)
+    lista = baixar_periodo(headers, f"{inicio}-01", ultimo_dia(fim))
+    meses_alterados = salvar_em_lotes(lista, nome_conta, execucao_id)
+    atualizar_congelamento(nome_conta, listar_meses(inicio, fim), lista, meses_alterados, periodo["verificacao"])
+    return meses_alterados is not None
 
 def executar_sync_lumi():
+    aplicar_migracoes(engine)
+    garantir_particoes(engine)
     print("🚀 Iniciando Sincronização Turbo Lumi...", flush=True)
+    execucao_id = nova_execucao("lumi")
+    falhas = 0
     
-    for conta in CONTAS:
-        if not conta["email"] or not conta["senha"]:
-            print(f"⚠️ Pulei conta {conta['nome']} (sem credenciais)", flush=True)
+    for conta in contas_lumi():
+        headers = logar_conta(conta)
+        if not headers:
+            # Conta sem credenciais é pulada de propósito; login recusado é falha
+            if conta["email"] and conta["senha"]: falhas += 1
             continue
 
-        print(f"\n🔑 Logando: {conta['nome']}...", flush=True)
-        token = login_lumi(conta["email"], conta["senha"])
-        
-        if not token: 
-            print(f"❌ Falha no login da conta {conta['nome']}. Verifique credenciais ou bloqueio de IP.", flush=True)
+        try:
+            periodos = planejar_periodos(conta["nome"], descobrir_inicio(conta["nome"], headers))
+        except Exception as e:
+            print(f"    ❌ Erro ao planejar {conta['nome']}: {e}", flush=True)
+            falhas += 1
             continue
 
-        headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-        full_url = f"{LUMI_URL}{LUMI_ENDPOINT}"
-        
-        anos = ["2023-01-01", "2024-01-01", "2025-01-01", "2026-01-01"]
+        for periodo in periodos:
+            try:
+                if not sincronizar_periodo(conta["nome"], headers, periodo, execucao_id): falhas += 1
+            except Exception as e: 
+                print(f"    ❌ Erro na requisição: {e}", flush=True)
+                falhas += 1
 
-        for ano_inicio in anos:
-            ano_fim = ano_inicio.replace("-01-01", "-12-31")
-            print(f"    📅 {conta['nome']} - Período: {ano_inicio} a {ano_fim}...", flush=True)
-            
-            params = {"inicio": ano_inicio, "fim": ano_fim, "campo": CAMPOS_LUMI}
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, "lumi")
+    return not falhas
 
-            try:
-                resp = requests.get(full_url, headers=headers, params=params, timeout=120)
-                if resp.status_code != 200: 
-                    print(f"    ⚠️ Erro API ({resp.status_code}) para este período.", flush=True)
-                    continue
-                
-                dados = resp.json()
-                lista = []
-                
-                if isinstance(dados, list): lista = dados
-                elif isinstance(dados, dict):
-                    lista = dados.get("data", [])
-                    if isinstance(lista, dict) and "rows" in lista: lista = lista["rows"]
-                
-                if not lista: 
-                    continue
-                
-                salvar_em_lotes(lista, conta["nome"])
+# =====================================================
+# MODO ABERTAS: só as faturas que ainda podem mudar
+# =====================================================
+def carregar_faturas_abertas():
+    """Chaves (uc, mes_referencia) ainda não pagas ou não vencidas, agrupadas por conta e mês."""
+    with engine.begin() as conn:
+        rows = conn.execute(text("""
+            SELECT origem_conta, mes_referencia, uc
+            FROM raw_lumi
+            WHERE coalesce(upper(status_pagamento), '') NOT IN :fechados
+               OR vencimento >= current_date
+        """), {"fechados": STATUS_FECHADOS}).fetchall()
 
-            except Exception as e: 
+    abertas = defaultdict(lambda: defaultdict(set))
+    for conta, mes, uc in rows:
+        abertas[conta][str(mes)[:7]].add(str(uc))
+    return abertas
+
+def executar_sync_lumi_abertas():
+    aplicar_migracoes(engine)
+    garantir_particoes(engine)
+    print("🚀 Iniciando Sincronização Lumi (faturas em aberto)...", flush=True)
+
+    abertas = carregar_faturas_abertas()
+    total = sum(len(ucs) for meses in abertas.values() for ucs in meses.values())
+    print(f"📋 {total} faturas em aberto em {sum(len(m) for m in abertas.values())} meses.", flush=True)
+    if not total: return
+
+    execucao_id = nova_execucao("lumi")
+    falhas = 0
+    for conta in contas_lumi():
+        meses = abertas.get(conta["nome"])
+        if not meses: continue
+        headers = logar_conta(conta)
+        if not headers:
+            if conta["email"] and conta["senha"]: falhas += 1
+            continue
+
+        for mes in sorted(meses):
+            ucs = meses[mes]
+            ano, m = map(int, mes.split("-"))
+            inicio = f"{mes}-01"
+            fim = (datetime(ano + m // 12, m % 12 + 1, 1) - timedelta(days=1)).strftime("%Y-%m-%d")
+            print(f"    📅 {conta['nome']} - {mes}: {len(ucs)} faturas em aberto...", flush=True)
+
+            try:
+                lista = baixar_periodo(headers, inicio, fim)
+                # Só regrava as faturas do conjunto quente; as fechadas ficam para a varredura completa
+                lista = [item for item in lista if str(item.get("uc", "")).strip() in ucs]
+                if salvar_em_lotes(lista, conta["nome"], execucao_id) is None: falhas += 1
+            except Exception as e:
                 print(f"    ❌ Erro na requisição: {e}", flush=True)
+                falhas += 1
 
-    print("\n🔄 Atualizando View Materializada...", flush=True)
-    try:
-        with engine.begin() as conn:
-            conn.execute(text("REFRESH MATERIALIZED VIEW analytics_materializada;"))
-        print("✅ Tudo pronto!", flush=True)
-    except Exception as e:
-        print(f"❌ Erro na View: {e}", flush=True)
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, "lumi")
+    return not falhas
+
+# =====================================================
+# MODO FILA: períodos de cada conta como unidades compartilhadas entre runners
+# =====================================================
+def executar_sync_lumi_fila(rodada=None, paralelismo=None):
+    from .fila import LimitadorCompartilhado, executar_trabalhador, publicar_unidades, rodada_padrao
+
+    aplicar_migracoes(engine)
+    garantir_particoes(engine)
+    rodada = rodada or rodada_padrao()
+    execucao_id = nova_execucao("lumi")
+    contas = {conta["nome"]: conta for conta in contas_lumi() if conta["email"] and conta["senha"]}
+    logins, lock_logins = {}, threading.Lock()
+    limitador = LimitadorCompartilhado(LUMI_REQ_POR_SEGUNDO())
+
+    # Mesmo planejamento da execução normal (só meses em aberto + verificação), uma unidade por período.
+    # Períodos mais recentes primeiro; verificações por último.
+    unidades = []
+    for nome, conta in contas.items():
+        logins[nome] = logar_conta(conta)
+        if not logins[nome]: continue
+        for periodo in planejar_periodos(nome, descobrir_inicio(nome, logins[nome])):
+            atraso = 0 if not periodo["verificacao"] else 1000
+            ano, m = map(int, periodo["fim"].split("-"))
+            prioridade = atraso + (datetime.now().year * 12 + datetime.now().month) - (ano * 12 + m)
+            unidades.append((f"{nome}:{periodo['inicio']}:{periodo['fim']}", {"conta": nome, **periodo}, prioridade))
+    novas = publicar_unidades(engine, "lumi", rodada, unidades)
+    print(f"🚀 Sync Lumi em modo fila (rodada {rodada}): {novas} períodos novos na fila.", flush=True)
+
+    def processar(unidade, parametros, parar):
+        nome = parametros["conta"]
+        with lock_logins:
+            # Um login por conta neste runner, reaproveitado pelas unidades seguintes
+            if nome not in logins: logins[nome] = logar_conta(contas[nome])
+        headers = logins[nome]
+        if not headers: raise RuntimeError(f"Sem login na conta {nome}")
+        limitador.aguardar()
+        if parar.is_set(): return False
+        # Falha de gravação vira erro: a fila conta a tentativa e devolve o período para outro runner
+        if not sincronizar_periodo(nome, headers, parametros, execucao_id):
+            raise RuntimeError(f"Falha ao gravar o período {unidade}")
+        return True
 
-if __name__ == "__main__":
-    executar_sync_lumi()
\ No newline at end of file
+    executar_trabalhador(engine, "lumi", rodada, processar, limitador, paralelismo or LUMI_PARALELISMO(),
+                         time.time() + 50 * 60)
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, "lumi")
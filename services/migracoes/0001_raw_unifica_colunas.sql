@@ -0,0 +1,14 @@
+-- Colunas adicionadas ao raw_unifica ao longo do tempo (antes criadas a cada execução
+-- por verificar_e_criar_colunas). Um único ALTER TABLE = um único lock na tabela.
+ALTER TABLE raw_unifica
+    ADD COLUMN IF NOT EXISTS remuneracao_geracao numeric DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS consumo_kwh numeric DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS energia_compensada numeric DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS economia_total numeric DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS codigo_barras text,
+    ADD COLUMN IF NOT EXISTS codigo_pix text,
+    ADD COLUMN IF NOT EXISTS data_emissao_concessionaria date,
+    ADD COLUMN IF NOT EXISTS vencimento_concessionaria date,
+    ADD COLUMN IF NOT EXISTS data_emissao date,
+    ADD COLUMN IF NOT EXISTS kwh_balance_credits numeric DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS uc_aneel text;
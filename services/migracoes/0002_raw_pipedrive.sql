@@ -0,0 +1,17 @@
+-- Tabela do Pipedrive (antes criada a cada execução por verificar_e_criar_tabela)
+CREATE TABLE IF NOT EXISTS raw_pipedrive (
+    deal_id BIGINT PRIMARY KEY,
+    uc TEXT,
+    uc_aneel TEXT,
+    nome_funil TEXT,
+    organizacao TEXT,
+    pessoa_contato TEXT,
+    telefone TEXT,
+    mwh_mes NUMERIC DEFAULT 0,
+    concessionaria TEXT,
+    quem_indicou TEXT,
+    nome_quem_indicou TEXT,
+    parceiro_unidade TEXT,
+    parceiro_nome TEXT,
+    updated_at TIMESTAMP
+);
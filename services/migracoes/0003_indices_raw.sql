@@ -0,0 +1,5 @@
+-- Índices de apoio às consultas por mês (views, tabelão) e por UC (joins com o CRM)
+CREATE INDEX IF NOT EXISTS idx_raw_unifica_mes_referencia ON raw_unifica (mes_referencia);
+CREATE INDEX IF NOT EXISTS idx_raw_lumi_mes_referencia ON raw_lumi (mes_referencia);
+CREATE INDEX IF NOT EXISTS idx_raw_rd_station_uc ON raw_rd_station (uc);
+CREATE INDEX IF NOT EXISTS idx_raw_pipedrive_uc ON raw_pipedrive (uc);
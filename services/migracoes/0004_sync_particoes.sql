@@ -0,0 +1,10 @@
+-- Registro de frescor por partição (ex.: mês de date_ref da Unifica) e checkpoint da varredura
+CREATE TABLE IF NOT EXISTS sync_particoes (
+    fonte TEXT NOT NULL,
+    particao TEXT NOT NULL,
+    proxima_pagina INTEGER NOT NULL DEFAULT 1,
+    registros INTEGER NOT NULL DEFAULT 0,
+    ultima_tentativa TIMESTAMPTZ,
+    ultima_sync_completa TIMESTAMPTZ,
+    PRIMARY KEY (fonte, particao)
+);
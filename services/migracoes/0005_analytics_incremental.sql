@@ -0,0 +1,24 @@
+-- Camada analítica incremental: mesma consulta da analytics_materializada, recalculada só
+-- para as chaves (uc, mes_referencia) que os conectores marcarem como alteradas.
+DO $$
+BEGIN
+    EXECUTE 'CREATE OR REPLACE VIEW analytics_base AS '
+        || rtrim(pg_get_viewdef('analytics_materializada'::regclass, true), ';');
+END $$;
+
+CREATE TABLE IF NOT EXISTS analytics_incremental AS
+    SELECT * FROM analytics_base WITH NO DATA;
+ALTER TABLE analytics_incremental ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_analytics_incremental_chave ON analytics_incremental (uc, mes_referencia);
+
+-- Carga inicial completa; daqui em diante só as pendências são recalculadas
+INSERT INTO analytics_incremental SELECT b.*, now() FROM analytics_base b;
+
+-- Chaves alteradas pelos conectores. mes_referencia NULL = todos os meses da UC (ex.: mudança no CRM)
+CREATE TABLE IF NOT EXISTS analytics_pendencias (
+    id BIGSERIAL PRIMARY KEY,
+    uc TEXT NOT NULL,
+    mes_referencia DATE,
+    fonte TEXT,
+    marcado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
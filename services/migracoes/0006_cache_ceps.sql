@@ -0,0 +1,13 @@
+-- Cache de geolocalização de CEPs (antes alimentado pelo popula_ceps.mjs)
+CREATE TABLE IF NOT EXISTS cache_ceps (
+    cep TEXT PRIMARY KEY,
+    latitude NUMERIC,
+    longitude NUMERIC,
+    cidade TEXT,
+    uf TEXT
+);
+
+-- Cache negativo: CEPs inexistentes não são consultados de novo a cada execução
+ALTER TABLE cache_ceps
+    ADD COLUMN IF NOT EXISTS invalido BOOLEAN NOT NULL DEFAULT false,
+    ADD COLUMN IF NOT EXISTS consultado_em TIMESTAMPTZ NOT NULL DEFAULT now();
@@ -0,0 +1,24 @@
+-- Feed de alterações (append-only) gravado pelos conectores durante o upsert.
+-- transacao (xid8) permite ler em ordem de commit: o cursor avança por (transacao, id)
+-- e só até a transação mais antiga ainda em andamento, então nenhuma linha fica para trás.
+CREATE TABLE IF NOT EXISTS log_alteracoes (
+    id BIGSERIAL PRIMARY KEY,
+    transacao XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    execucao_id TEXT NOT NULL,
+    fonte TEXT NOT NULL,
+    tabela TEXT NOT NULL,
+    operacao TEXT NOT NULL,
+    chave JSONB NOT NULL,
+    alteracoes JSONB NOT NULL,
+    registrado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_log_alteracoes_ordem ON log_alteracoes (transacao, id);
+CREATE INDEX IF NOT EXISTS idx_log_alteracoes_execucao ON log_alteracoes (execucao_id);
+
+-- Posição de leitura de cada consumidor (dashboards, notificações, comissões...)
+CREATE TABLE IF NOT EXISTS log_alteracoes_cursores (
+    consumidor TEXT PRIMARY KEY,
+    ultima_transacao XID8 NOT NULL DEFAULT '0',
+    ultimo_id BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,5 @@
+-- Conferência de cada partição: meta.total da API x linhas recebidas e gravadas
+ALTER TABLE sync_particoes
+    ADD COLUMN IF NOT EXISTS total_api INTEGER,
+    ADD COLUMN IF NOT EXISTS total_banco INTEGER,
+    ADD COLUMN IF NOT EXISTS verificada BOOLEAN;
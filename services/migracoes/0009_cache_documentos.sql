@@ -0,0 +1,20 @@
+-- Cache dos PDFs (faturas da Unifica e boletos da Lumi) baixados pelo pré-carregador.
+-- O conteúdo é endereçado pelo sha256: documentos iguais apontam para o mesmo arquivo.
+CREATE TABLE IF NOT EXISTS cache_documentos (
+    origem TEXT NOT NULL,            -- 'unifica' (file_key) ou 'lumi_boleto' (drive_id)
+    chave TEXT NOT NULL,
+    uc TEXT,
+    mes_referencia DATE,
+    status TEXT NOT NULL,            -- 'ok', 'indisponivel' (upstream não tem o arquivo) ou 'erro'
+    sha256 TEXT,
+    tamanho BIGINT,
+    armazenamento TEXT,              -- 'local' ou 'supabase'
+    local TEXT,                      -- caminho relativo dentro da pasta/bucket
+    erro TEXT,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (origem, chave)
+);
+
+CREATE INDEX IF NOT EXISTS idx_cache_documentos_uc_mes ON cache_documentos (uc, mes_referencia);
+CREATE INDEX IF NOT EXISTS idx_cache_documentos_sha256 ON cache_documentos (sha256);
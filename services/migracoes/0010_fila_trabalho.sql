@@ -0,0 +1,29 @@
+-- Fila de trabalho compartilhada entre execuções simultâneas (vários runners ou cron +
+-- workflow_dispatch). Cada unidade (mês de date_ref, conta/período da Lumi...) é reivindicada
+-- com FOR UPDATE SKIP LOCKED e fica reservada enquanto o dono renovar a concessão (lease).
+CREATE TABLE IF NOT EXISTS fila_trabalho (
+    fonte TEXT NOT NULL,
+    rodada TEXT NOT NULL,
+    unidade TEXT NOT NULL,
+    parametros JSONB NOT NULL DEFAULT '{}'::jsonb,
+    prioridade INTEGER NOT NULL DEFAULT 0,
+    estado TEXT NOT NULL DEFAULT 'pendente' CHECK (estado IN ('pendente', 'em_andamento', 'concluida', 'falhou')),
+    dono TEXT,
+    concessao_ate TIMESTAMPTZ,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    erro TEXT,
+    criada_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    concluida_em TIMESTAMPTZ,
+    PRIMARY KEY (fonte, rodada, unidade)
+);
+CREATE INDEX IF NOT EXISTS idx_fila_trabalho_disponiveis
+    ON fila_trabalho (fonte, rodada, prioridade, unidade) WHERE estado IN ('pendente', 'em_andamento');
+
+-- Trabalhadores vivos por fonte: o orçamento de requisições/s da fonte é dividido entre eles
+CREATE TABLE IF NOT EXISTS fila_trabalhadores (
+    dono TEXT PRIMARY KEY,
+    fonte TEXT NOT NULL,
+    rodada TEXT NOT NULL,
+    iniciado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    batimento_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,6 @@
+-- Períodos fechados (todas as faturas pagas/canceladas e sem mudança por N execuções) saem da
+-- sincronização de rotina e só voltam a ser consultados pela verificação periódica
+ALTER TABLE sync_particoes
+    ADD COLUMN IF NOT EXISTS execucoes_estaveis INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS congelada_em TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS ultima_verificacao TIMESTAMPTZ;
@@ -0,0 +1,12 @@
+-- Histórico das tarefas disparadas pelo planejador: duração (custo) e alterações encontradas
+-- (taxa de mudança) de cada execução, usados para decidir o que roda na próxima chamada
+CREATE TABLE IF NOT EXISTS planejador_execucoes (
+    id BIGSERIAL PRIMARY KEY,
+    tarefa TEXT NOT NULL,
+    iniciada_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    terminada_em TIMESTAMPTZ,
+    alteracoes INTEGER,
+    sucesso BOOLEAN,
+    erro TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_planejador_execucoes_tarefa ON planejador_execucoes (tarefa, iniciada_em DESC);
@@ -0,0 +1,8 @@
+-- Marca d'água das fontes sincronizadas por data de alteração (ex.: update_time do Pipedrive)
+-- e data da última varredura completa, que continua existindo só como verificação
+CREATE TABLE IF NOT EXISTS sync_marcas (
+    fonte TEXT PRIMARY KEY,
+    marca TIMESTAMPTZ,
+    ultima_varredura TIMESTAMPTZ,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,9 @@
+-- Negócios do Pipedrive em aberto e perdidos. O raw_pipedrive continua só com os ganhos,
+-- que é o que o analytics cruza por UC; um negócio que muda de status troca de tabela.
+CREATE TABLE IF NOT EXISTS raw_pipedrive_outros (
+    LIKE raw_pipedrive INCLUDING DEFAULTS,
+    status TEXT NOT NULL,
+    PRIMARY KEY (deal_id)
+);
+CREATE INDEX IF NOT EXISTS idx_raw_pipedrive_outros_uc ON raw_pipedrive_outros (uc);
+CREATE INDEX IF NOT EXISTS idx_raw_pipedrive_outros_status ON raw_pipedrive_outros (status);
@@ -0,0 +1,15 @@
+-- Previsão da próxima fatura de cada UC ativa (leitura, emissão, kWh e valor), calculada em lote
+-- depois das sincronizações e recalculada só para as UCs cujas entradas mudaram
+CREATE TABLE IF NOT EXISTS previsoes_faturamento (
+    uc TEXT PRIMARY KEY,
+    concessionaria TEXT,
+    mes_previsto DATE,
+    data_leitura_prevista DATE,
+    data_emissao_prevista DATE,
+    consumo_previsto_kwh NUMERIC,
+    tarifa_estimada NUMERIC,
+    valor_previsto NUMERIC,
+    meses_historico INTEGER NOT NULL DEFAULT 0,
+    calculado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_previsoes_faturamento_emissao ON previsoes_faturamento (data_emissao_prevista);
@@ -0,0 +1,15 @@
+-- Assinatura de cada página baixada na execução anterior (sha256 do corpo, ETag, Last-Modified),
+-- por fonte e partição. Página idêntica à anterior não é decodificada nem regravada; meta guarda o
+-- que o conector precisa dela sem o corpo (paginação, total, ids vistos).
+CREATE TABLE IF NOT EXISTS paginas_digest (
+    fonte TEXT NOT NULL,
+    particao TEXT NOT NULL,
+    pagina INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    meta JSONB NOT NULL DEFAULT '{}'::jsonb,
+    itens INTEGER NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (fonte, particao, pagina)
+);
@@ -0,0 +1,12 @@
+-- Extratos mensais de comissão por parceiro/indicador: assinatura das linhas usadas na última
+-- geração, para só regerar o extrato de quem teve faturas ou regras alteradas
+CREATE TABLE IF NOT EXISTS extratos_comissao (
+    mes_referencia DATE NOT NULL,
+    beneficiario TEXT NOT NULL,
+    sha256_entradas TEXT NOT NULL,
+    arquivo TEXT NOT NULL,
+    linhas INTEGER NOT NULL DEFAULT 0,
+    total_comissao NUMERIC,
+    gerado_em TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (mes_referencia, beneficiario)
+);
@@ -0,0 +1,7 @@
+-- Desempate único para a paginação por chave da API: (uc, mes_referencia) pode se repetir na
+-- analytics_incremental, então o cursor passa a ser (uc, mes_referencia, id_linha)
+ALTER TABLE analytics_incremental ADD COLUMN IF NOT EXISTS id_linha BIGSERIAL;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_analytics_incremental_cursor
+    ON analytics_incremental (uc, mes_referencia, id_linha);
+-- O índice novo cobre as mesmas buscas por (uc, mes_referencia)
+DROP INDEX IF EXISTS idx_analytics_incremental_chave;
@@ -0,0 +1,3 @@
+-- Início do ciclo de varredura completa em andamento. A varredura pode levar várias execuções
+-- (checkpoint por partição); quando a última partição termina, a marca d'água vira este instante
+ALTER TABLE sync_marcas ADD COLUMN IF NOT EXISTS inicio_varredura TIMESTAMPTZ;
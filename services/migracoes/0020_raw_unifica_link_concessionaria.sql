@@ -0,0 +1,3 @@
+-- file_key da fatura da concessionária. link_fatura prefere o boleto (billing_file_key), então a
+-- fatura da distribuidora precisa de coluna própria para ser pré-carregada e servida do cache
+ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS link_fatura_concessionaria text;
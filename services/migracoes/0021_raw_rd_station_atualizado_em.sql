@@ -0,0 +1,4 @@
+-- Instante em que a linha foi gravada aqui. updated_at é a data do próprio RD (só o dia), então
+-- não serve de marca d'água para quem copia a tabela (réplica local)
+ALTER TABLE raw_rd_station ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS idx_raw_rd_station_atualizado_em ON raw_rd_station (atualizado_em);
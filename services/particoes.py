@@ -0,0 +1,330 @@
+import re
+from datetime import date
+from sqlalchemy import text
+
+# Particionamento declarativo de raw_unifica e raw_lumi por mes_referencia (uma partição por mês,
+# mais uma partição padrão para meses que ainda não têm a sua). Upserts, recálculos do analytics e
+# exportações que filtram por mês só tocam as partições envolvidas, e o vacuum dos meses antigos
+# deixa de ser necessário: eles não mudam mais.
+#
+# A conversão de uma tabela existente é feita online (python -m services particoes --migrar):
+# a cópia roda mês a mês enquanto os conectores continuam gravando na tabela antiga, com um
+# trigger espelhando as alterações; só a troca de nomes no final segura o lock exclusivo.
+
+TABELAS_PARTICIONADAS = ("raw_unifica", "raw_lumi")
+COLUNA_PARTICAO = "mes_referencia"
+CHAVE_PRIMARIA = ("uc", "mes_referencia")
+MESES_A_FRENTE = 3
+MESES_VACUUM = 3
+
+def _somar_meses(mes, n):
+    total = mes.year * 12 + mes.month - 1 + n
+    return date(total // 12, total % 12 + 1, 1)
+
+def _mes_atual():
+    hoje = date.today()
+    return date(hoje.year, hoje.month, 1)
+
+def nome_particao(tabela, mes):
+    return f"{tabela}_{mes:%Y_%m}"
+
+def esta_particionada(conn, tabela):
+    return conn.execute(text("""
+        SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:tabela)
+    """), {"tabela": tabela}).scalar() is True
+
+def listar_particoes(conn, tabela):
+    """Meses que já têm partição própria (a partição padrão fica de fora)."""
+    nomes = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:tabela)
+    """), {"tabela": tabela}).scalars()
+    meses = set()
+    for nome in nomes:
+        m = re.match(rf"^{tabela}_(\d{{4}})_(\d{{2}})$", nome)
+        if m: meses.add(date(int(m.group(1)), int(m.group(2)), 1))
+    return meses
+
+def criar_particao(conn, tabela, mes, pai=None):
+    """
+    Cria a partição do mês. pai é a tabela particionada quando ela ainda tem nome provisório
+    (durante a migração); o nome da partição já usa o nome definitivo.
+    """
+    pai = pai or tabela
+    nome = nome_particao(tabela, mes)
+    padrao = f"{tabela}_padrao"
+    limites = {"inicio": mes, "fim": _somar_meses(mes, 1)}
+    faixa = f"FROM ('{mes:%Y-%m-%d}') TO ('{limites['fim']:%Y-%m-%d}')"
+
+    tem_linhas = conn.execute(text(f"""
+        SELECT EXISTS (
+            SELECT 1 FROM {padrao} WHERE {COLUNA_PARTICAO} >= :inicio AND {COLUNA_PARTICAO} < :fim
+        )
+    """), limites).scalar()
+    if not tem_linhas:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {nome} PARTITION OF {pai} FOR VALUES {faixa}"))
+        return
+
+    # O mês já tem linhas na partição padrão (ex.: fatura de um mês antigo): move para a partição nova.
+    # A padrão fica travada até o ATTACH: uma gravação do mês entre a cópia e o ATTACH ficaria nela
+    # e faria o ATTACH falhar (ou se perderia, se fosse um DELETE/UPDATE de linha já movida)
+    conn.execute(text("SET LOCAL lock_timeout = '30s'"))
+    conn.execute(text(f"LOCK TABLE {padrao} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"CREATE TABLE {nome} (LIKE {pai} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(f"""
+        WITH movidas AS (
+            DELETE FROM {padrao} WHERE {COLUNA_PARTICAO} >= :inicio AND {COLUNA_PARTICAO} < :fim
+            RETURNING *
+        )
+        INSERT INTO {nome} SELECT * FROM movidas
+    """), limites)
+    conn.execute(text(f"ALTER TABLE {pai} ATTACH PARTITION {nome} FOR VALUES {faixa}"))
+    print(f"    📦 {nome}: linhas movidas da partição padrão.", flush=True)
+
+def garantir_particoes(engine, meses_a_frente=MESES_A_FRENTE):
+    """Cria com antecedência as partições dos próximos meses (e as de meses que caíram na padrão)."""
+    criadas = 0
+    for tabela in TABELAS_PARTICIONADAS:
+        with engine.begin() as conn:
+            if not esta_particionada(conn, tabela): continue
+            existentes = listar_particoes(conn, tabela)
+            atual = _mes_atual()
+            necessarias = {_somar_meses(atual, n) for n in range(meses_a_frente + 1)}
+            necessarias |= set(conn.execute(text(f"""
+                SELECT DISTINCT date_trunc('month', {COLUNA_PARTICAO})::date FROM {tabela}_padrao
+            """)).scalars())
+            for mes in sorted(necessarias - existentes):
+                criar_particao(conn, tabela, mes)
+                criadas += 1
+    if criadas:
+        print(f"✅ {criadas} partições mensais criadas.", flush=True)
+    return criadas
+
+def vacuum_recentes(engine, meses=MESES_VACUUM):
+    """VACUUM ANALYZE só nas partições dos meses que ainda recebem alterações."""
+    atual = _mes_atual()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for tabela in TABELAS_PARTICIONADAS:
+            if not esta_particionada(conn, tabela): continue
+            for n in range(-meses + 1, 1):
+                nome = nome_particao(tabela, _somar_meses(atual, n))
+                if conn.execute(text("SELECT to_regclass(:nome)"), {"nome": nome}).scalar() is None: continue
+                conn.execute(text(f"VACUUM (ANALYZE) {nome}"))
+                print(f"    🧹 VACUUM ANALYZE {nome}", flush=True)
+
+# --- MIGRAÇÃO ONLINE DE UMA TABELA EXISTENTE ---
+
+def _colunas(conn, tabela):
+    return list(conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = :tabela AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """), {"tabela": tabela}).scalars())
+
+def _indices_secundarios(conn, tabela):
+    """(nome, definição) dos índices que não são a chave primária."""
+    return conn.execute(text("""
+        SELECT i.indexname, i.indexdef FROM pg_indexes i
+        WHERE i.schemaname = 'public' AND i.tablename = :tabela
+          AND i.indexname NOT IN (
+              SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:tabela) AND contype = 'p'
+          )
+    """), {"tabela": tabela}).all()
+
+def _nome_pk(conn, tabela):
+    return conn.execute(text("""
+        SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:tabela) AND contype = 'p'
+    """), {"tabela": tabela}).scalar()
+
+def _dependentes(conn, tabela):
+    """Views e views materializadas que dependem da tabela, da mais próxima para a mais distante."""
+    return conn.execute(text("""
+        WITH RECURSIVE dep(oid, nivel) AS (
+            SELECT DISTINCT r.ev_class, 1
+            FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = to_regclass(:tabela)
+              AND r.ev_class <> d.refobjid
+          UNION ALL
+            SELECT r.ev_class, dep.nivel + 1
+            FROM dep JOIN pg_depend d ON d.refobjid = dep.oid
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::regclass AND r.ev_class <> dep.oid
+        )
+        SELECT c.oid, format('%I.%I', n.nspname, c.relname) AS nome, c.relkind, c.reloptions,
+               pg_get_viewdef(c.oid) AS definicao, max(dep.nivel) AS nivel
+        FROM dep JOIN pg_class c ON c.oid = dep.oid JOIN pg_namespace n ON n.oid = c.relnamespace
+        GROUP BY c.oid, n.nspname, c.relname, c.relkind, c.reloptions
+        ORDER BY nivel
+    """), {"tabela": tabela}).mappings().all()
+
+def _permissoes(conn, oid):
+    return conn.execute(text("""
+        SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(r.rolname) END AS papel,
+               a.privilege_type
+        FROM pg_class c
+        CROSS JOIN LATERAL aclexplode(c.relacl) a
+        LEFT JOIN pg_roles r ON r.oid = a.grantee
+        WHERE c.oid = :oid
+    """), {"oid": oid}).all()
+
+def _regravar_permissoes(conn, nome, permissoes):
+    for papel, privilegio in permissoes:
+        conn.execute(text(f"GRANT {privilegio} ON {nome} TO {papel}"))
+
+def _copiar_seguranca(conn, origem, destino):
+    """RLS, políticas e GRANTs da tabela antiga (o Supabase expõe as tabelas por essas regras)."""
+    rls, forcar = conn.execute(text("""
+        SELECT relrowsecurity, relforcerowsecurity FROM pg_class WHERE oid = to_regclass(:tabela)
+    """), {"tabela": origem}).one()
+    if rls: conn.execute(text(f"ALTER TABLE {destino} ENABLE ROW LEVEL SECURITY"))
+    if forcar: conn.execute(text(f"ALTER TABLE {destino} FORCE ROW LEVEL SECURITY"))
+
+    politicas = conn.execute(text("""
+        SELECT policyname, permissive, roles::text[] AS roles, cmd, qual, with_check
+        FROM pg_policies WHERE schemaname = 'public' AND tablename = :tabela
+    """), {"tabela": origem}).mappings().all()
+    for p in politicas:
+        papeis = ", ".join("PUBLIC" if papel == "public" else f'"{papel}"' for papel in p["roles"])
+        sql = f'CREATE POLICY "{p["policyname"]}" ON {destino} AS {p["permissive"]} FOR {p["cmd"]} TO {papeis}'
+        if p["qual"]: sql += f" USING ({p['qual']})"
+        if p["with_check"]: sql += f" WITH CHECK ({p['with_check']})"
+        conn.exec_driver_sql(sql)
+
+    _regravar_permissoes(conn, destino, _permissoes(conn, conn.execute(
+        text("SELECT to_regclass(:tabela)::oid"), {"tabela": origem}).scalar()))
+
+def _preparar_copia(engine, tabela, nova, meses_a_frente):
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT to_regclass(:nova)"), {"nova": nova}).scalar() is None:
+            conn.execute(text(f"""
+                CREATE TABLE {nova} (LIKE {tabela} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)
+                PARTITION BY RANGE ({COLUNA_PARTICAO})
+            """))
+            conn.execute(text(f"ALTER TABLE {nova} ADD PRIMARY KEY ({', '.join(CHAVE_PRIMARIA)})"))
+            conn.execute(text(f"CREATE TABLE {tabela}_padrao PARTITION OF {nova} DEFAULT"))
+
+        for nome, definicao in _indices_secundarios(conn, tabela):
+            if "UNIQUE" in definicao and COLUNA_PARTICAO not in definicao:
+                print(f"    ⚠️ Índice único {nome} não inclui {COLUNA_PARTICAO} e não pode ser particionado. Ignorado.")
+                continue
+            conn.execute(text(re.sub(
+                rf"INDEX {re.escape(nome)} ON (ONLY )?(public\.)?{tabela} ",
+                f"INDEX IF NOT EXISTS {nome}_p ON {nova} ", definicao
+            )))
+
+        primeiro = conn.execute(text(f"SELECT min({COLUNA_PARTICAO}) FROM {tabela}")).scalar() or _mes_atual()
+        mes, ultimo = date(primeiro.year, primeiro.month, 1), _somar_meses(_mes_atual(), meses_a_frente)
+        existentes = listar_particoes(conn, nova)
+        while mes <= ultimo:
+            if mes not in existentes: criar_particao(conn, tabela, mes, pai=nova)
+            mes = _somar_meses(mes, 1)
+
+        # A partir daqui toda alteração na tabela antiga também vai para a nova
+        colunas = _colunas(conn, tabela)
+        lista = ", ".join(colunas)
+        valores = ", ".join(f"NEW.{c}" for c in colunas)
+        atualizacao = ", ".join(f"{c} = EXCLUDED.{c}" for c in colunas if c not in CHAVE_PRIMARIA)
+        chave_antiga = " AND ".join(f"{c} = OLD.{c}" for c in CHAVE_PRIMARIA)
+        conn.exec_driver_sql(f"""
+            CREATE OR REPLACE FUNCTION {tabela}_espelhar() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {nova} WHERE {chave_antiga};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {nova} ({lista}) VALUES ({valores})
+                    ON CONFLICT ({', '.join(CHAVE_PRIMARIA)}) DO UPDATE SET {atualizacao};
+                END IF;
+                RETURN NULL;
+            END $$;
+        """)
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {tabela}_espelhar ON {tabela}"))
+        conn.execute(text(f"""
+            CREATE TRIGGER {tabela}_espelhar AFTER INSERT OR UPDATE OR DELETE ON {tabela}
+            FOR EACH ROW EXECUTE FUNCTION {tabela}_espelhar()
+        """))
+        return sorted(listar_particoes(conn, nova)), colunas
+
+def _trocar_tabelas(engine, tabela, nova):
+    antiga = f"{tabela}_antiga"
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL lock_timeout = '30s'"))
+        conn.execute(text(f"LOCK TABLE {tabela} IN ACCESS EXCLUSIVE MODE"))
+
+        # Linhas removidas enquanto a cópia rodava (a cópia pode ter trazido uma versão antiga delas)
+        juncao = " AND ".join(f"t.{c} = n.{c}" for c in CHAVE_PRIMARIA)
+        conn.execute(text(f"DELETE FROM {nova} n WHERE NOT EXISTS (SELECT 1 FROM {tabela} t WHERE {juncao})"))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {tabela}_espelhar ON {tabela}"))
+        conn.execute(text(f"DROP FUNCTION IF EXISTS {tabela}_espelhar()"))
+
+        # Views apontam para a tabela pelo OID: precisam ser recriadas sobre a tabela nova
+        dependentes = []
+        for dep in _dependentes(conn, tabela):
+            indices = []
+            if dep["relkind"] == "m":
+                indices = list(conn.execute(text("""
+                    SELECT indexdef FROM pg_indexes WHERE format('%I.%I', schemaname, tablename) = :nome
+                """), {"nome": dep["nome"]}).scalars())
+            dependentes.append((dep, indices, _permissoes(conn, dep["oid"])))
+        for dep, _, _ in dependentes:
+            tipo = "MATERIALIZED VIEW" if dep["relkind"] == "m" else "VIEW"
+            conn.execute(text(f"DROP {tipo} IF EXISTS {dep['nome']} CASCADE"))
+
+        indices = [nome for nome, _ in _indices_secundarios(conn, tabela)]
+        pk_antiga, pk_nova = _nome_pk(conn, tabela), _nome_pk(conn, nova)
+        conn.execute(text(f"ALTER TABLE {tabela} RENAME TO {antiga}"))
+        if pk_antiga: conn.execute(text(f"ALTER TABLE {antiga} RENAME CONSTRAINT {pk_antiga} TO {antiga}_pkey"))
+        for nome in indices:
+            conn.execute(text(f"ALTER INDEX IF EXISTS {nome} RENAME TO {nome}_antigo"))
+            conn.execute(text(f"ALTER INDEX IF EXISTS {nome}_p RENAME TO {nome}"))
+        conn.execute(text(f"ALTER TABLE {nova} RENAME TO {tabela}"))
+        conn.execute(text(f"ALTER TABLE {tabela} RENAME CONSTRAINT {pk_nova} TO {tabela}_pkey"))
+        _copiar_seguranca(conn, antiga, tabela)
+
+        for dep, indices_dep, permissoes in dependentes:
+            opcoes = f" WITH ({', '.join(dep['reloptions'])})" if dep["reloptions"] else ""
+            tipo = "MATERIALIZED VIEW" if dep["relkind"] == "m" else "VIEW"
+            conn.exec_driver_sql(f"CREATE {tipo} {dep['nome']}{opcoes} AS {dep['definicao']}")
+            for definicao in indices_dep: conn.exec_driver_sql(definicao)
+            _regravar_permissoes(conn, dep["nome"], permissoes)
+        print(f"    🔁 {len(dependentes)} views recriadas sobre a tabela particionada.", flush=True)
+
+def migrar_para_particionada(engine, tabela, meses_a_frente=MESES_A_FRENTE):
+    with engine.begin() as conn:
+        if esta_particionada(conn, tabela):
+            print(f"✅ {tabela} já é particionada.")
+            return False
+
+    nova = f"{tabela}_part"
+    print(f"🧱 Particionando {tabela} por {COLUNA_PARTICAO}...", flush=True)
+    meses, colunas = _preparar_copia(engine, tabela, nova, meses_a_frente)
+    lista = ", ".join(colunas)
+
+    # Cópia mês a mês, cada uma na sua transação: os conectores continuam gravando normalmente
+    for mes in meses:
+        with engine.begin() as conn:
+            copiadas = conn.execute(text(f"""
+                INSERT INTO {nova} ({lista})
+                SELECT {lista} FROM {tabela}
+                WHERE {COLUNA_PARTICAO} >= :inicio AND {COLUNA_PARTICAO} < :fim
+                ON CONFLICT DO NOTHING
+            """), {"inicio": mes, "fim": _somar_meses(mes, 1)}).rowcount
+        if copiadas: print(f"    📄 {nome_particao(tabela, mes)}: {copiadas} linhas", flush=True)
+    # Meses além das partições criadas (vencimentos futuros etc.) vão para a partição padrão
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            INSERT INTO {nova} ({lista})
+            SELECT {lista} FROM {tabela} WHERE {COLUNA_PARTICAO} >= :fim
+            ON CONFLICT DO NOTHING
+        """), {"fim": _somar_meses(meses[-1], 1)})
+
+    _trocar_tabelas(engine, tabela, nova)
+    print(f"✅ {tabela} particionada. A versão anterior ficou em {tabela}_antiga (pode ser removida após conferência).")
+    return True
+
+def manter_particoes(engine, migrar=False, meses_a_frente=MESES_A_FRENTE):
+    if migrar:
+        for tabela in TABELAS_PARTICIONADAS:
+            migrar_para_particionada(engine, tabela, meses_a_frente)
+    garantir_particoes(engine, meses_a_frente)
+    vacuum_recentes(engine)
@@ -1,56 +1,56 @@
-import os
 import requests
 import time
-from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
-
-# Carrega as variáveis do seu arquivo .env
-load_dotenv()
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from .config import Ajuste, cfg, engine, exigir
+from .esquema import aplicar_migracoes
+from .alteracoes import filtrar_alterados, nova_execucao, registrar_alteracoes, registrar_remocoes
+from .analytics_service import marcar_alteradas, manter_analytics
+from .sinais import sinalizar_fim_carga
+from .pipeline import executar_pipeline
+from .concorrencia import LimitadorTaxa
 
 # ===== 1. CONFIGURAÇÕES =====
-API_KEY_PIPE = os.getenv("PIPEDRIVE_TOKEN")
-COMPANY_DOMAIN = os.getenv("PIPEDRIVE_DOMAIN", "vivaenergia")
-BASE_URL = f"https://{COMPANY_DOMAIN}.pipedrive.com/api/v1/"
-DB_URL = os.getenv("DATABASE_URL")
-
-if not API_KEY_PIPE or not DB_URL:
-    print("🛑 ERRO: Verifique as variáveis PIPEDRIVE_TOKEN e DATABASE_URL no .env")
-    exit()
-
-# Engine com timeout de conexão para o Supabase
-engine = create_engine(
-    DB_URL, 
-    pool_pre_ping=True,
-    connect_args={'connect_timeout': 30}
-)
-
-def verificar_e_criar_tabela():
-    print("🛠️ Verificando estrutura da tabela raw_pipedrive...")
-    sql = """
-    CREATE TABLE IF NOT EXISTS raw_pipedrive (
-        deal_id BIGINT PRIMARY KEY,
-        uc TEXT,
-        uc_aneel TEXT,
-        nome_funil TEXT,
-        organizacao TEXT,
-        pessoa_contato TEXT,
-        telefone TEXT,
-        mwh_mes NUMERIC DEFAULT 0,
-        concessionaria TEXT,
-        quem_indicou TEXT,
-        nome_quem_indicou TEXT,
-        parceiro_unidade TEXT,
-        parceiro_nome TEXT,
-        updated_at TIMESTAMP
-    );
-    """
-    with engine.begin() as conn:
-        try:
-            conn.execute(text(sql))
-        except Exception as e:
-            print(f"⚠️ Aviso ao criar/verificar tabela: {e}")
-    print("✅ Estrutura da tabela validada no Supabase.")
+def base_url():
+    return f"https://{cfg('PIPEDRIVE_DOMAIN', 'vivaenergia')}.pipedrive.com/api/v1/"
+
+# Incremental pelo update_time; a varredura completa fica só como verificação periódica
+PIPEDRIVE_DIAS_ENTRE_VARREDURAS = Ajuste("PIPEDRIVE_DIAS_ENTRE_VARREDURAS", "7", int)
+# Recuo da marca d'água a cada execução (alterações gravadas no mesmo segundo da marca)
+PIPEDRIVE_SOBREPOSICAO = timedelta(minutes=10)
+# Varredura completa particionada por etapa do funil e status, em paralelo
+PIPEDRIVE_PARALELISMO = Ajuste("PIPEDRIVE_PARALELISMO", "4", int)
+PIPEDRIVE_REQ_POR_SEGUNDO = Ajuste("PIPEDRIVE_REQ_POR_SEGUNDO", "4", float)
+STATUS_PIPEDRIVE = ("won", "open", "lost")
+LIMITE_PAGINA = 500
+FONTE = "pipedrive"
+
+CHAVE_PIPEDRIVE = {"deal_id": "bigint"}
+COLUNAS_PIPEDRIVE = [
+    "uc", "uc_aneel", "nome_funil", "organizacao", "pessoa_contato", "telefone", "mwh_mes",
+    "concessionaria", "quem_indicou", "nome_quem_indicou", "parceiro_unidade", "parceiro_nome"
+]
+# Ganhos em raw_pipedrive; em aberto e perdidos em raw_pipedrive_outros (com o status)
+TABELAS_PIPEDRIVE = {
+    "raw_pipedrive": COLUNAS_PIPEDRIVE,
+    "raw_pipedrive_outros": COLUNAS_PIPEDRIVE + ["status"],
+}
+# Coluna do banco -> nome do campo customizado no Pipedrive
+CAMPOS_CUSTOMIZADOS = {
+    "uc": "UC - Unidade Consumidora",
+    "uc_aneel": "UC-ANEEL",
+    "telefone": "Telefone",
+    "mwh_mes": "MWh/Mês",
+    "concessionaria": "Concessionária",
+    "quem_indicou": "Quem Indicou",
+    "nome_quem_indicou": "Nome de Quem Indicou",
+    "parceiro_unidade": "Parceiros - Unidade de Quem Indicou",
+    "parceiro_nome": "Parceiros - Nome de Quem Indicou",
+}
+
+def tabela_do_status(status):
+    return "raw_pipedrive" if status == "won" else "raw_pipedrive_outros"
 
 def limpar_numero(val):
     if val is None or val == "": return 0.0
@@ -62,10 +62,15 @@ def limpar_numero(val):
 def get_json(endpoint, params=None):
     if params is None:
         params = {}
-    params['api_token'] = API_KEY_PIPE
+    params['api_token'] = exigir("PIPEDRIVE_TOKEN")
     
-    url = f"{BASE_URL}{endpoint}"
-    response = requests.get(url, params=params)
+    url = f"{base_url()}{endpoint}"
+    for tentativa in range(5):
+        response = requests.get(url, params=params, timeout=60)
+        if response.status_code != 429: break
+        # Limite de requisições do Pipedrive: espera e tenta de novo
+        print(f"⏳ Rate Limit (429) em {endpoint}. Aguardando {5 * (tentativa + 1)}s...", flush=True)
+        time.sleep(5 * (tentativa + 1))
     
     if response.status_code == 200:
         return response.json()
@@ -73,157 +78,317 @@ def get_json(endpoint, params=None):
         print(f"❌ Erro na API Pipedrive ({endpoint}): {response.status_code} - {response.text}")
         response.raise_for_status()
 
-def salvar_em_lotes(lista_itens):
+def salvar_em_lotes(lista_itens, tabela, execucao_id):
     if not lista_itens: return
+    colunas = TABELAS_PIPEDRIVE[tabela]
     
     with engine.begin() as conn:
-        for item in lista_itens:
-            stmt = text("""
-                INSERT INTO raw_pipedrive (
-                    deal_id, uc, uc_aneel, nome_funil, organizacao, pessoa_contato, telefone,
-                    mwh_mes, concessionaria, quem_indicou, nome_quem_indicou,
-                    parceiro_unidade, parceiro_nome, updated_at
-                ) VALUES (
-                    :deal_id, :uc, :uc_aneel, :nome_funil, :organizacao, :pessoa_contato, :telefone,
-                    :mwh_mes, :concessionaria, :quem_indicou, :nome_quem_indicou,
-                    :parceiro_unidade, :parceiro_nome, :updated_at
-                ) ON CONFLICT (deal_id) DO UPDATE SET
-                    uc = EXCLUDED.uc,
-                    uc_aneel = EXCLUDED.uc_aneel,
-                    nome_funil = EXCLUDED.nome_funil,
-                    organizacao = EXCLUDED.organizacao,
-                    pessoa_contato = EXCLUDED.pessoa_contato,
-                    telefone = EXCLUDED.telefone,
-                    mwh_mes = EXCLUDED.mwh_mes,
-                    concessionaria = EXCLUDED.concessionaria,
-                    quem_indicou = EXCLUDED.quem_indicou,
-                    nome_quem_indicou = EXCLUDED.nome_quem_indicou,
-                    parceiro_unidade = EXCLUDED.parceiro_unidade,
-                    parceiro_nome = EXCLUDED.parceiro_nome,
-                    updated_at = EXCLUDED.updated_at;
+        # Só regrava os negócios que mudaram desde a última carga
+        alterados = filtrar_alterados(conn, tabela, CHAVE_PIPEDRIVE, colunas, lista_itens)
+        if alterados:
+            todas = ["deal_id"] + colunas + ["updated_at"]
+            stmt = text(f"""
+                INSERT INTO {tabela} ({", ".join(todas)})
+                VALUES ({", ".join(f":{c}" for c in todas)})
+                ON CONFLICT (deal_id) DO UPDATE SET
+                    {", ".join(f"{c} = EXCLUDED.{c}" for c in todas[1:])};
             """)
-            conn.execute(stmt, item)
-    print(f"✅ Salvo lote de {len(lista_itens)} registros no Supabase.", flush=True)
+            conn.execute(stmt, [item for item, _ in alterados])
+            if tabela == "raw_pipedrive":
+                chaves = [(item["uc"], None) for item, _ in alterados]
+                chaves += [(dif["uc"][0], None) for _, dif in alterados if "uc" in dif]
+                marcar_alteradas(conn, chaves, FONTE)
+            registrar_alteracoes(conn, execucao_id, FONTE, tabela, CHAVE_PIPEDRIVE, alterados)
+    print(f"✅ Salvo lote ({tabela}): {len(alterados)} de {len(lista_itens)} registros alterados no Supabase.", flush=True)
+
+def gravar_por_status(registros, execucao_id):
+    """Grava cada negócio na tabela do seu status e tira da outra, se ele mudou de status."""
+    for tabela in TABELAS_PIPEDRIVE:
+        lote = [r for r in registros if tabela_do_status(r["status"]) == tabela]
+        if not lote: continue
+        salvar_em_lotes(lote, tabela, execucao_id)
+        outra = next(t for t in TABELAS_PIPEDRIVE if t != tabela)
+        remover_negocios([r["deal_id"] for r in lote], outra, execucao_id)
+
+# ===== 2. PLANO DE EXTRAÇÃO =====
+def _valor_opcao(val, opcoes):
+    if val is None or opcoes is None: return val
+    if isinstance(val, list):
+        return ", ".join([opcoes.get(str(v), str(v)) for v in val])
+    return opcoes.get(str(val), str(val))
+
+def compilar_extrator():
+    """
+    Resolve uma vez por execução o hash e as opções de cada campo customizado (dealFields) e o
+    nome de cada funil; devolve extrair(deal) -> registro, que só faz leituras diretas no deal.
+    """
+    campos = {}
+    for field in get_json("dealFields").get("data", []):
+        options = field.get("options")
+        opcoes = {str(opt.get("id")): opt.get("label") for opt in options} \
+            if options and isinstance(options, list) else None
+        campos[field.get("name")] = (field.get("key"), opcoes)
+    plano = [(coluna, *campos[nome]) for coluna, nome in CAMPOS_CUSTOMIZADOS.items() if nome in campos]
+    ausentes = [nome for nome in CAMPOS_CUSTOMIZADOS.values() if nome not in campos]
+    if ausentes: print(f"⚠️ Campos não encontrados no Pipedrive: {', '.join(ausentes)}", flush=True)
+    funis = {str(p.get("id")): p.get("name") for p in (get_json("pipelines").get("data") or [])}
+
+    def extrair(deal):
+        registro = dict.fromkeys(CAMPOS_CUSTOMIZADOS)
+        for coluna, chave, opcoes in plano:
+            registro[coluna] = _valor_opcao(deal.get(chave), opcoes)
+
+        # Telefone do campo customizado ou, na falta, do contato
+        person = deal.get("person_id")
+        if not registro["telefone"] and isinstance(person, dict) and person.get("phone"):
+            telefones = person["phone"]
+            if len(telefones) > 0 and isinstance(telefones[0], dict):
+                registro["telefone"] = telefones[0].get("value")
+
+        org = deal.get("org_id")
+        registro.update({
+            "deal_id": deal.get("id"),
+            "status": deal.get("status"),
+            "nome_funil": funis.get(str(deal.get("pipeline_id"))),
+            "organizacao": org.get("name") if isinstance(org, dict) else deal.get("org_name"),
+            "pessoa_contato": person.get("name") if isinstance(person, dict) else deal.get("person_name"),
+            "mwh_mes": limpar_numero(registro["mwh_mes"]),
+            "updated_at": datetime.now()
+        })
+        return registro
+    return extrair
+
+def remover_negocios(ids, tabela, execucao_id):
+    """Tira da tabela negócios excluídos no Pipedrive ou que mudaram de status (e foram para a outra)."""
+    if not ids: return 0
+    with engine.begin() as conn:
+        removidos = conn.execute(text(f"""
+            DELETE FROM {tabela} WHERE deal_id = ANY(:ids) RETURNING deal_id, uc
+        """), {"ids": list(ids)}).fetchall()
+        if removidos:
+            if tabela == "raw_pipedrive":
+                marcar_alteradas(conn, [(row.uc, None) for row in removidos if row.uc], FONTE)
+            registrar_remocoes(conn, execucao_id, FONTE, tabela, [{"deal_id": row.deal_id} for row in removidos])
+    if removidos: print(f"🗑️ {len(removidos)} negócios saíram de {tabela}.", flush=True)
+    return len(removidos)
+
+# ===== 3. MARCA D'ÁGUA =====
+def ler_marca():
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            SELECT marca, ultima_varredura, inicio_varredura FROM sync_marcas WHERE fonte = 'pipedrive'
+        """)).first()
+
+def salvar_marca(marca, varredura=False):
+    """varredura=True: a marca vem de um ciclo de varredura completa, que fica encerrado."""
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO sync_marcas (fonte, marca, ultima_varredura, atualizado_em)
+            VALUES ('pipedrive', :marca, CASE WHEN :varredura THEN now() END, now())
+            ON CONFLICT (fonte) DO UPDATE SET
+                marca = coalesce(EXCLUDED.marca, sync_marcas.marca),
+                ultima_varredura = coalesce(EXCLUDED.ultima_varredura, sync_marcas.ultima_varredura),
+                inicio_varredura = CASE WHEN :varredura THEN NULL ELSE sync_marcas.inicio_varredura END,
+                atualizado_em = now();
+        """), {"marca": marca, "varredura": varredura})
+
+def iniciar_ciclo_varredura():
+    """Abre um ciclo de varredura: todas as partições do início e o instante guardado como futura marca."""
+    with engine.begin() as conn:
+        inicio = conn.execute(text("SELECT now()")).scalar()
+        conn.execute(text("UPDATE sync_particoes SET proxima_pagina = 1 WHERE fonte = :fonte"), {"fonte": FONTE})
+        conn.execute(text("""
+            INSERT INTO sync_marcas (fonte, inicio_varredura, atualizado_em)
+            VALUES (:fonte, :inicio, now())
+            ON CONFLICT (fonte) DO UPDATE SET inicio_varredura = EXCLUDED.inicio_varredura, atualizado_em = now();
+        """), {"fonte": FONTE, "inicio": inicio})
+    return inicio
+
+def update_time(deal):
+    # update_time do Pipedrive vem em UTC, "AAAA-MM-DD HH:MM:SS"
+    valor = deal.get("update_time")
+    if not valor: return None
+    return datetime.strptime(valor, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+# ===== 4. VARREDURA COMPLETA (verificação), particionada por etapa e status =====
+def listar_particoes():
+    """Uma partição por (etapa do funil, status): cada uma é uma listagem independente de deals."""
+    etapas = get_json("stages").get("data") or []
+    return [(f"{etapa['pipeline_id']}/{etapa['id']}/{status}", etapa["id"], status)
+            for etapa in etapas for status in STATUS_PIPEDRIVE]
 
-def importar_dados_pipedrive():
+def salvar_checkpoint(particao, proxima_pagina, registros=0, concluida=False):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO sync_particoes (fonte, particao, proxima_pagina, registros, ultima_tentativa, ultima_sync_completa)
+            VALUES (:fonte, :particao, :pag, :reg, now(), CASE WHEN :concluida THEN now() END)
+            ON CONFLICT (fonte, particao) DO UPDATE SET
+                proxima_pagina = EXCLUDED.proxima_pagina,
+                registros = CASE WHEN :concluida THEN EXCLUDED.registros ELSE sync_particoes.registros END,
+                ultima_tentativa = EXCLUDED.ultima_tentativa,
+                ultima_sync_completa = coalesce(EXCLUDED.ultima_sync_completa, sync_particoes.ultima_sync_completa);
+        """), {"fonte": FONTE, "particao": particao, "pag": 1 if concluida else proxima_pagina,
+               "reg": registros, "concluida": concluida})
+
+def sincronizar_particao(particao, etapa, status, pagina_inicial, extrair, limitador, prazo, vistos, execucao_id):
+    """Lê uma partição a partir do checkpoint (páginas de LIMITE_PAGINA). Retorna (concluida, registros)."""
+    estado = {"concluida": False, "total": 0}
+
+    def paginas():
+        start = (pagina_inicial - 1) * LIMITE_PAGINA
+        while not (prazo and time.time() > prazo):
+            # Orçamento de requisições compartilhado entre as partições
+            limitador.aguardar()
+            page_response = get_json("deals", {
+                "status": status, "stage_id": etapa, "user_id": 0, "limit": LIMITE_PAGINA, "start": start
+            })
+            pagination = (page_response.get("additional_data") or {}).get("pagination") or {}
+            fim = not pagination.get("more_items_in_collection")
+            yield {"pagina": start // LIMITE_PAGINA + 1, "deals": page_response.get("data") or [], "fim": fim}
+            if fim: return
+            start = pagination.get("next_start")
+
+    def gravar(registros, pagina):
+        gravar_por_status(registros, execucao_id)
+        vistos.update(r["deal_id"] for r in registros)
+        estado["total"] += len(registros)
+        if pagina["fim"]:
+            salvar_checkpoint(particao, 1, (pagina_inicial - 1) * LIMITE_PAGINA + estado["total"], concluida=True)
+            estado["concluida"] = True
+        else:
+            salvar_checkpoint(particao, pagina["pagina"] + 1)
+
+    # Download da próxima página durante a gravação
+    executar_pipeline(paginas(), lambda pagina: [extrair(deal) for deal in pagina["deals"]], gravar)
+    return estado["concluida"], estado["total"]
+
+def varredura_completa(extrair, execucao_id):
+    # O ciclo pode atravessar várias execuções: a marca é o início da primeira delas, então o que
+    # mudou nas partições já lidas enquanto as outras esperavam é pego pelo incremental
+    estado = ler_marca()
+    inicio = estado.inicio_varredura if estado and estado.inicio_varredura else iniciar_ciclo_varredura()
+    prazo = time.time() + 50 * 60  # Mesmo orçamento dos outros conectores no GitHub Actions
+    particoes = listar_particoes()
+    with engine.begin() as conn:
+        linhas = conn.execute(text("""
+            SELECT particao, proxima_pagina, ultima_sync_completa >= :inicio AS lida FROM sync_particoes WHERE fonte = :fonte
+        """), {"fonte": FONTE, "inicio": inicio}).all()
+    checkpoints = {row.particao: row.proxima_pagina for row in linhas}
+    # Partições já lidas neste ciclo (numa execução anterior) não são lidas de novo
+    ja_lidas = {row.particao for row in linhas if row.lida}
+    a_ler = [particao for particao in particoes if particao[0] not in ja_lidas]
+    print(f"🧩 {len(particoes)} partições (etapa x status), {len(particoes) - len(a_ler)} já lidas neste ciclo; "
+          f"{PIPEDRIVE_PARALELISMO()} em paralelo.", flush=True)
+
+    limitador = LimitadorTaxa(PIPEDRIVE_REQ_POR_SEGUNDO())
+    vistos, resultados = set(), {}
+
+    def sync(particao):
+        nome, etapa, status = particao
+        pagina_inicial = checkpoints.get(nome, 1)
+        try:
+            concluida, total = sincronizar_particao(nome, etapa, status, pagina_inicial, extrair, limitador, prazo, vistos, execucao_id)
+            resultados[nome] = (concluida and pagina_inicial == 1, total)
+        except Exception as e:
+            print(f"\n❌ Erro na partição {nome}: {e}", flush=True)
+            resultados[nome] = (False, 0)
+
+    with ThreadPoolExecutor(max_workers=PIPEDRIVE_PARALELISMO()) as pool:
+        list(pool.map(sync, a_ler))
+
+    with engine.begin() as conn:
+        concluidas = {row[0] for row in conn.execute(text("""
+            SELECT particao FROM sync_particoes WHERE fonte = :fonte AND ultima_sync_completa >= :inicio
+        """), {"fonte": FONTE, "inicio": inicio})}
+    pendentes = [nome for nome, _, _ in particoes if nome not in concluidas]
+    if pendentes:
+        print(f"🕒 {len(pendentes)} partições ainda não foram lidas neste ciclo (iniciado em {inicio:%d/%m %H:%M}); "
+              "continuam do checkpoint na próxima execução.", flush=True)
+        return sum(total for _, total in resultados.values())
+
+    # Só uma varredura lida inteira nesta execução enxerga todos os negócios: aí o que está no
+    # banco e não apareceu foi excluído no Pipedrive (ou está numa etapa que não existe mais)
+    if not ja_lidas and all(completa for completa, _ in resultados.values()):
+        for tabela in TABELAS_PIPEDRIVE:
+            with engine.begin() as conn:
+                no_banco = {row[0] for row in conn.execute(text(f"SELECT deal_id FROM {tabela}"))}
+            if vistos: remover_negocios(no_banco - vistos, tabela, execucao_id)
+    else:
+        print("🧹 Ciclo concluído em mais de uma execução: a verificação de removidos fica para uma "
+              "varredura lida numa execução só (o incremental já trata os excluídos).", flush=True)
+    salvar_marca(inicio, varredura=True)
+    return sum(total for _, total in resultados.values())
+
+# ===== 5. INCREMENTAL (só o que mudou desde a marca) =====
+def buscar_negocio(deal_id, limitador):
+    limitador.aguardar()
+    try:
+        return get_json(f"deals/{deal_id}").get("data")
+    except requests.HTTPError as e:
+        # Negócio excluído de vez
+        if e.response is not None and e.response.status_code in (404, 410): return None
+        raise
+
+def sincronizacao_incremental(marca, extrair, execucao_id):
+    desde = (marca - PIPEDRIVE_SOBREPOSICAO).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    print(f"🔎 Negócios alterados desde {desde} (UTC)...", flush=True)
+    start, alterados_ids, nova_marca = 0, set(), marca
+    while True:
+        page_response = get_json("recents", {"since_timestamp": desde, "items": "deal", "start": start, "limit": LIMITE_PAGINA})
+        for item in page_response.get("data") or []:
+            deal = item.get("data") or {}
+            if item.get("item") == "deal" and item.get("id"): alterados_ids.add(item["id"])
+            atualizado = update_time(deal)
+            if atualizado and atualizado > nova_marca: nova_marca = atualizado
+        pagination = (page_response.get("additional_data") or {}).get("pagination") or {}
+        if not pagination.get("more_items_in_collection"): break
+        start = pagination.get("next_start")
+
+    # O recents traz o negócio resumido (sem telefone do contato etc.): relê cada um por inteiro,
+    # que é o mesmo formato da varredura, para a comparação com o banco não acusar diferenças falsas
+    ids = sorted(alterados_ids)
+    limitador = LimitadorTaxa(PIPEDRIVE_REQ_POR_SEGUNDO())
+    with ThreadPoolExecutor(max_workers=PIPEDRIVE_PARALELISMO()) as pool:
+        deals = list(pool.map(lambda deal_id: buscar_negocio(deal_id, limitador), ids))
+
+    registros, excluidos = [], set()
+    for deal_id, deal in zip(ids, deals):
+        if not deal or deal.get("deleted") or deal.get("status") not in STATUS_PIPEDRIVE:
+            excluidos.add(deal_id)
+        else:
+            registros.append(extrair(deal))
+    for i in range(0, len(registros), LIMITE_PAGINA):
+        gravar_por_status(registros[i:i + LIMITE_PAGINA], execucao_id)
+    for tabela in TABELAS_PIPEDRIVE:
+        remover_negocios(excluidos, tabela, execucao_id)
+    salvar_marca(nova_marca)
+    return len(alterados_ids)
+
+def importar_dados_pipedrive(completa=False):
     try:
-        verificar_e_criar_tabela()
+        aplicar_migracoes(engine)
         print("🚀 Iniciando extração do Pipedrive...")
 
-        # 1. Busca os campos (DealFields) para mapear Hashes e Opções
-        deal_fields_response = get_json("dealFields")
-        deal_fields_data = deal_fields_response.get("data", [])
-
-        name_to_key_map = {}
-        key_to_options_map = {}
-
-        for field in deal_fields_data:
-            field_name = field.get("name")
-            field_key = field.get("key")
-            name_to_key_map[field_name] = field_key
-            
-            options = field.get("options")
-            if options and isinstance(options, list):
-                key_to_options_map[field_key] = {
-                    str(opt.get("id")): opt.get("label") for opt in options
-                }
-
-        def get_custom_value(deal, field_name):
-            key = name_to_key_map.get(field_name)
-            if not key: return None
-            
-            val = deal.get(key)
-            if val is None: return None
-
-            options_map = key_to_options_map.get(key)
-            if options_map:
-                if isinstance(val, list):
-                    return ", ".join([options_map.get(str(v), str(v)) for v in val])
-                else:
-                    return options_map.get(str(val), str(val))
-            return val
-
-        # 2. Busca os Negócios e vai salvando em Lotes
-        start = 0
-        has_more_pages = True
-        total_baixado = 0
-
-        while has_more_pages:
-            params = {
-                "status": "won",
-                "limit": 500,
-                "user_id": 0,
-                "start": start
-            }
-            page_response = get_json("deals", params)
-
-            if page_response and page_response.get("success") and page_response.get("data"):
-                deals_da_pagina = page_response["data"]
-                
-                # Captura os funis
-                related_pipelines = {}
-                related = page_response.get("related_objects", {})
-                if "pipeline" in related:
-                    related_pipelines = related["pipeline"]
-
-                lote_para_banco = []
-
-                for deal in deals_da_pagina:
-                    # Pega o telefone do campo customizado ou do contato
-                    tel = get_custom_value(deal, "Telefone")
-                    if not tel:
-                        person = deal.get("person_id")
-                        if isinstance(person, dict) and person.get("phone"):
-                            telefones = person["phone"]
-                            if len(telefones) > 0 and isinstance(telefones[0], dict):
-                                tel = telefones[0].get("value")
-
-                    pipeline_id = str(deal.get("pipeline_id"))
-                    pipeline_name = related_pipelines.get(pipeline_id, {}).get("name") if pipeline_id in related_pipelines else None
-
-                    org = deal.get("org_id")
-                    org_name = org.get("name") if isinstance(org, dict) else None
-                    
-                    person = deal.get("person_id")
-                    person_name = person.get("name") if isinstance(person, dict) else None
-
-                    # Monta o objeto pra inserir no banco
-                    lote_para_banco.append({
-                        "deal_id": deal.get("id"),
-                        "uc": get_custom_value(deal, "UC - Unidade Consumidora"),
-                        "uc_aneel": get_custom_value(deal, "UC-ANEEL"),
-                        "nome_funil": pipeline_name,
-                        "organizacao": org_name,
-                        "pessoa_contato": person_name,
-                        "telefone": tel,
-                        "mwh_mes": limpar_numero(get_custom_value(deal, "MWh/Mês")),
-                        "concessionaria": get_custom_value(deal, "Concessionária"),
-                        "quem_indicou": get_custom_value(deal, "Quem Indicou"),
-                        "nome_quem_indicou": get_custom_value(deal, "Nome de Quem Indicou"),
-                        "parceiro_unidade": get_custom_value(deal, "Parceiros - Unidade de Quem Indicou"),
-                        "parceiro_nome": get_custom_value(deal, "Parceiros - Nome de Quem Indicou"),
-                        "updated_at": datetime.now()
-                    })
-
-                # Manda pro banco assim que monta a página
-                salvar_em_lotes(lote_para_banco)
-                total_baixado += len(lote_para_banco)
-
-                # Verifica se tem mais páginas
-                pagination = page_response.get("additional_data", {}).get("pagination", {})
-                if pagination.get("more_items_in_collection"):
-                    start = pagination.get("next_start")
-                    print(f"🔄 Indo para a próxima página... (start: {start})")
-                    time.sleep(0.5) # Respiro para a API
-                else:
-                    has_more_pages = False
-            else:
-                has_more_pages = False
-
-        print(f"🎉 Extração finalizada! Total de {total_baixado} negócios atualizados no Supabase.")
+        extrair = compilar_extrator()
+        # Identifica esta execução no feed de alterações (log_alteracoes)
+        execucao_id = nova_execucao(FONTE)
+
+        estado = ler_marca()
+        limite_varredura = datetime.now(timezone.utc) - timedelta(days=PIPEDRIVE_DIAS_ENTRE_VARREDURAS())
+        # Um ciclo de varredura começado em outra execução continua até a última partição
+        if completa or not estado or not estado.marca or not estado.ultima_varredura \
+                or estado.inicio_varredura or estado.ultima_varredura < limite_varredura:
+            print("🧹 Varredura completa dos negócios (verificação)...", flush=True)
+            total = varredura_completa(extrair, execucao_id)
+            print(f"🎉 Extração finalizada! {total} negócios conferidos.")
+        else:
+            total = sincronizacao_incremental(estado.marca, extrair, execucao_id)
+            print(f"🎉 Extração incremental finalizada! {total} negócios alterados conferidos.")
+
+        manter_analytics(engine)
+        sinalizar_fim_carga(engine, FONTE)
+        return True
 
     except Exception as e:
         print(f"❌ Erro na execução: {e}")
-
-if __name__ == "__main__":
-    importar_dados_pipedrive()
\ No newline at end of file
+        return False
@@ -0,0 +1,80 @@
+import queue
+import threading
+
+# Pipeline de três estágios (baixar -> normalizar -> gravar) com filas limitadas entre eles.
+# Enquanto a página N é gravada, a N+1 já está sendo baixada; quando o banco fica para trás,
+# as filas enchem e o download espera (backpressure). A gravação é feita por uma única thread,
+# na ordem das páginas, então checkpoints e erros continuam sequenciais.
+
+_FIM = object()
+
+class _Falha:
+    def __init__(self, erro):
+        self.erro = erro
+
+def executar_pipeline(paginas, normalizar, gravar, tamanho_fila=4):
+    """
+    paginas: iterável (ex.: gerador) que baixa e produz os payloads em ordem.
+    normalizar(payload) -> lote pronto para o banco.
+    gravar(lote, payload) -> chamado em ordem, uma página por vez (é onde ficam upsert e checkpoint).
+    Retorna o número de páginas gravadas. Erros de qualquer estágio param o pipeline e são
+    relançados aqui, depois de todas as páginas anteriores terem sido gravadas.
+    """
+    baixadas = queue.Queue(maxsize=tamanho_fila)
+    normalizadas = queue.Queue(maxsize=tamanho_fila)
+    parar = threading.Event()
+
+    def colocar(fila, item):
+        # put com timeout para não travar para sempre se o estágio seguinte já parou
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def estagio_baixar():
+        try:
+            for payload in paginas:
+                if not colocar(baixadas, payload): return
+        except Exception as e:
+            colocar(baixadas, _Falha(e))
+            return
+        colocar(baixadas, _FIM)
+
+    def estagio_normalizar():
+        while True:
+            try:
+                payload = baixadas.get(timeout=0.5)
+            except queue.Empty:
+                if parar.is_set(): return
+                continue
+            if payload is _FIM or isinstance(payload, _Falha):
+                colocar(normalizadas, payload)
+                return
+            try:
+                item = (normalizar(payload), payload)
+            except Exception as e:
+                item = _Falha(e)
+            if not colocar(normalizadas, item) or isinstance(item, _Falha): return
+
+    threads = [
+        threading.Thread(target=estagio_baixar, daemon=True),
+        threading.Thread(target=estagio_normalizar, daemon=True),
+    ]
+    for t in threads: t.start()
+
+    gravadas = 0
+    try:
+        while True:
+            item = normalizadas.get()
+            if item is _FIM: break
+            if isinstance(item, _Falha): raise item.erro
+            lote, payload = item
+            gravar(lote, payload)
+            gravadas += 1
+    finally:
+        parar.set()
+        for t in threads: t.join(timeout=5)
+    return gravadas
@@ -0,0 +1,215 @@
+import importlib
+import time
+from datetime import datetime, timezone
+from sqlalchemy import text
+from .config import Ajuste, engine
+from .esquema import aplicar_migracoes
+
+# Planejador de cadência: chamado de hora em hora, decide quais tarefas rodam agora a partir do
+# histórico de cada uma (planejador_execucoes): quanto ela costuma encontrar de alterações por
+# hora e quanto tempo leva. Dados voláteis recebem passadas leves frequentes; dados estáveis,
+# varreduras raras; tudo dentro do orçamento de minutos da chamada.
+# Os conectores tratam os próprios erros (imprimem e seguem); quando algo falhou eles devolvem
+# False, e a execução é registrada como malsucedida.
+
+PLANEJADOR_ORCAMENTO_MINUTOS = Ajuste("PLANEJADOR_ORCAMENTO_MINUTOS", "50", float)
+# Alterações esperadas a partir das quais vale a pena rodar antes do intervalo máximo
+PLANEJADOR_LIMIAR_ALTERACOES = Ajuste("PLANEJADOR_LIMIAR_ALTERACOES", "1", float)
+# Execuções passadas usadas para estimar taxa de mudança e custo
+HISTORICO_EXECUCOES = 10
+
+# Sincronizações: alterações contadas no log_alteracoes (fonte) ou por uma medição antes/depois.
+# intervalos em horas; custo em minutos até existir histórico.
+TAREFAS_SYNC = {
+    "lumi_abertas": {"funcao": ("lumi_service", "executar_sync_lumi_abertas"), "fonte": "lumi",
+                     "minimo": 1, "maximo": 6, "custo": 3},
+    "unifica_quentes": {"funcao": ("unifica_service", "executar_sync_unifica"), "kwargs": {"so_quentes": True},
+                        "fonte": "unifica", "minimo": 1, "maximo": 12, "custo": 10},
+    "rd": {"funcao": ("rd_service", "executar_sync_rd"), "fonte": "rd", "minimo": 2, "maximo": 24, "custo": 5},
+    "lumi": {"funcao": ("lumi_service", "executar_sync_lumi"), "fonte": "lumi", "minimo": 12, "maximo": 72, "custo": 10},
+    "unifica": {"funcao": ("unifica_service", "executar_sync_unifica"), "fonte": "unifica",
+                "minimo": 20, "maximo": 72, "custo": 50},
+    "pipedrive": {"funcao": ("pipedrive_service", "importar_dados_pipedrive"), "fonte": "pipedrive",
+                  "minimo": 2, "maximo": 24, "custo": 1},
+    "regras": {"funcao": ("rd_service", "executar_sync_regras"), "medir": "regras",
+               "minimo": 12, "maximo": 168, "custo": 1},
+}
+
+# Tarefas derivadas: rodam depois das sincronizações quando alguma das fontes mudou desde a
+# última vez delas (ou ao atingir o intervalo máximo)
+TAREFAS_DERIVADAS = {
+    "ceps": {"funcao": ("cep_service", "executar_sync_ceps"), "apos": ("rd",), "minimo": 6, "maximo": 168, "custo": 2},
+    "documentos": {"funcao": ("documentos_service", "executar_prefetch_documentos"), "apos": ("unifica", "lumi"),
+                   "minimo": 6, "maximo": 72, "custo": 10},
+    "particoes": {"funcao": ("particoes", "manter_particoes"), "args_engine": True, "apos": (),
+                  "minimo": 24, "maximo": 24, "custo": 2},
+    # Datas previstas vencem com o calendário: roda ao menos uma vez por dia
+    "previsoes": {"funcao": ("previsoes", "executar_previsoes"), "apos": ("unifica", "lumi", "rd"),
+                  "minimo": 1, "maximo": 24, "custo": 2},
+    "snapshots": {"funcao": ("snapshots", "gerar_snapshots"), "apos": ("unifica", "lumi", "rd", "pipedrive"),
+                  "minimo": 1, "maximo": 24, "custo": 2},
+}
+
+# --- HISTÓRICO ---
+
+def carregar_historico(conn, tarefas):
+    """{tarefa: [execuções bem-sucedidas, mais recente primeiro]}"""
+    rows = conn.execute(text("""
+        SELECT tarefa, iniciada_em, terminada_em, alteracoes FROM (
+            SELECT *, row_number() OVER (PARTITION BY tarefa ORDER BY iniciada_em DESC) AS n
+            FROM planejador_execucoes
+            WHERE tarefa = ANY(:tarefas) AND sucesso
+        ) h
+        WHERE n <= :limite
+        ORDER BY tarefa, iniciada_em DESC
+    """), {"tarefas": list(tarefas), "limite": HISTORICO_EXECUCOES + 1}).all()
+    historico = {tarefa: [] for tarefa in tarefas}
+    for row in rows:
+        historico[row.tarefa].append(row)
+    return historico
+
+def estimar(execucoes, config):
+    """(alterações por hora, minutos por execução) a partir do histórico; None sem dados suficientes."""
+    duracoes = [(e.terminada_em - e.iniciada_em).total_seconds() / 60 for e in execucoes[:HISTORICO_EXECUCOES]]
+    custo = sum(duracoes) / len(duracoes) if duracoes else config["custo"]
+    # Cada execução cobre o intervalo desde a anterior (limitado a 7 dias para não diluir a taxa)
+    alteracoes, horas = 0, 0.0
+    for atual, anterior in zip(execucoes, execucoes[1:]):
+        if atual.alteracoes is None: continue
+        alteracoes += atual.alteracoes
+        horas += min((atual.iniciada_em - anterior.iniciada_em).total_seconds() / 3600, 168)
+    return (alteracoes / horas if horas else None), max(custo, 0.1)
+
+def decidir(nome, config, execucoes, agora):
+    """Retorna (rodar, prioridade, motivo). Prioridade maior roda antes."""
+    if not execucoes:
+        return True, float("inf"), "sem histórico"
+    horas = (agora - execucoes[0].iniciada_em).total_seconds() / 3600
+    taxa, custo = estimar(execucoes, config)
+    if horas < config["minimo"]:
+        return False, 0, f"rodou há {horas:.1f}h (mínimo {config['minimo']}h)"
+    if horas >= config["maximo"]:
+        return True, 1e6 + horas, f"intervalo máximo ({horas:.0f}h sem rodar)"
+    if taxa is None:
+        return False, 0, f"aguardando histórico ({horas:.1f}h)"
+    esperadas = taxa * horas
+    motivo = f"{esperadas:.1f} alterações esperadas em {horas:.1f}h, ~{custo:.0f} min"
+    # Alterações esperadas por minuto de execução: o orçamento vai primeiro para o que rende mais
+    return esperadas >= PLANEJADOR_LIMIAR_ALTERACOES(), esperadas / custo, motivo
+
+# --- MEDIÇÃO DE ALTERAÇÕES ---
+
+def contar_alteracoes_log(fonte, inicio):
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            SELECT count(*) FROM log_alteracoes WHERE fonte = :fonte AND registrado_em >= :inicio
+        """), {"fonte": fonte, "inicio": inicio}).scalar()
+
+def assinatura_regras():
+    # Regras são regravadas inteiras (TRUNCATE + INSERT): compara o conteúdo antes e depois
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            SELECT (SELECT md5(coalesce(string_agg(r::text, '|' ORDER BY r::text), '')) FROM regras_comissao r)
+                || (SELECT md5(coalesce(string_agg(u::text, '|' ORDER BY u::text), '')) FROM regras_recorrencia_uc u)
+        """)).scalar()
+
+def houve_alteracoes_desde(fontes, desde):
+    if not fontes: return False
+    if desde is None: return True
+    with engine.begin() as conn:
+        return conn.execute(text("""
+            SELECT EXISTS (SELECT 1 FROM log_alteracoes WHERE fonte = ANY(:fontes) AND registrado_em > :desde)
+        """), {"fontes": list(fontes), "desde": desde}).scalar()
+
+# --- EXECUÇÃO ---
+
+def executar_tarefa(nome, config):
+    modulo, funcao = config["funcao"]
+    alvo = getattr(importlib.import_module(f".{modulo}", __package__), funcao)
+    args = (engine,) if config.get("args_engine") else ()
+
+    with engine.begin() as conn:
+        execucao_id = conn.execute(text("""
+            INSERT INTO planejador_execucoes (tarefa) VALUES (:tarefa) RETURNING id
+        """), {"tarefa": nome}).scalar()
+        inicio = conn.execute(text("SELECT now()")).scalar()
+
+    antes = assinatura_regras() if config.get("medir") == "regras" else None
+    sucesso, erro, alteracoes = True, None, None
+    try:
+        if alvo(*args, **config.get("kwargs", {})) is False:
+            raise RuntimeError("a tarefa terminou com erros (ver log da execução)")
+        if config.get("fonte"):
+            alteracoes = contar_alteracoes_log(config["fonte"], inicio)
+        elif config.get("medir") == "regras":
+            alteracoes = int(assinatura_regras() != antes)
+    except Exception as e:
+        sucesso, erro = False, str(e)[:500]
+        print(f"❌ Tarefa {nome} falhou: {e}", flush=True)
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE planejador_execucoes SET terminada_em = now(), alteracoes = :alteracoes, sucesso = :sucesso, erro = :erro
+            WHERE id = :id
+        """), {"id": execucao_id, "alteracoes": alteracoes, "sucesso": sucesso, "erro": erro})
+    return sucesso
+
+def planejar(tarefas, historico, agora):
+    plano = []
+    for nome, config in tarefas.items():
+        rodar, prioridade, motivo = decidir(nome, config, historico[nome], agora)
+        _, custo = estimar(historico[nome], config) if historico[nome] else (None, config["custo"])
+        plano.append({"tarefa": nome, "rodar": rodar, "prioridade": prioridade, "custo": custo, "motivo": motivo})
+    return sorted(plano, key=lambda p: -p["prioridade"])
+
+def imprimir_plano(plano, titulo):
+    print(f"\n🗓️ {titulo}")
+    for p in plano:
+        marca = "▶️" if p["rodar"] else "⏸️"
+        print(f"    {marca} {p['tarefa']:<16} {p['motivo']}")
+
+def executar_planejador(orcamento_minutos=None, simular=False, tarefas=None):
+    aplicar_migracoes(engine)
+    orcamento = orcamento_minutos or PLANEJADOR_ORCAMENTO_MINUTOS()
+    inicio = time.time()
+    agora = datetime.now(timezone.utc)
+
+    syncs = {n: c for n, c in TAREFAS_SYNC.items() if not tarefas or n in tarefas}
+    derivadas = {n: c for n, c in TAREFAS_DERIVADAS.items() if not tarefas or n in tarefas}
+    with engine.begin() as conn:
+        historico = carregar_historico(conn, list(syncs) + list(derivadas))
+
+    # 1. Sincronizações, pela relação alterações esperadas / custo, até o orçamento acabar
+    plano = planejar(syncs, historico, agora)
+    imprimir_plano(plano, f"Plano de sincronização (orçamento {orcamento:.0f} min)")
+    if simular: return plano
+
+    executadas = []
+    for item in plano:
+        if not item["rodar"]: continue
+        gasto = (time.time() - inicio) / 60
+        # A primeira tarefa sempre roda: uma varredura maior que o orçamento não pode ficar travada
+        if executadas and gasto + item["custo"] > orcamento:
+            print(f"    ⏭️ {item['tarefa']} fica para a próxima chamada (~{item['custo']:.0f} min, restam {orcamento - gasto:.0f}).")
+            continue
+        print(f"\n▶️ {item['tarefa']}: {item['motivo']}", flush=True)
+        executar_tarefa(item["tarefa"], syncs[item["tarefa"]])
+        executadas.append(item["tarefa"])
+
+    # 2. Derivadas: dependem do que as sincronizações (desta ou de outras chamadas) alteraram
+    agora = datetime.now(timezone.utc)
+    for nome, config in derivadas.items():
+        execucoes = historico[nome]
+        ultima = execucoes[0].iniciada_em if execucoes else None
+        horas = (agora - ultima).total_seconds() / 3600 if ultima else None
+        if horas is not None and horas < config["minimo"]: continue
+        vencida = horas is None or horas >= config["maximo"]
+        if not (vencida or houve_alteracoes_desde(config["apos"], ultima)): continue
+        if executadas and (time.time() - inicio) / 60 + config["custo"] > orcamento: continue
+        print(f"\n▶️ {nome}: {'intervalo máximo' if vencida else 'fontes alteradas desde a última execução'}", flush=True)
+        executar_tarefa(nome, config)
+        executadas.append(nome)
+
+    print(f"\n🏁 Planejador: {len(executadas)} tarefas em {(time.time() - inicio) / 60:.1f} min "
+          f"({', '.join(executadas) or 'nada a fazer'}).")
+    return executadas
@@ -0,0 +1,216 @@
+import time
+from datetime import date
+from sqlalchemy import text
+from .config import Ajuste, engine
+from .esquema import aplicar_migracoes
+from .alteracoes import ler_alteracoes, confirmar_leitura
+from .sinais import sinalizar_fim_carga
+
+# Previsão de faturamento: para cada UC ativa no RD, a próxima leitura e emissão, o kWh esperado
+# e o valor esperado da fatura, calculados a partir do histórico para todas as UCs de uma vez
+# (pandas) e guardados em previsoes_faturamento. Dashboards e exportações só leem a tabela.
+# O recálculo é incremental: UCs que apareceram no feed de alterações desde a última leitura,
+# UCs cujas datas previstas já passaram e UCs ativas ainda sem previsão.
+
+CONSUMIDOR = "previsoes"
+TABELAS_ENTRADA = ("raw_unifica", "raw_lumi", "raw_rd_station")
+# Meses de histórico usados na média de consumo e na tarifa
+PREVISAO_MESES_HISTORICO = Ajuste("PREVISAO_MESES_HISTORICO", "6", int)
+# Peso de cada mês em relação ao seguinte na média de consumo (mais recente pesa mais)
+PREVISAO_DECAIMENTO = Ajuste("PREVISAO_DECAIMENTO", "0.6", float)
+# Sem histórico de emissões: emissão prevista = leitura prevista + estes dias
+PREVISAO_DIAS_LEITURA_EMISSAO = Ajuste("PREVISAO_DIAS_LEITURA_EMISSAO", "3", int)
+LOTE_FEED = 5000
+LOTE_UCS = 5000
+
+# --- UCs A RECALCULAR ---
+
+def ucs_do_feed():
+    """UCs tocadas pelas tabelas de entrada desde a última leitura e a última entrada lida."""
+    ucs, negocios, ultima = set(), set(), None
+    while True:
+        entradas = ler_alteracoes(engine, CONSUMIDOR, TABELAS_ENTRADA, LOTE_FEED, apos=ultima)
+        if not entradas: break
+        for entrada in entradas:
+            if entrada["chave"].get("uc"): ucs.add(entrada["chave"]["uc"])
+            if entrada["chave"].get("id_negocio"): negocios.add(entrada["chave"]["id_negocio"])
+            # UC antiga de um registro que mudou de UC
+            antes_depois = (entrada["alteracoes"] or {}).get("uc")
+            if antes_depois: ucs.update(uc for uc in antes_depois if uc)
+        # O cursor só é confirmado depois que as previsões forem gravadas
+        ultima = entradas[-1]
+        if len(entradas) < LOTE_FEED: break
+    if negocios:
+        # O RD registra por negócio: a UC vem do próprio negócio
+        with engine.begin() as conn:
+            ucs.update(row[0] for row in conn.execute(text("""
+                SELECT uc FROM raw_rd_station WHERE id_negocio = ANY(:ids) AND uc IS NOT NULL
+            """), {"ids": list(negocios)}))
+    return ucs, ultima
+
+def ucs_vencidas(conn):
+    """Previsões com datas que já passaram ou de UCs não mais ativas, e UCs ativas ainda sem previsão."""
+    return {row[0] for row in conn.execute(text("""
+        SELECT uc FROM previsoes_faturamento p
+        WHERE data_leitura_prevista < current_date OR data_emissao_prevista < current_date
+           OR NOT EXISTS (SELECT 1 FROM raw_rd_station r WHERE r.uc = p.uc AND r.data_cancelamento IS NULL)
+        UNION
+        SELECT DISTINCT r.uc FROM raw_rd_station r
+        WHERE r.uc IS NOT NULL AND r.data_cancelamento IS NULL
+          AND NOT EXISTS (SELECT 1 FROM previsoes_faturamento p WHERE p.uc = r.uc)
+    """))}
+
+def ucs_ativas(conn):
+    return {row[0] for row in conn.execute(text("""
+        SELECT DISTINCT uc FROM raw_rd_station WHERE uc IS NOT NULL AND data_cancelamento IS NULL
+    """))}
+
+# --- CÁLCULO (vetorizado para todas as UCs do lote) ---
+
+def carregar_entradas(conn, ucs):
+    import pandas as pd
+    params = {"ucs": list(ucs), "meses": PREVISAO_MESES_HISTORICO()}
+    # Negócio mais recente de cada UC ativa
+    crm = pd.DataFrame(conn.execute(text("""
+        SELECT DISTINCT ON (uc) uc, concessionaria, dia_leitura, consumo_medio_mwh
+        FROM raw_rd_station
+        WHERE uc = ANY(:ucs) AND data_cancelamento IS NULL
+        ORDER BY uc, updated_at DESC NULLS LAST
+    """), params).mappings().all(), columns=["uc", "concessionaria", "dia_leitura", "consumo_medio_mwh"])
+    historico = pd.DataFrame(conn.execute(text("""
+        SELECT uc::text AS uc, mes_referencia::date AS mes_referencia, consumo_kwh, total_cobranca
+        FROM analytics_incremental
+        WHERE uc::text = ANY(:ucs) AND consumo_kwh > 0
+          AND mes_referencia::date >= (date_trunc('month', current_date) - make_interval(months => :meses + 1))::date
+    """), params).mappings().all(), columns=["uc", "mes_referencia", "consumo_kwh", "total_cobranca"])
+    emissoes = pd.DataFrame(conn.execute(text("""
+        SELECT uc, data_emissao::date AS data_emissao FROM raw_unifica
+        WHERE uc = ANY(:ucs) AND data_emissao IS NOT NULL
+          AND mes_referencia >= (date_trunc('month', current_date) - make_interval(months => :meses + 1))::date
+        UNION ALL
+        SELECT uc, data_emissao::date FROM raw_lumi
+        WHERE uc = ANY(:ucs) AND data_emissao IS NOT NULL
+          AND mes_referencia >= (date_trunc('month', current_date) - make_interval(months => :meses + 1))::date
+    """), params).mappings().all(), columns=["uc", "data_emissao"])
+    return crm, historico, emissoes
+
+def proxima_data(dias, referencia):
+    """Primeira data >= referencia no dia do mês indicado (dias além do fim do mês caem no último dia)."""
+    import pandas as pd
+    dias = pd.to_numeric(dias, errors="coerce").clip(1, 31)
+    referencia = pd.to_datetime(referencia)
+    inicio = referencia.dt.to_period("M").dt.to_timestamp()
+
+    def no_mes(primeiro):
+        ultimo_dia = (primeiro + pd.offsets.MonthEnd(0)).dt.day
+        return primeiro + pd.to_timedelta(dias.clip(upper=ultimo_dia) - 1, unit="D")
+
+    atual = no_mes(inicio)
+    return atual.where(atual >= referencia, no_mes(inicio + pd.offsets.MonthBegin(1)))
+
+def calcular_previsoes(crm, historico, emissoes, hoje=None):
+    import pandas as pd
+    hoje = pd.Timestamp(hoje or date.today())
+    prev = crm.drop_duplicates("uc").set_index("uc")
+
+    # Consumo: média com peso decrescente dos últimos meses faturados (0 = mais recente)
+    hist = historico.copy()
+    hist["consumo_kwh"] = pd.to_numeric(hist["consumo_kwh"], errors="coerce")
+    hist["total_cobranca"] = pd.to_numeric(hist["total_cobranca"], errors="coerce")
+    hist = hist.sort_values(["uc", "mes_referencia"], ascending=[True, False])
+    hist["idade"] = hist.groupby("uc").cumcount()
+    hist = hist[hist["idade"] < PREVISAO_MESES_HISTORICO()]
+    hist["peso"] = PREVISAO_DECAIMENTO() ** hist["idade"]
+    hist["consumo_ponderado"] = hist["consumo_kwh"] * hist["peso"]
+    # Tarifa: R$ por kWh nos meses com cobrança
+    com_cobranca = hist["total_cobranca"].notna()
+    hist["kwh_cobrado"] = hist["consumo_kwh"].where(com_cobranca)
+    por_uc = hist.groupby("uc").agg(
+        consumo_ponderado=("consumo_ponderado", "sum"), peso=("peso", "sum"),
+        cobranca=("total_cobranca", "sum"), kwh_cobrado=("kwh_cobrado", "sum"),
+        ultimo_mes=("mes_referencia", "max"), meses_historico=("idade", "count"),
+    )
+    prev = prev.join(por_uc, how="left")
+    consumo_crm = pd.to_numeric(prev["consumo_medio_mwh"], errors="coerce") * 1000
+    prev["consumo_previsto_kwh"] = (prev["consumo_ponderado"] / prev["peso"]).fillna(consumo_crm)
+    prev["tarifa_estimada"] = (prev["cobranca"] / prev["kwh_cobrado"]).where(prev["kwh_cobrado"] > 0)
+    prev["valor_previsto"] = (prev["consumo_previsto_kwh"] * prev["tarifa_estimada"]).round(2)
+    prev["meses_historico"] = prev["meses_historico"].fillna(0).astype(int)
+
+    # Mês previsto: o seguinte ao último faturado (sem histórico, o mês corrente)
+    ultimo = pd.to_datetime(prev["ultimo_mes"])
+    prev["mes_previsto"] = (ultimo + pd.offsets.MonthBegin(1)).fillna(hoje.replace(day=1))
+
+    # Leitura: próximo dia_leitura do RD a partir de hoje
+    referencia = pd.Series(hoje, index=prev.index)
+    prev["data_leitura_prevista"] = proxima_data(prev["dia_leitura"], referencia)
+    # Emissão: dia do mês típico (mediana) das emissões recentes, depois da leitura prevista;
+    # sem emissões, leitura + alguns dias
+    emis = emissoes.dropna()
+    dia_emissao = pd.to_datetime(emis["data_emissao"]).dt.day.groupby(emis["uc"]).median().round()
+    dia_emissao = dia_emissao.reindex(prev.index)
+    depois_da_leitura = prev["data_leitura_prevista"].fillna(hoje)
+    prev["data_emissao_prevista"] = proxima_data(dia_emissao, depois_da_leitura).fillna(
+        prev["data_leitura_prevista"] + pd.Timedelta(days=PREVISAO_DIAS_LEITURA_EMISSAO())
+    )
+
+    colunas = ["concessionaria", "mes_previsto", "data_leitura_prevista", "data_emissao_prevista",
+               "consumo_previsto_kwh", "tarifa_estimada", "valor_previsto", "meses_historico"]
+    return prev[colunas].reset_index()
+
+def _linha_banco(registro):
+    import pandas as pd
+    linha = {}
+    for coluna, valor in registro.items():
+        if valor is None or (not isinstance(valor, str) and pd.isna(valor)): linha[coluna] = None
+        elif isinstance(valor, pd.Timestamp): linha[coluna] = valor.date()
+        elif hasattr(valor, "item"): linha[coluna] = valor.item()
+        else: linha[coluna] = valor
+    return linha
+
+def gravar_previsoes(conn, ucs, previsoes):
+    # Some a previsão de UCs que deixaram de estar ativas; as demais são regravadas
+    conn.execute(text("DELETE FROM previsoes_faturamento WHERE uc = ANY(:ucs)"), {"ucs": list(ucs)})
+    linhas = [_linha_banco(r) for r in previsoes.to_dict("records")]
+    if linhas:
+        conn.execute(text("""
+            INSERT INTO previsoes_faturamento (
+                uc, concessionaria, mes_previsto, data_leitura_prevista, data_emissao_prevista,
+                consumo_previsto_kwh, tarifa_estimada, valor_previsto, meses_historico, calculado_em
+            ) VALUES (
+                :uc, :concessionaria, :mes_previsto, :data_leitura_prevista, :data_emissao_prevista,
+                :consumo_previsto_kwh, :tarifa_estimada, :valor_previsto, :meses_historico, now()
+            )
+        """), linhas)
+    return len(linhas)
+
+# --- EXECUÇÃO ---
+
+def executar_previsoes(completo=False):
+    aplicar_migracoes(engine)
+    inicio = time.time()
+    print("🔮 Atualizando previsões de faturamento...", flush=True)
+
+    # Lê o feed mesmo no modo completo: o cursor avança junto
+    alteradas, ultima = ucs_do_feed()
+    with engine.begin() as conn:
+        if completo:
+            ucs = ucs_ativas(conn) | {row[0] for row in conn.execute(text("SELECT uc FROM previsoes_faturamento"))}
+        else:
+            ucs = alteradas | ucs_vencidas(conn)
+    ucs = sorted(ucs)
+    if not ucs:
+        print("✅ Previsões em dia: nenhuma UC com entradas alteradas.", flush=True)
+        if ultima: confirmar_leitura(engine, CONSUMIDOR, ultima)
+        return 0
+
+    total = 0
+    for i in range(0, len(ucs), LOTE_UCS):
+        lote = ucs[i:i + LOTE_UCS]
+        with engine.begin() as conn:
+            previsoes = calcular_previsoes(*carregar_entradas(conn, lote))
+            total += gravar_previsoes(conn, lote, previsoes)
+    if ultima: confirmar_leitura(engine, CONSUMIDOR, ultima)
+    sinalizar_fim_carga(engine, CONSUMIDOR)
+    print(f"✅ {total} previsões gravadas ({len(ucs)} UCs recalculadas) em {time.time() - inicio:.1f}s.", flush=True)
+    return total
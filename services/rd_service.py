@@ -1,27 +1,29 @@
-import os
 import time
 import requests
 import json
 import csv
 import re
+from functools import lru_cache
 from io import StringIO
 from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from .config import engine, exigir
+from .esquema import aplicar_migracoes
+from .alteracoes import filtrar_alterados, nova_execucao, registrar_alteracoes, registrar_remocoes
+from .analytics_service import marcar_alteradas, manter_analytics
+from .sinais import sinalizar_fim_carga
+from .pipeline import executar_pipeline
+from .digest_paginas import DigestPaginas, assinatura
 
-load_dotenv()
-
-RD_TOKEN = os.getenv("RD_TOKEN")
-DB_URL = os.getenv("DATABASE_URL")
 RD_URL = "https://crm.rdstation.com/api/v1"
 
-if not RD_TOKEN or not DB_URL:
-    print("🛑 ERRO: Verifique .env")
-    exit()
-
-engine = create_engine(DB_URL)
+CHAVE_RD = {"id_negocio": "text"}
+COLUNAS_RD = [
+    "uc", "nome_negocio", "funil", "concessionaria", "area_de_gestao", "status_rd", "objetivo_etapa",
+    "data_ganho", "data_protocolo", "data_cancelamento", "consumo_medio_mwh", "dia_leitura", "json_completo"
+]
 session = requests.Session()
 retry = Retry(total=5, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
 adapter = HTTPAdapter(max_retries=retry)
@@ -49,7 +51,9 @@ def sincronizar_regras_google_sheets():
     try:
         resp = session.get(url_csv, timeout=30)
         resp.encoding = 'utf-8' 
-        if resp.status_code != 200: return False
+        if resp.status_code != 200:
+            print(f"❌ Planilha respondeu {resp.status_code}")
+            return False
         arquivo_csv = StringIO(resp.text)
         leitor = csv.DictReader(arquivo_csv)
         lista_regras = []
@@ -99,7 +103,10 @@ def sincronizar_regras_google_sheets():
                 """)
                 conn.execute(stmt, lista_regras)
             print(f"✅ Regras Antigas salvas: {len(lista_regras)} linhas.")
-    except Exception as e: print(f"❌ Erro Aba Antiga: {e}")
+        return True
+    except Exception as e:
+        print(f"❌ Erro Aba Antiga: {e}")
+        return False
 
 # =====================================================
 # FUNÇÃO 2: O MOTOR NOVO (Aba Recorrência por UC)
@@ -113,7 +120,9 @@ def sincronizar_regras_recorrencia_uc():
     try:
         resp = session.get(url_csv, timeout=30)
         resp.encoding = 'utf-8' 
-        if resp.status_code != 200: return False
+        if resp.status_code != 200:
+            print(f"❌ Planilha respondeu {resp.status_code}")
+            return False
         arquivo_csv = StringIO(resp.text)
         leitor = csv.DictReader(arquivo_csv)
         lista_regras_uc = []
@@ -146,14 +155,19 @@ def sincronizar_regras_recorrencia_uc():
                 """)
                 conn.execute(stmt, lista_regras_uc)
             print(f"✅ Tabela Nova de Recorrência atualizada! {len(lista_regras_uc)} UCs lidas.")
-    except Exception as e: print(f"❌ Erro Aba Nova: {e}")
+        return True
+    except Exception as e:
+        print(f"❌ Erro Aba Nova: {e}")
+        return False
 
 # =====================================================
 # FUNÇÕES RD STATION
 # =====================================================
+# Buscado uma vez por processo, na primeira vez que um negócio é processado
+@lru_cache(maxsize=1)
 def buscar_mapa_objetivos():
     try:
-        resp = session.get(f"{RD_URL}/deal_pipelines?token={RD_TOKEN}", timeout=30) 
+        resp = session.get(f"{RD_URL}/deal_pipelines?token={exigir('RD_TOKEN')}", timeout=30) 
         if resp.status_code != 200: return {}
         mapa = {}
         for pipe in resp.json():
@@ -162,8 +176,6 @@ def buscar_mapa_objetivos():
         return mapa
     except: return {}
 
-MAPA_OBJETIVOS = buscar_mapa_objetivos()
-
 def tratar_data_rd(val):
     if not val: return None
     val_str = str(val).strip()
@@ -183,7 +195,7 @@ def limpar_decimal(val):
 def processar_negocio(deal):
     campos = {f['custom_field']['label']: f['value'] for f in deal.get('deal_custom_fields', []) if f.get('custom_field')}
     stage_id = deal.get('deal_stage', {}).get('id')
-    info_etapa = MAPA_OBJETIVOS.get(stage_id, {})
+    info_etapa = buscar_mapa_objetivos().get(stage_id, {})
     try: dia_leitura = int(float(str(campos.get('Data de leitura estimada (Dia)')).replace(',', '.')))
     except: dia_leitura = None
 
@@ -200,40 +212,88 @@ def processar_negocio(deal):
         "updated_at": tratar_data_rd(deal.get('updated_at')) or datetime.now()
     }
 
-def executar_sync_rd():
-    print("🚀 Iniciando Sync RD...")
-    page = 1; has_more = True; total_salvos = 0; ids_ativos_rd = set(); sucesso_total = True 
+STMT_RD = text("""
+    INSERT INTO raw_rd_station (id_negocio, uc, nome_negocio, funil, concessionaria, area_de_gestao, status_rd, objetivo_etapa, data_ganho, data_protocolo, data_cancelamento, consumo_medio_mwh, dia_leitura, json_completo, updated_at)
+    VALUES (:id_negocio, :uc, :nome_negocio, :funil, :concessionaria, :area_de_gestao, :status_rd, :objetivo_etapa, :data_ganho, :data_protocolo, :data_cancelamento, :consumo_medio_mwh, :dia_leitura, :json_completo, :updated_at)
+    ON CONFLICT (id_negocio) DO UPDATE SET uc = EXCLUDED.uc, funil = EXCLUDED.funil, concessionaria = EXCLUDED.concessionaria, status_rd = EXCLUDED.status_rd, objetivo_etapa = EXCLUDED.objetivo_etapa, area_de_gestao = EXCLUDED.area_de_gestao, data_protocolo = EXCLUDED.data_protocolo, data_ganho = EXCLUDED.data_ganho, data_cancelamento = EXCLUDED.data_cancelamento, consumo_medio_mwh = EXCLUDED.consumo_medio_mwh, dia_leitura = EXCLUDED.dia_leitura, nome_negocio = EXCLUDED.nome_negocio, json_completo = EXCLUDED.json_completo, updated_at = EXCLUDED.updated_at, atualizado_em = now();
+""")
+
+def baixar_paginas_rd(digests):
+    rd_token = exigir("RD_TOKEN")
+    page = 1; has_more = True
     while has_more:
         print(f"🔄 Baixando pág {page}...", end='\r')
-        try:
-            resp = session.get(f"{RD_URL}/deals?token={RD_TOKEN}&page={page}&limit=200&sort=updated_at&direction=desc", timeout=30)
-            if resp.status_code != 200: sucesso_total = False; break
+        resp = session.get(f"{RD_URL}/deals?token={rd_token}&page={page}&limit=200&sort=updated_at&direction=desc",
+                           headers=digests.condicionais(page), timeout=30)
+        if resp.status_code not in (200, 304): raise RuntimeError(f"RD respondeu {resp.status_code} na pág {page}")
+        anterior = digests.inalterada(page, resp)
+        if anterior:
+            # Página igual à da execução anterior: sem json.loads, ids e has_more vêm da assinatura
+            deals, ids, has_more = [], anterior["meta"].get("ids", []), anterior["meta"].get("has_more", False)
+        else:
             data = resp.json(); deals = data.get('deals', []); has_more = data.get('has_more', False)
-            if not deals: break
-            lista = [processar_negocio(deal) for deal in deals]
-            for deal in deals: ids_ativos_rd.add(deal.get('id'))
-            if lista:
-                stmt = text("""
-                    INSERT INTO raw_rd_station (id_negocio, uc, nome_negocio, funil, concessionaria, area_de_gestao, status_rd, objetivo_etapa, data_ganho, data_protocolo, data_cancelamento, consumo_medio_mwh, dia_leitura, json_completo, updated_at)
-                    VALUES (:id_negocio, :uc, :nome_negocio, :funil, :concessionaria, :area_de_gestao, :status_rd, :objetivo_etapa, :data_ganho, :data_protocolo, :data_cancelamento, :consumo_medio_mwh, :dia_leitura, :json_completo, :updated_at)
-                    ON CONFLICT (id_negocio) DO UPDATE SET uc = EXCLUDED.uc, funil = EXCLUDED.funil, concessionaria = EXCLUDED.concessionaria, status_rd = EXCLUDED.status_rd, objetivo_etapa = EXCLUDED.objetivo_etapa, area_de_gestao = EXCLUDED.area_de_gestao, data_protocolo = EXCLUDED.data_protocolo, data_ganho = EXCLUDED.data_ganho, data_cancelamento = EXCLUDED.data_cancelamento, consumo_medio_mwh = EXCLUDED.consumo_medio_mwh, dia_leitura = EXCLUDED.dia_leitura, nome_negocio = EXCLUDED.nome_negocio, json_completo = EXCLUDED.json_completo, updated_at = EXCLUDED.updated_at;
-                """)
-                with engine.begin() as conn: conn.execute(stmt, lista)
-                total_salvos += len(lista)
-            page += 1
-            time.sleep(0.2)
-        except Exception as e: sucesso_total = False; break 
+            ids = [deal.get('id') for deal in deals]
+        if not ids: return
+        yield {"pagina": page, "deals": deals, "ids": ids, "has_more": has_more,
+               "inalterada": bool(anterior), "assinatura": assinatura(resp)}
+        page += 1
+        time.sleep(0.2)
+
+def gravar_negocios(lista, execucao_id):
+    if not lista: return 0
+    with engine.begin() as conn:
+        alterados = filtrar_alterados(conn, "raw_rd_station", CHAVE_RD, COLUNAS_RD, lista, colunas_json=("json_completo",))
+        if alterados:
+            conn.execute(STMT_RD, [neg for neg, _ in alterados])
+            # Mudança no CRM afeta todos os meses da UC (inclusive a UC antiga, se ela mudou)
+            chaves = [(neg["uc"], None) for neg, _ in alterados]
+            chaves += [(dif["uc"][0], None) for _, dif in alterados if "uc" in dif]
+            marcar_alteradas(conn, chaves, "rd")
+            registrar_alteracoes(conn, execucao_id, "rd", "raw_rd_station", CHAVE_RD, alterados, ignorar=("json_completo",))
+    return len(alterados)
+
+def executar_sync_rd():
+    aplicar_migracoes(engine)
+    print("🚀 Iniciando Sync RD...")
+    total_salvos = 0; ids_ativos_rd = set(); sucesso_total = True
+    digests = DigestPaginas(engine, "rd", "deals")
+    # Identifica esta execução no feed de alterações (log_alteracoes)
+    execucao_id = nova_execucao("rd")
+
+    def gravar(lista, pagina):
+        nonlocal total_salvos
+        ids_ativos_rd.update(pagina["ids"])
+        if pagina["inalterada"]:
+            digests.pular()
+            return
+        total_salvos += gravar_negocios(lista, execucao_id)
+        digests.guardar(pagina["pagina"], pagina["assinatura"], {"ids": pagina["ids"], "has_more": pagina["has_more"]}, len(pagina["ids"]))
+
+    # Download da próxima página em paralelo com a gravação da atual
+    try: executar_pipeline(baixar_paginas_rd(digests), lambda pagina: [processar_negocio(deal) for deal in pagina["deals"]], gravar)
+    except Exception as e: sucesso_total = False; print(f"\n❌ Erro no Sync RD: {e}")
             
-    print(f"\n🏁 Fim da leitura! Total RD processado: {total_salvos}")
+    print(f"\n🏁 Fim da leitura! Total RD alterado: {total_salvos} | Páginas inalteradas puladas: {digests.puladas}")
     if sucesso_total and len(ids_ativos_rd) > 0:
         try:
             with engine.begin() as conn:
                 ids_no_banco = {row[0] for row in conn.execute(text("SELECT id_negocio FROM raw_rd_station")).fetchall()}
                 ids_para_deletar = ids_no_banco - ids_ativos_rd
-                if ids_para_deletar: conn.execute(text("DELETE FROM raw_rd_station WHERE id_negocio IN :ids"), {"ids": tuple(ids_para_deletar)})
-        except: pass
+                if ids_para_deletar:
+                    removidos = conn.execute(text("DELETE FROM raw_rd_station WHERE id_negocio IN :ids RETURNING id_negocio, uc"), {"ids": tuple(ids_para_deletar)}).fetchall()
+                    marcar_alteradas(conn, [(row.uc, None) for row in removidos], "rd")
+                    registrar_remocoes(conn, execucao_id, "rd", "raw_rd_station", [{"id_negocio": row.id_negocio} for row in removidos])
+        except Exception as e: sucesso_total = False; print(f"❌ Erro removendo negócios excluídos: {e}")
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, "rd")
+    return sucesso_total
+
+def executar_sync_regras():
+    aplicar_migracoes(engine)
+    antigas = sincronizar_regras_google_sheets()
+    recorrencia = sincronizar_regras_recorrencia_uc()
+    return antigas and recorrencia
 
-if __name__ == "__main__":
-    sincronizar_regras_google_sheets()
-    sincronizar_regras_recorrencia_uc()
-    executar_sync_rd()
\ No newline at end of file
+def executar_sync_rd_completo():
+    regras = executar_sync_regras()
+    return executar_sync_rd() and regras
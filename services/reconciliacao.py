@@ -0,0 +1,206 @@
+import csv
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy import text
+from .config import Ajuste, engine, exigir
+from .alteracoes import filtrar_alterados, normalizar
+from .concorrencia import LimitadorTaxa
+
+# Reconciliação API x banco: busca na fonte (em paralelo, usando os filtros da própria API) os
+# registros de um mês, de uma lista de UCs ou de uma amostra delas, normaliza com as mesmas
+# funções dos conectores e compara coluna a coluna com raw_unifica / raw_lumi.
+
+RECONCILIACAO_CONCORRENCIA = Ajuste("RECONCILIACAO_CONCORRENCIA", "4", int)
+RECONCILIACAO_REQ_POR_SEGUNDO = Ajuste("RECONCILIACAO_REQ_POR_SEGUNDO", "3", float)
+# Diferenças numéricas até este valor são contadas como arredondamento
+TOLERANCIA_NUMERICA = 0.01
+LOTE_COMPARACAO = 1000
+
+# --- FONTES ---
+
+class FonteUnifica:
+    nome = "unifica"
+    tabela = "raw_unifica"
+
+    def __init__(self, limitador):
+        from . import unifica_service
+        self.servico = unifica_service
+        self.chave, self.colunas = unifica_service.CHAVE_UNIFICA, unifica_service.COLUNAS_UNIFICA
+        url, token = exigir("UNIFICA_BASE_URL", "UNIFICA_TOKEN")
+        self.url = f"{url.rstrip('/')}{unifica_service.ENDPOINT}"
+        self.headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json", "accept": "*/*"}
+        self.limitador = limitador
+        self.local = threading.local()
+
+    def _pagina(self, params):
+        # Uma sessão por thread, como na sincronização por partição
+        if not hasattr(self.local, "session"): self.local.session = self.servico.get_session()
+        self.limitador.aguardar()
+        return self.servico.baixar_pagina(self.local.session, self.url, self.headers, params) or {}
+
+    def _todas_as_paginas(self, pool, filtros):
+        """Primeira página diz quantas existem; as demais são baixadas em paralelo."""
+        primeira = self._pagina({**filtros, "page": 1, "per_page": 100})
+        itens = list(primeira.get("data", []))
+        ultima = (primeira.get("meta") or {}).get("last_page") or 1
+        futuros = [pool.submit(self._pagina, {**filtros, "page": p, "per_page": 100}) for p in range(2, ultima + 1)]
+        for futuro in as_completed(futuros):
+            itens.extend(futuro.result().get("data", []))
+        return itens
+
+    def buscar(self, pool, mes=None, ucs=None):
+        filtros = {"date_ref": mes} if mes else {}
+        if not ucs:
+            itens = self._todas_as_paginas(pool, filtros)
+        else:
+            itens = []
+            # Cada UC ocupa uma thread só para a primeira página; as demais vão para o mesmo pool
+            with ThreadPoolExecutor(max_workers=RECONCILIACAO_CONCORRENCIA()) as pool_ucs:
+                futuros = [pool_ucs.submit(self._todas_as_paginas, pool, {**filtros, "uc": uc}) for uc in ucs]
+                for futuro in as_completed(futuros):
+                    itens.extend(futuro.result())
+        registros = self.servico.normalizar_lote(itens)
+        # A API às vezes devolve UCs misturadas mesmo com o filtro
+        if ucs: registros = [r for r in registros if r["uc"] in ucs]
+        return registros
+
+class FonteLumi:
+    nome = "lumi"
+    tabela = "raw_lumi"
+
+    def __init__(self, limitador):
+        from . import lumi_service
+        self.servico = lumi_service
+        self.chave, self.colunas = lumi_service.CHAVE_LUMI, lumi_service.COLUNAS_LUMI
+        self.limitador = limitador
+
+    def _periodos(self, conta, headers, mes):
+        if mes:
+            return [(f"{mes}-01", self.servico.ultimo_dia(mes))]
+        # Histórico inteiro da conta (mesma descoberta da sincronização), ano a ano
+        primeiro_ano = int(self.servico.descobrir_inicio(conta["nome"], headers)[:4])
+        return [(f"{ano}-01-01", f"{ano}-12-31") for ano in range(primeiro_ano, datetime.now().year + 1)]
+
+    def _baixar(self, conta, headers, inicio, fim):
+        self.limitador.aguardar()
+        itens = self.servico.baixar_periodo(headers, inicio, fim)
+        return [self.servico.processar_fatura(item, conta["nome"]) for item in itens]
+
+    def buscar(self, pool, mes=None, ucs=None):
+        futuros = []
+        for conta in self.servico.contas_lumi():
+            headers = self.servico.logar_conta(conta)
+            if not headers: continue
+            for inicio, fim in self._periodos(conta, headers, mes):
+                futuros.append(pool.submit(self._baixar, conta, headers, inicio, fim))
+        registros = {}
+        for futuro in futuros:
+            # Na ordem das contas: a última conta sobrescreve, como no upsert da sincronização
+            for fat in futuro.result():
+                if not fat["uc"] or not fat["mes_referencia"]: continue
+                if ucs and fat["uc"] not in ucs: continue
+                registros[(fat["uc"], fat["mes_referencia"])] = fat
+        return list(registros.values())
+
+FONTES = {"unifica": FonteUnifica, "lumi": FonteLumi}
+
+# --- COMPARAÇÃO ---
+
+def classificar(antigo, novo):
+    if antigo is None: return "nulo_no_banco"
+    if novo is None: return "nulo_na_api"
+    a, n = normalizar(antigo), normalizar(novo)
+    if isinstance(a, float) and isinstance(n, float):
+        return "arredondamento" if abs(a - n) <= TOLERANCIA_NUMERICA else "valor_diferente"
+    if isinstance(a, str) and isinstance(n, str) and a.strip().lower() == n.strip().lower():
+        return "espacos_ou_caixa"
+    return "valor_diferente"
+
+def carregar_chaves_banco(tabela, mes=None, ucs=None):
+    filtros, params = [], {}
+    if mes:
+        filtros.append("mes_referencia = CAST(:mes AS date)")
+        params["mes"] = f"{mes}-01"
+    if ucs:
+        filtros.append("uc = ANY(:ucs)")
+        params["ucs"] = list(ucs)
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+    with engine.begin() as conn:
+        rows = conn.execute(text(f"SELECT uc, mes_referencia FROM {tabela} {where}"), params).all()
+    return {(str(uc), mes_ref.isoformat()) for uc, mes_ref in rows}
+
+def sortear_ucs(tabela, taxa, mes=None):
+    filtro = "WHERE mes_referencia = CAST(:mes AS date)" if mes else ""
+    with engine.begin() as conn:
+        ucs = [row[0] for row in conn.execute(
+            text(f"SELECT DISTINCT uc FROM {tabela} {filtro}"), {"mes": f"{mes}-01" if mes else None}
+        )]
+    return set(random.sample(ucs, max(1, round(len(ucs) * taxa)))) if ucs else set()
+
+def comparar(fonte, registros, mes=None, ucs=None):
+    """Uma linha por (uc, mês, coluna) divergente: (uc, mes, coluna, causa, banco, api)."""
+    divergencias = []
+    with engine.begin() as conn:
+        for i in range(0, len(registros), LOTE_COMPARACAO):
+            lote = registros[i:i + LOTE_COMPARACAO]
+            for reg, diferencas in filtrar_alterados(conn, fonte.tabela, fonte.chave, fonte.colunas, lote,
+                                                     coluna_particao="mes_referencia"):
+                if diferencas.nova:
+                    divergencias.append((reg["uc"], reg["mes_referencia"], "*", "ausente_no_banco", None, None))
+                    continue
+                for coluna, (antigo, novo) in diferencas.items():
+                    divergencias.append((reg["uc"], reg["mes_referencia"], coluna, classificar(antigo, novo), antigo, novo))
+
+    # O contrário: linhas do banco, dentro do mesmo recorte, que a API não devolveu
+    na_api = {(r["uc"], str(r["mes_referencia"])[:10]) for r in registros}
+    for uc, mes_ref in sorted(carregar_chaves_banco(fonte.tabela, mes, ucs) - na_api):
+        divergencias.append((uc, mes_ref, "*", "ausente_na_api", None, None))
+    return divergencias
+
+def salvar_relatorio(fonte, divergencias, arquivo=None):
+    arquivo = arquivo or f"Reconciliacao_{fonte}_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
+    with open(arquivo, "w", newline="", encoding="utf-8-sig") as f:
+        escritor = csv.writer(f, delimiter=";")
+        escritor.writerow(["uc", "mes_referencia", "coluna", "causa", "banco", "api"])
+        escritor.writerows(divergencias)
+    return arquivo
+
+def executar_reconciliacao(fonte, mes=None, ucs=None, amostra=None, arquivo=None):
+    if fonte not in FONTES:
+        raise ValueError(f"Fonte inválida: {fonte}. Use {', '.join(FONTES)}.")
+    if not (mes or ucs or amostra):
+        raise ValueError("Informe um mês, uma lista de UCs ou uma taxa de amostragem.")
+    mes = mes[:7] if mes else None
+    ucs = {str(uc).strip() for uc in ucs or () if str(uc).strip()}
+
+    inicio = time.time()
+    limitador = LimitadorTaxa(RECONCILIACAO_REQ_POR_SEGUNDO())
+    classe = FONTES[fonte]
+    if amostra:
+        ucs |= sortear_ucs(classe.tabela, amostra, mes)
+    recorte = ", ".join(filter(None, [f"mês {mes}" if mes else "", f"{len(ucs)} UCs" if ucs else ""]))
+    print(f"🕵️ Reconciliando {fonte} ({recorte})...", flush=True)
+
+    with ThreadPoolExecutor(max_workers=RECONCILIACAO_CONCORRENCIA()) as pool:
+        fonte_api = classe(limitador)
+        registros = fonte_api.buscar(pool, mes, ucs or None)
+    print(f"    📥 {len(registros)} registros da API em {time.time() - inicio:.1f}s. Comparando...", flush=True)
+
+    divergencias = comparar(fonte_api, registros, mes, ucs or None)
+    caminho = salvar_relatorio(fonte, divergencias, arquivo)
+
+    chaves_divergentes = {(uc, m) for uc, m, *_ in divergencias}
+    print("\n📊 RESUMO DA RECONCILIAÇÃO")
+    print(f"Comparados: {len(registros)} | Com divergência: {len(chaves_divergentes)} | "
+          f"Tempo: {time.time() - inicio:.1f}s")
+    por_coluna = Counter((coluna, causa) for _, _, coluna, causa, _, _ in divergencias)
+    for (coluna, causa), qtd in sorted(por_coluna.items(), key=lambda x: -x[1]):
+        print(f"    {qtd:>7}  {coluna:<28} {causa}")
+    if not divergencias: print("✅ Banco e API batem em todas as colunas.")
+    print(f"📂 Detalhes: {os.path.abspath(caminho)}")
+    return divergencias
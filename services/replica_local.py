@@ -0,0 +1,300 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from sqlalchemy import text
+from .config import Ajuste, cfg, engine
+
+# Réplica local (arquivo DuckDB) das tabelas brutas, das regras e do analytics, para auditorias
+# e exportações pesadas rodarem no notebook sem consultar o Supabase. A cópia é incremental:
+# cada tabela guarda a sua marca d'água (maior updated_at já copiado) dentro do próprio arquivo.
+# Linhas apagadas no Supabase saem da réplica pelo log_alteracoes (tabelas cujos conectores
+# registram remoções) ou numa reconciliação periódica, que compara todas as chaves.
+
+# tabela -> chave primária e coluna de marca d'água (None = cópia inteira, tabelas pequenas);
+# remocoes_no_log: os conectores registram as remoções no log_alteracoes (chave de uma coluna);
+# grupo: colunas cujas linhas são apagadas e regravadas juntas na origem (numa só transação)
+TABELAS_REPLICA = {
+    "raw_unifica": {"chave": ("uc", "mes_referencia"), "marca": "updated_at"},
+    "raw_lumi": {"chave": ("uc", "mes_referencia"), "marca": "updated_at"},
+    "raw_rd_station": {"chave": ("id_negocio",), "marca": "atualizado_em", "remocoes_no_log": True},
+    "raw_pipedrive": {"chave": ("deal_id",), "marca": "updated_at", "remocoes_no_log": True},
+    "raw_pipedrive_outros": {"chave": ("deal_id",), "marca": "updated_at", "remocoes_no_log": True},
+    # (uc, mes_referencia) se repete: a chave é id_linha e o grupo substitui as linhas regravadas
+    "analytics_incremental": {"chave": ("id_linha",), "marca": "atualizado_em", "grupo": ("uc", "mes_referencia")},
+    "regras_comissao": {"chave": None, "marca": None},
+    "regras_recorrencia_uc": {"chave": None, "marca": None},
+}
+
+REPLICA_LOTE = Ajuste("REPLICA_LOTE", "5000", int)
+# Janela recopiada a cada execução: transações longas podem gravar um updated_at anterior à
+# marca já copiada. Recopiar é seguro porque cada lote substitui as linhas pela chave.
+REPLICA_SOBREPOSICAO = Ajuste("REPLICA_SOBREPOSICAO_MINUTOS", "30", lambda valor: timedelta(minutes=int(valor)))
+# Intervalo da reconciliação completa de chaves (traz todas as chaves do Supabase)
+REPLICA_RECONCILIACAO_DIAS = Ajuste("REPLICA_RECONCILIACAO_DIAS", "7", int)
+
+def caminho_replica(caminho=None):
+    return caminho or cfg("REPLICA_ARQUIVO", "replica_simplifica.duckdb")
+
+def abrir_replica(caminho=None, somente_leitura=False):
+    # duckdb só é necessário para quem usa a réplica
+    import duckdb
+    caminho = caminho_replica(caminho)
+    if somente_leitura and not os.path.exists(caminho):
+        raise FileNotFoundError(f"Réplica {caminho} não existe. Rode: python -m services replica sync")
+    local = duckdb.connect(caminho, read_only=somente_leitura)
+    if not somente_leitura:
+        local.execute("""
+            CREATE TABLE IF NOT EXISTS replica_marcas (
+                tabela VARCHAR PRIMARY KEY,
+                marca TIMESTAMP,
+                linhas BIGINT,
+                sincronizado_em TIMESTAMP
+            )
+        """)
+        # Até onde o log de remoções já foi aplicado e quando foi a última reconciliação completa
+        local.execute("ALTER TABLE replica_marcas ADD COLUMN IF NOT EXISTS remocoes_ate TIMESTAMP")
+        local.execute("ALTER TABLE replica_marcas ADD COLUMN IF NOT EXISTS reconciliado_em TIMESTAMP")
+    return local
+
+def _valor_local(valor):
+    if isinstance(valor, Decimal): return float(valor)
+    if isinstance(valor, (dict, list)): return json.dumps(valor, ensure_ascii=False, default=str)
+    # DuckDB guarda TIMESTAMP sem fuso; tudo em UTC
+    if isinstance(valor, datetime) and valor.tzinfo: return valor.astimezone(timezone.utc).replace(tzinfo=None)
+    return valor
+
+def _lote_dataframe(colunas, linhas):
+    import pandas as pd
+    return pd.DataFrame([[_valor_local(v) for v in linha] for linha in linhas], columns=colunas)
+
+def _tabela_existe(local, tabela):
+    return local.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [tabela]
+    ).fetchone()[0] > 0
+
+def _gravar_lote(local, tabela, chave, lote, grupo=None, coluna_marca=None):
+    local.register("lote", lote)
+    try:
+        if not _tabela_existe(local, tabela):
+            local.execute(f"CREATE TABLE {tabela} AS SELECT * FROM lote LIMIT 0")
+        # Colunas novas no Supabase entram na réplica com o tipo inferido do lote
+        existentes = {row[0] for row in local.execute(f"DESCRIBE {tabela}").fetchall()}
+        for coluna, tipo, *_ in local.execute("DESCRIBE SELECT * FROM lote").fetchall():
+            if coluna not in existentes:
+                local.execute(f'ALTER TABLE {tabela} ADD COLUMN "{coluna}" {tipo}')
+        if chave:
+            condicao = " AND ".join(f"{tabela}.{c} IS NOT DISTINCT FROM lote.{c}" for c in chave)
+            local.execute(f"DELETE FROM {tabela} USING lote WHERE {condicao}")
+        if grupo:
+            # A origem regrava o grupo inteiro numa transação (mesma marca em todas as linhas): o que
+            # a réplica tem do grupo com marca mais antiga foi substituído. Linhas do mesmo grupo em
+            # outro lote desta cópia têm a mesma marca e ficam
+            colunas = ", ".join(grupo)
+            condicao = " AND ".join(f"{tabela}.{c} IS NOT DISTINCT FROM g.{c}" for c in grupo)
+            local.execute(f"""
+                DELETE FROM {tabela} USING (SELECT {colunas}, max({coluna_marca}) AS marca_grupo FROM lote GROUP BY {colunas}) g
+                WHERE {condicao} AND {tabela}.{coluna_marca} < g.marca_grupo
+            """)
+        local.execute(f"INSERT INTO {tabela} BY NAME SELECT * FROM lote")
+    finally:
+        local.unregister("lote")
+
+def _remover_apagados(conn, local, tabela, chave):
+    """Apaga da réplica as chaves que não existem mais no Supabase (só as colunas da chave trafegam)."""
+    colunas = ", ".join(chave)
+    resultado = conn.execute(text(f"SELECT DISTINCT {colunas} FROM {tabela}"))
+    local.register("chaves_remotas", _lote_dataframe(list(resultado.keys()), resultado.all()))
+    try:
+        condicao = " AND ".join(f"r.{c} IS NOT DISTINCT FROM {tabela}.{c}" for c in chave)
+        antes = local.execute(f"SELECT count(*) FROM {tabela}").fetchone()[0]
+        local.execute(f"DELETE FROM {tabela} WHERE NOT EXISTS (SELECT 1 FROM chaves_remotas r WHERE {condicao})")
+        return antes - local.execute(f"SELECT count(*) FROM {tabela}").fetchone()[0]
+    finally:
+        local.unregister("chaves_remotas")
+
+def _chave_do_log(valor):
+    # O log normaliza inteiros como float (123 -> 123.0)
+    return str(int(valor)) if isinstance(valor, float) and valor.is_integer() else str(valor)
+
+def _remover_do_log(conn, local, tabela, coluna, desde):
+    """Apaga da réplica as chaves que o log_alteracoes registrou como removidas desde `desde` e que não voltaram."""
+    removidas = {_chave_do_log(valor) for valor in conn.execute(text("""
+        SELECT DISTINCT chave -> :coluna FROM log_alteracoes
+        WHERE tabela = :tabela AND operacao = 'remocao' AND registrado_em >= :desde
+    """), {"coluna": coluna, "tabela": tabela, "desde": desde.replace(tzinfo=timezone.utc)}).scalars()
+        if valor is not None}
+    if not removidas: return 0
+    # Uma chave removida pode ter voltado depois (ex.: negócio que mudou de status e voltou)
+    removidas -= set(conn.execute(text(f"""
+        SELECT {coluna}::text FROM {tabela} WHERE {coluna}::text = ANY(:chaves)
+    """), {"chaves": list(removidas)}).scalars())
+    if not removidas: return 0
+    import pandas as pd
+    local.register("chaves_removidas", pd.DataFrame({"chave": sorted(removidas)}))
+    try:
+        antes = local.execute(f"SELECT count(*) FROM {tabela}").fetchone()[0]
+        local.execute(f"DELETE FROM {tabela} WHERE CAST({coluna} AS VARCHAR) IN (SELECT chave FROM chaves_removidas)")
+        return antes - local.execute(f"SELECT count(*) FROM {tabela}").fetchone()[0]
+    finally:
+        local.unregister("chaves_removidas")
+
+def replicar_tabela(conn, local, tabela, completa=False, reconciliar=False):
+    config = TABELAS_REPLICA[tabela]
+    chave, coluna_marca = config["chave"], config["marca"]
+    # Instante do Supabase antes da cópia: o próximo sync lê o log de remoções a partir daqui
+    agora = _valor_local(conn.execute(text("SELECT now()")).scalar())
+    estado = local.execute(
+        "SELECT marca, remocoes_ate, reconciliado_em FROM replica_marcas WHERE tabela = ?", [tabela]
+    ).fetchone() if _tabela_existe(local, tabela) else None
+    marca = estado[0] if estado and coluna_marca and not completa else None
+
+    if coluna_marca is None or marca is None:
+        # Cópia inteira: a tabela local é recriada do zero (sem marca até terminar)
+        local.execute("DELETE FROM replica_marcas WHERE tabela = ?", [tabela])
+        local.execute(f"DROP TABLE IF EXISTS {tabela}")
+        filtro, params = "", {}
+    else:
+        filtro, params = f"WHERE {coluna_marca} >= :desde", {"desde": marca - REPLICA_SOBREPOSICAO()}
+
+    ordem = f"ORDER BY {coluna_marca}" if coluna_marca else ""
+    resultado = conn.execution_options(stream_results=True, yield_per=REPLICA_LOTE()).execute(
+        text(f"SELECT * FROM {tabela} {filtro} {ordem}"), params
+    )
+    colunas = list(resultado.keys())
+    copiadas, nova_marca = 0, marca
+    for linhas in resultado.partitions(REPLICA_LOTE()):
+        lote = _lote_dataframe(colunas, linhas)
+        if filtro: _gravar_lote(local, tabela, chave, lote, config.get("grupo"), coluna_marca)
+        else: _gravar_lote(local, tabela, None, lote)
+        copiadas += len(lote)
+        if coluna_marca:
+            maior = lote[coluna_marca].max()
+            if maior is not None and maior == maior and (nova_marca is None or maior > nova_marca):
+                nova_marca = maior.to_pydatetime() if hasattr(maior, "to_pydatetime") else maior
+
+    # Cópia inteira já é uma reconciliação. Na incremental, as remoções vêm do log; a comparação
+    # de todas as chaves só roda a cada REPLICA_RECONCILIACAO_DIAS (ou com reconciliar=True)
+    removidas, reconciliado_em = 0, agora
+    if filtro and chave:
+        reconciliado_em = estado[2] if estado else None
+        if reconciliar or reconciliado_em is None or agora - reconciliado_em > timedelta(days=REPLICA_RECONCILIACAO_DIAS()):
+            removidas, reconciliado_em = _remover_apagados(conn, local, tabela, chave), agora
+        elif config.get("remocoes_no_log") and estado[1]:
+            removidas = _remover_do_log(conn, local, tabela, chave[0], estado[1] - REPLICA_SOBREPOSICAO())
+    total = local.execute(f"SELECT count(*) FROM {tabela}").fetchone()[0] if _tabela_existe(local, tabela) else 0
+    local.execute("""
+        INSERT INTO replica_marcas (tabela, marca, linhas, sincronizado_em, remocoes_ate, reconciliado_em)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (tabela) DO UPDATE SET marca = EXCLUDED.marca, linhas = EXCLUDED.linhas,
+                                           sincronizado_em = EXCLUDED.sincronizado_em,
+                                           remocoes_ate = EXCLUDED.remocoes_ate,
+                                           reconciliado_em = EXCLUDED.reconciliado_em
+    """, [tabela, nova_marca, total, datetime.now(), agora, reconciliado_em])
+    return copiadas, removidas, total
+
+def sincronizar_replica(caminho=None, tabelas=None, completa=False, reconciliar=False):
+    desconhecidas = set(tabelas or ()) - set(TABELAS_REPLICA)
+    if desconhecidas:
+        raise ValueError(f"Tabelas fora da réplica: {', '.join(sorted(desconhecidas))}. Use {', '.join(TABELAS_REPLICA)}.")
+    caminho = caminho_replica(caminho)
+    print(f"🚀 Atualizando réplica local em {os.path.abspath(caminho)}...", flush=True)
+    inicio = time.time()
+    local = abrir_replica(caminho)
+    try:
+        for tabela in tabelas or TABELAS_REPLICA:
+            t0 = time.time()
+            try:
+                with engine.connect() as conn:
+                    copiadas, removidas, total = replicar_tabela(conn, local, tabela, completa, reconciliar)
+                print(f"    ✅ {tabela}: {copiadas} copiadas, {removidas} removidas, "
+                      f"{total} na réplica ({time.time() - t0:.1f}s)", flush=True)
+            except Exception as e:
+                print(f"    ❌ {tabela}: {e}", flush=True)
+        local.execute("CHECKPOINT")
+    finally:
+        local.close()
+    print(f"🏁 Réplica atualizada em {time.time() - inicio:.1f}s.")
+
+# --- CONSULTAS LOCAIS ---
+
+def consultar_local(sql, caminho=None):
+    local = abrir_replica(caminho, somente_leitura=True)
+    try:
+        return local.execute(sql).df()
+    finally:
+        local.close()
+
+def exportar_tabelao_local(caminho=None, arquivo_saida=None):
+    """Mesmo tabelão do exportar_tabelao, lido do analytics replicado (sem tocar no Supabase)."""
+    from .exportar_tabelao import COLUNAS_FINAIS, RENOMEAR_COLUNAS
+
+    local = abrir_replica(caminho, somente_leitura=True)
+    try:
+        existentes = {row[0] for row in local.execute("DESCRIBE analytics_incremental").fetchall()}
+        colunas = [c for c, titulo in RENOMEAR_COLUNAS.items() if c in existentes and titulo in COLUNAS_FINAIS]
+        df = local.execute(f"""
+            SELECT {", ".join(colunas)} FROM analytics_incremental
+            ORDER BY mes_referencia DESC, nome_cliente ASC
+        """).df()
+    finally:
+        local.close()
+
+    if df.empty:
+        print("⚠️ A tabela está vazia.")
+        return None
+    df = df.rename(columns=RENOMEAR_COLUNAS)
+    df = df[[c for c in COLUNAS_FINAIS if c in df.columns]]
+    if "Eficiência (%)" in df.columns:
+        df["Eficiência (%)"] = df["Eficiência (%)"] * 100
+
+    arquivo_saida = arquivo_saida or f"Tabelao_Local_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.xlsx"
+    df.to_excel(arquivo_saida, index=False)
+    print(f"✅ Tabelão gerado da réplica local: {os.path.abspath(arquivo_saida)} ({len(df)} linhas)")
+    return arquivo_saida
+
+def auditar_uc_local(uc, caminho=None):
+    """Unifica, Lumi e analytics lado a lado, mês a mês, para uma UC."""
+    import pandas as pd
+    local = abrir_replica(caminho, somente_leitura=True)
+    try:
+        df = local.execute("""
+            WITH meses AS (
+                SELECT mes_referencia FROM raw_unifica WHERE uc = $uc
+                UNION SELECT mes_referencia FROM raw_lumi WHERE uc = $uc
+                UNION SELECT mes_referencia FROM analytics_incremental WHERE uc = $uc
+            )
+            SELECT m.mes_referencia,
+                   u.valor_fatura AS unifica_valor, u.status_pagamento AS unifica_status,
+                   u.consumo_kwh AS unifica_consumo, u.energia_compensada AS unifica_compensada,
+                   l.valor_total_fatura AS lumi_valor, l.status_pagamento AS lumi_status,
+                   l.consumo_kwh AS lumi_consumo, l.energia_compensada AS lumi_compensada,
+                   a.fonte_dados AS analytics_fonte, a.total_cobranca AS analytics_total,
+                   a.status AS analytics_status
+            FROM meses m
+            LEFT JOIN raw_unifica u ON u.uc = $uc AND u.mes_referencia = m.mes_referencia
+            LEFT JOIN raw_lumi l ON l.uc = $uc AND l.mes_referencia = m.mes_referencia
+            LEFT JOIN analytics_incremental a ON a.uc = $uc AND a.mes_referencia = m.mes_referencia
+            ORDER BY m.mes_referencia DESC
+        """, {"uc": str(uc)}).df()
+    finally:
+        local.close()
+
+    if df.empty:
+        print(f"⚠️ UC {uc} não encontrada na réplica.")
+        return df
+    print(f"🕵️ UC {uc} na réplica local ({len(df)} meses):")
+    with pd.option_context("display.max_columns", None, "display.width", 250):
+        print(df.to_string(index=False))
+    return df
+
+def status_replica(caminho=None):
+    local = abrir_replica(caminho, somente_leitura=True)
+    try:
+        for tabela, marca, linhas, sincronizado_em in local.execute(
+            "SELECT tabela, marca, linhas, sincronizado_em FROM replica_marcas ORDER BY tabela"
+        ).fetchall():
+            print(f"📦 {tabela}: {linhas} linhas | marca {marca or '-'} | atualizada em {sincronizado_em:%Y-%m-%d %H:%M}")
+    finally:
+        local.close()
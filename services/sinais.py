@@ -0,0 +1,12 @@
+from sqlalchemy import text
+
+# Sinal de "carga concluída" (LISTEN/NOTIFY do Postgres): os conectores avisam ao terminar
+# e a API de leitura invalida o cache em memória.
+CANAL_CARGA = "carga_concluida"
+
+def sinalizar_fim_carga(engine, fonte):
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:canal, :fonte)"), {"canal": CANAL_CARGA, "fonte": fonte})
+    except Exception as e:
+        print(f"⚠️ Não foi possível sinalizar o fim da carga ({fonte}): {e}", flush=True)
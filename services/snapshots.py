@@ -0,0 +1,200 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+import requests
+from sqlalchemy import text
+from .config import cfg, engine, exigir
+
+# Snapshots estáticos do dashboard: depois da carga, os conjuntos que os gráficos consultam
+# viram arquivos JSON colunares comprimidos, com o hash do conteúdo no nome (cache eterno no
+# navegador/CDN). Só o manifesto.json muda de nome fixo e aponta para a versão atual.
+
+# Históricos por UC agrupados em fatias pelos 2 últimos dígitos da UC (até 100 arquivos)
+DIGITOS_FATIA_UC = 2
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+CACHE_MANIFESTO = "public, max-age=60"
+
+def _valor_json(valor):
+    if isinstance(valor, Decimal): return float(valor)
+    if isinstance(valor, (date, datetime)): return valor.isoformat()
+    return str(valor)
+
+def empacotar(colunas, linhas):
+    """JSON colunar ({colunas, linhas}) comprimido; gzip sem data para o mesmo conteúdo dar o mesmo hash."""
+    corpo = json.dumps({"colunas": colunas, "linhas": linhas}, ensure_ascii=False,
+                       separators=(",", ":"), default=_valor_json).encode("utf-8")
+    sha256 = hashlib.sha256(corpo).hexdigest()
+    return gzip.compress(corpo, compresslevel=9, mtime=0), sha256
+
+# --- DESTINOS ---
+
+class DestinoLocal:
+    def __init__(self, pasta):
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+
+    def existe(self, nome):
+        return os.path.exists(os.path.join(self.pasta, nome))
+
+    def gravar(self, nome, conteudo, cache_control, tipo):
+        caminho = os.path.join(self.pasta, nome)
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        with open(f"{caminho}.tmp", "wb") as f:
+            f.write(conteudo)
+        os.replace(f"{caminho}.tmp", caminho)
+
+    def ler_manifesto(self):
+        caminho = os.path.join(self.pasta, "manifesto.json")
+        if not os.path.exists(caminho): return None
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+
+    def remover(self, nome):
+        caminho = os.path.join(self.pasta, nome)
+        if os.path.exists(caminho): os.remove(caminho)
+
+class DestinoSupabase:
+    """Bucket público do Supabase Storage: os arquivos saem pela CDN com o Cache-Control gravado."""
+
+    def __init__(self, url, chave, bucket):
+        self.base = f"{url.rstrip('/')}/storage/v1/object"
+        self.publico = f"{self.base}/public/{bucket}"
+        self.bucket = bucket
+        self.headers = {"Authorization": f"Bearer {chave}", "apikey": chave}
+
+    def existe(self, nome):
+        return requests.head(f"{self.publico}/{nome}", timeout=30).status_code == 200
+
+    def gravar(self, nome, conteudo, cache_control, tipo):
+        resp = requests.post(
+            f"{self.base}/{self.bucket}/{nome}", data=conteudo, timeout=120,
+            headers={**self.headers, "Content-Type": tipo, "cache-control": cache_control, "x-upsert": "true"}
+        )
+        resp.raise_for_status()
+
+    def ler_manifesto(self):
+        resp = requests.get(f"{self.publico}/manifesto.json", timeout=30)
+        return resp.json() if resp.status_code == 200 else None
+
+    def remover(self, nome):
+        requests.delete(f"{self.base}/{self.bucket}", json={"prefixes": [nome]}, headers=self.headers, timeout=30)
+
+def obter_destino(nome=None, pasta=None):
+    nome = nome or cfg("SNAPSHOTS_DESTINO", "local")
+    if nome == "supabase":
+        url, chave = exigir("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY")
+        return DestinoSupabase(url, chave, cfg("SNAPSHOTS_BUCKET", "snapshots"))
+    # public/ (e não dist/, que o vite build apaga): o Vite copia para a raiz do site, em /dados
+    return DestinoLocal(pasta or cfg("SNAPSHOTS_PASTA", os.path.join("frontend", "public", "dados")))
+
+# --- CONJUNTOS ---
+
+def consultar(conn, sql):
+    resultado = conn.execute(text(sql))
+    return list(resultado.keys()), [list(row) for row in resultado]
+
+def montar_conjuntos(conn):
+    """{nome: (colunas, linhas)} dos agregados; os históricos por UC saem em fatias à parte."""
+    return {
+        "totais_mensais": consultar(conn, """
+            SELECT mes_referencia,
+                   count(DISTINCT uc) AS ucs,
+                   sum(consumo_kwh) AS consumo_kwh,
+                   sum(compensacao_kwh) AS compensacao_kwh,
+                   sum(total_cobranca) AS total_cobranca,
+                   sum(economia_rs) AS economia_rs
+            FROM analytics_incremental
+            GROUP BY mes_referencia
+            ORDER BY mes_referencia
+        """),
+        "distribuidoras": consultar(conn, """
+            SELECT mes_referencia, concessionaria,
+                   count(DISTINCT uc) AS ucs,
+                   sum(consumo_kwh) AS consumo_kwh,
+                   sum(compensacao_kwh) AS compensacao_kwh,
+                   sum(total_cobranca) AS total_cobranca,
+                   sum(economia_rs) AS economia_rs
+            FROM analytics_incremental
+            GROUP BY mes_referencia, concessionaria
+            ORDER BY mes_referencia, concessionaria
+        """),
+        "previsoes": consultar(conn, """
+            SELECT uc, concessionaria, mes_previsto, data_leitura_prevista, data_emissao_prevista,
+                   consumo_previsto_kwh, tarifa_estimada, valor_previsto
+            FROM previsoes_faturamento
+            ORDER BY data_emissao_prevista, uc
+        """),
+    }
+
+def fatia_uc(uc):
+    return str(uc)[-DIGITOS_FATIA_UC:].rjust(DIGITOS_FATIA_UC, "0")
+
+def montar_historicos(conn):
+    """{fatia: (colunas, linhas)}: histórico mês a mês de todas as UCs, agrupado pelo fim da UC."""
+    resultado = conn.execution_options(stream_results=True, yield_per=5000).execute(text(
+        "SELECT * FROM analytics_incremental ORDER BY uc, mes_referencia"
+    ))
+    colunas = [c for c in resultado.keys() if c != "atualizado_em"]
+    indices = [i for i, c in enumerate(resultado.keys()) if c != "atualizado_em"]
+    fatias = defaultdict(list)
+    for row in resultado:
+        fatias[fatia_uc(row.uc)].append([row[i] for i in indices])
+    return {fatia: (colunas, linhas) for fatia, linhas in fatias.items()}
+
+# --- PUBLICAÇÃO ---
+
+def publicar_arquivo(destino, prefixo, colunas, linhas):
+    conteudo, sha256 = empacotar(colunas, linhas)
+    nome = f"{prefixo}.{sha256[:16]}.json.gz"
+    # Mesmo hash = mesmo conteúdo já publicado: nada a enviar
+    if not destino.existe(nome):
+        destino.gravar(nome, conteudo, CACHE_IMUTAVEL, "application/gzip")
+    return {"arquivo": nome, "sha256": sha256, "linhas": len(linhas), "bytes": len(conteudo)}
+
+def arquivos_do_manifesto(manifesto):
+    if not manifesto: return set()
+    return {e["arquivo"] for e in manifesto.get("conjuntos", {}).values()} | \
+           {e["arquivo"] for e in manifesto.get("historicos_uc", {}).get("fatias", {}).values()}
+
+def gerar_snapshots(destino=None, pasta=None):
+    inicio = time.time()
+    destino = obter_destino(destino, pasta)
+    print("🚀 Gerando snapshots estáticos do dashboard...", flush=True)
+
+    anterior = destino.ler_manifesto()
+    with engine.connect() as conn:
+        # Uma transação REPEATABLE READ: todos os arquivos refletem o mesmo instante do banco
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            conjuntos = montar_conjuntos(conn)
+            historicos = montar_historicos(conn)
+
+    manifesto = {
+        "versao": 1,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "conjuntos": {nome: publicar_arquivo(destino, nome, *dados) for nome, dados in conjuntos.items()},
+        "historicos_uc": {
+            "digitos": DIGITOS_FATIA_UC,
+            "fatias": {fatia: publicar_arquivo(destino, f"historicos/uc_{fatia}", *dados)
+                       for fatia, dados in sorted(historicos.items())},
+        },
+    }
+    # O manifesto guarda os arquivos da versão anterior: quem abriu o dashboard antes ainda os
+    # referencia. Só o que nem a versão atual nem a anterior usam é apagado.
+    atuais, anteriores = arquivos_do_manifesto(manifesto), arquivos_do_manifesto(anterior)
+    manifesto["anteriores"] = sorted(anteriores - atuais)
+    destino.gravar("manifesto.json", json.dumps(manifesto, ensure_ascii=False, indent=2).encode("utf-8"),
+                   CACHE_MANIFESTO, "application/json")
+    for nome in set((anterior or {}).get("anteriores", [])) - atuais - anteriores:
+        destino.remover(nome)
+
+    total = sum(e["bytes"] for e in manifesto["conjuntos"].values()) + \
+            sum(e["bytes"] for e in manifesto["historicos_uc"]["fatias"].values())
+    print(f"✅ {len(manifesto['conjuntos'])} conjuntos e {len(historicos)} fatias de histórico "
+          f"({total / 1024:.0f} KB comprimidos) em {time.time() - inicio:.1f}s.")
+    return manifesto
@@ -1,59 +1,40 @@
 import requests
 import json
-import os
 import time
-import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from .config import Ajuste, engine, exigir
+from .esquema import aplicar_migracoes
+from .particoes import garantir_particoes
+from .alteracoes import filtrar_alterados, nova_execucao, registrar_alteracoes
+from .analytics_service import marcar_alteradas, manter_analytics
+from .sinais import sinalizar_fim_carga
+from .pipeline import executar_pipeline
+from .digest_paginas import DigestPaginas, assinatura
+from .concorrencia import LimitadorTaxa
 
-load_dotenv()
+FONTE = "unifica"
 
-# Configurações de Ambiente
-UNIFICA_URL = os.getenv("UNIFICA_BASE_URL")
-UNIFICA_TOKEN = os.getenv("UNIFICA_TOKEN")
-DB_URL = os.getenv("DATABASE_URL")
-CHECKPOINT_FILE = "unifica_checkpoint.txt"
+# Meses de date_ref mais recentes (status, pix e vencimentos ainda mudando): sincronizados em toda execução
+MESES_QUENTES = Ajuste("UNIFICA_MESES_QUENTES", "3", int)
+# Início do histórico varrido (ou o menor mes_referencia do raw_unifica, se for anterior)
+INICIO_HISTORICO = Ajuste("UNIFICA_INICIO_HISTORICO", "2023-01")
+# Meses baixados em paralelo e teto de requisições por segundo somando todos eles
+UNIFICA_PARALELISMO = Ajuste("UNIFICA_PARALELISMO", "3", int)
+UNIFICA_REQ_POR_SEGUNDO = Ajuste("UNIFICA_REQ_POR_SEGUNDO", "3", float)
 
-if UNIFICA_URL: UNIFICA_URL = UNIFICA_URL.rstrip("/")
-ENDPOINT = "/operacao/cobrancas"
+CHAVE_UNIFICA = {"uc": "text", "mes_referencia": "date"}
+COLUNAS_UNIFICA = [
+    "uc_aneel", "nome_cliente", "valor_fatura", "remuneracao_geracao", "consumo_kwh",
+    "energia_compensada", "economia_total", "status_pagamento", "vencimento", "codigo_barras",
+    "codigo_pix", "data_emissao_concessionaria", "vencimento_concessionaria", "data_emissao",
+    "link_fatura", "link_fatura_concessionaria", "kwh_balance_credits"
+]
 
-if not UNIFICA_URL or not UNIFICA_TOKEN or not DB_URL:
-    print("🛑 ERRO: Verifique variáveis no .env")
-    exit()
-
-# Engine com timeout de conexão para evitar que o script fique "pendurado" no banco
-engine = create_engine(
-    DB_URL, 
-    pool_pre_ping=True,
-    connect_args={'connect_timeout': 30}
-)
-
-def verificar_e_criar_colunas():
-    print("🛠️ Verificando estrutura da tabela raw_unifica...")
-    sqls = [
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS remuneracao_geracao numeric DEFAULT 0;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS consumo_kwh numeric DEFAULT 0;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS energia_compensada numeric DEFAULT 0;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS economia_total numeric DEFAULT 0;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS codigo_barras text;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS codigo_pix text;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS data_emissao_concessionaria date;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS vencimento_concessionaria date;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS data_emissao date;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS kwh_balance_credits numeric DEFAULT 0;",
-        "ALTER TABLE raw_unifica ADD COLUMN IF NOT EXISTS uc_aneel text;" ### NOVO: Criando a coluna uc_aneel
-    ]
-    
-    with engine.begin() as conn:
-        for sql in sqls:
-            try:
-                conn.execute(text(sql))
-            except Exception as e:
-                print(f"⚠️ Aviso ao ajustar tabela: {e}")
-    print("✅ Estrutura do banco validada.")
+ENDPOINT = "/operacao/cobrancas"
 
 def get_session():
     session = requests.Session()
@@ -104,12 +85,12 @@ def processar_item_unifica(item):
         "vencimento_concessionaria": tratar_data(item.get("dealership_bill_due_date")),
         "data_emissao": tratar_data(item.get("issue_date")),
         "link_fatura": item.get("billing_file_key") or item.get("dealership_bill_file_key"),
+        "link_fatura_concessionaria": item.get("dealership_bill_file_key"),
         "kwh_balance_credits": limpar_numero(item.get("kWh_balance_credits")),
         "updated_at": datetime.now()
     }
 
-def salvar_em_lotes(lista_itens, pagina_atual):
-    if not lista_itens: return
+def normalizar_lote(lista_itens):
     dados_prontos = []
     
     for x in lista_itens:
@@ -119,23 +100,28 @@ def salvar_em_lotes(lista_itens, pagina_atual):
                 dados_prontos.append(p)
         except Exception as e:
             print(f"❌ ERRO ao processar linha: {e}")
+    return dados_prontos
 
+def gravar_lote(dados_prontos, pagina_atual, execucao_id):
     if not dados_prontos: return
 
     with engine.begin() as conn:
-        for item in dados_prontos:
+        # Só regrava o que mudou desde a última carga (e registra as chaves para o analytics)
+        alterados = filtrar_alterados(conn, "raw_unifica", CHAVE_UNIFICA, COLUNAS_UNIFICA, dados_prontos, coluna_particao="mes_referencia")
+        if alterados:
             stmt = text("""
                 INSERT INTO raw_unifica (
                     uc, uc_aneel, mes_referencia, nome_cliente, valor_fatura, remuneracao_geracao, 
                     consumo_kwh, energia_compensada, economia_total, status_pagamento, 
                     vencimento, codigo_barras, codigo_pix, data_emissao_concessionaria, 
-                    vencimento_concessionaria, data_emissao, link_fatura, kwh_balance_credits, updated_at
+                    vencimento_concessionaria, data_emissao, link_fatura, link_fatura_concessionaria,
+                    kwh_balance_credits, updated_at
                 )
                 VALUES (
                     :uc, :uc_aneel, :mes, :nome, :val, :remun, 
                     :cons, :comp, :eco, :st, 
                     :venc, :bar, :pix, :emi_conc, 
-                    :venc_conc, :emi, :link, :saldo, :upd
+                    :venc_conc, :emi, :link, :link_conc, :saldo, :upd
                 )
                 ON CONFLICT (uc, mes_referencia) DO UPDATE SET
                     uc_aneel = EXCLUDED.uc_aneel,
@@ -153,125 +139,288 @@ def salvar_em_lotes(lista_itens, pagina_atual):
                     vencimento_concessionaria = EXCLUDED.vencimento_concessionaria,
                     data_emissao = EXCLUDED.data_emissao,
                     link_fatura = EXCLUDED.link_fatura,
+                    link_fatura_concessionaria = EXCLUDED.link_fatura_concessionaria,
                     kwh_balance_credits = EXCLUDED.kwh_balance_credits,
                     updated_at = EXCLUDED.updated_at;
             """)
             ### NOVO: Adicionado :uc_aneel abaixo
-            conn.execute(stmt, {
+            conn.execute(stmt, [{
                 "uc": item["uc"], "uc_aneel": item["uc_aneel"], "mes": item["mes_referencia"], "nome": item["nome_cliente"],
                 "val": item["valor_fatura"], "remun": item["remuneracao_geracao"],
                 "cons": item["consumo_kwh"], "comp": item["energia_compensada"], "eco": item["economia_total"],
                 "st": item["status_pagamento"], "venc": item["vencimento"], 
                 "bar": item["codigo_barras"], "pix": item["codigo_pix"], 
                 "emi_conc": item["data_emissao_concessionaria"], "venc_conc": item["vencimento_concessionaria"], 
-                "emi": item["data_emissao"], "link": item["link_fatura"], 
+                "emi": item["data_emissao"], "link": item["link_fatura"],
+                "link_conc": item["link_fatura_concessionaria"],
                 "saldo": item["kwh_balance_credits"], "upd": item["updated_at"]
-            })
-    print(f"✅ Unifica: Salvo lote de {len(dados_prontos)} registros da pág {pagina_atual}", flush=True)
+            } for item, _ in alterados])
+            marcar_alteradas(conn, [(item["uc"], item["mes_referencia"]) for item, _ in alterados], FONTE)
+            registrar_alteracoes(conn, execucao_id, FONTE, "raw_unifica", CHAVE_UNIFICA, alterados)
+    print(f"✅ Unifica: Lote da pág {pagina_atual}: {len(alterados)} de {len(dados_prontos)} registros alterados", flush=True)
+
+def listar_meses(inicio, fim):
+    ano, mes = map(int, inicio.split("-"))
+    ano_fim, mes_fim = map(int, fim.split("-"))
+    meses = []
+    while (ano, mes) <= (ano_fim, mes_fim):
+        meses.append(f"{ano:04d}-{mes:02d}")
+        mes += 1
+        if mes > 12: ano, mes = ano + 1, 1
+    return meses
+
+def planejar_particoes():
+    """
+    Retorna (quentes, frias): meses recentes primeiro; o histórico em rodízio pelas alterações
+    esperadas desde a última varredura (taxa de mudança do mês x tempo sem sincronizar).
+    """
+    with engine.begin() as conn:
+        primeiro = conn.execute(text("SELECT to_char(min(mes_referencia), 'YYYY-MM') FROM raw_unifica")).scalar()
+        registros = {
+            row.particao: row for row in conn.execute(text("""
+                SELECT particao, proxima_pagina, ultima_sync_completa, verificada
+                FROM sync_particoes WHERE fonte = :fonte
+            """), {"fonte": FONTE})
+        }
+        # Alterações por mês de referência nos últimos 30 dias (feed de alterações)
+        alteracoes_mes = dict(conn.execute(text("""
+            SELECT left(chave->>'mes_referencia', 7), count(*) FROM log_alteracoes
+            WHERE fonte = :fonte AND tabela = 'raw_unifica' AND registrado_em > now() - interval '30 days'
+            GROUP BY 1
+        """), {"fonte": FONTE}).all())
+
+    meses = listar_meses(min(primeiro or INICIO_HISTORICO(), INICIO_HISTORICO()), datetime.now().strftime("%Y-%m"))
+    quentes = list(reversed(meses[-MESES_QUENTES():]))
+    frias = meses[:-MESES_QUENTES()]
+
+    agora = datetime.now()
+
+    def prioridade_fria(mes):
+        reg = registros.get(mes)
+        if not reg or not reg.ultima_sync_completa: return (0, 0, mes)
+        # Varreduras interrompidas ou que não bateram com o meta.total vêm antes de um mês novo
+        em_andamento = 0 if reg.proxima_pagina > 1 or reg.verificada is False else 1
+        # (alterações + 1) x dias parado: mês que nunca muda ainda volta, só que bem mais devagar
+        dias = max((agora - reg.ultima_sync_completa.replace(tzinfo=None)).total_seconds() / 86400, 0)
+        return (em_andamento, -(alteracoes_mes.get(mes, 0) + 1) * dias, mes)
+
+    frias.sort(key=prioridade_fria)
+    return quentes, frias, registros
+
+def salvar_checkpoint(mes, proxima_pagina, registros=0, concluida=False):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO sync_particoes (fonte, particao, proxima_pagina, registros, ultima_tentativa, ultima_sync_completa)
+            VALUES (:fonte, :mes, :pag, :reg, now(), CASE WHEN :concluida THEN now() END)
+            ON CONFLICT (fonte, particao) DO UPDATE SET
+                proxima_pagina = EXCLUDED.proxima_pagina,
+                registros = CASE WHEN :concluida THEN EXCLUDED.registros ELSE sync_particoes.registros END,
+                ultima_tentativa = EXCLUDED.ultima_tentativa,
+                ultima_sync_completa = coalesce(EXCLUDED.ultima_sync_completa, sync_particoes.ultima_sync_completa);
+        """), {"fonte": FONTE, "mes": mes, "pag": 1 if concluida else proxima_pagina, "reg": registros, "concluida": concluida})
 
-def carregar_checkpoint():
-    if os.path.exists(CHECKPOINT_FILE):
+def baixar_resposta(session, full_url, headers, params):
+    """Retorna a resposta (200 ou 304), None quando a API sinaliza fim dos dados (404) e levanta erro após 5 falhas."""
+    tentativas_pag = 0
+    while tentativas_pag < 5:
         try:
-            with open(CHECKPOINT_FILE, "r") as f:
-                val = int(f.read().strip())
-                print(f"📂 Checkpoint encontrado! Retomando da página {val}.")
-                return val
-        except: pass
-    return 1
-
-def salvar_checkpoint(page):
-    with open(CHECKPOINT_FILE, "w") as f:
-        f.write(str(page))
-
-def executar_sync_unifica():
-    verificar_e_criar_colunas()
-    
+            # Timeout explícito na requisição
+            resp = session.get(full_url, headers=headers, params=params, timeout=45)
+
+            if resp.status_code in (200, 304):
+                return resp
+            elif resp.status_code == 429:
+                print(f"\n⏳ Rate Limit (429) na pág {params['page']}. Aguardando 30s...")
+                time.sleep(30)
+            elif resp.status_code == 404:
+                return None
+            else:
+                print(f"\n⚠️ Erro {resp.status_code} na pág {params['page']}. Tentativa {tentativas_pag+1}/5")
+                time.sleep(10)
+
+            tentativas_pag += 1
+
+        except Exception as e:
+            tentativas_pag += 1
+            print(f"\n⚠️ Falha de conexão na pág {params['page']} ({tentativas_pag}/5): {e}")
+            time.sleep(15)
+
+    raise RuntimeError(f"Não foi possível carregar a página {params['page']} após 5 tentativas.")
+
+def baixar_pagina(session, full_url, headers, params):
+    """Retorna o JSON da página, None quando a API sinaliza fim dos dados (404) e levanta erro após 5 falhas."""
+    resp = baixar_resposta(session, full_url, headers, params)
+    return resp.json() if resp is not None else None
+
+def verificar_particao(mes, total_api, recebidos, desde_inicio):
+    """Confere o meta.total da API com o que foi recebido nesta execução e com o que está no banco."""
+    with engine.begin() as conn:
+        total_banco = conn.execute(text("""
+            SELECT count(*) FROM raw_unifica WHERE mes_referencia = CAST(:mes AS date)
+        """), {"mes": f"{mes}-01"}).scalar()
+        # Só dá para exigir recebidos == total quando o mês foi lido da primeira à última página
+        verificada = total_api is None or (recebidos == total_api if desde_inicio else total_banco <= total_api)
+        conn.execute(text("""
+            UPDATE sync_particoes SET total_api = :api, total_banco = :banco, verificada = :ok
+            WHERE fonte = :fonte AND particao = :mes
+        """), {"api": total_api, "banco": total_banco, "ok": verificada, "fonte": FONTE, "mes": mes})
+    if not verificada:
+        print(f"\n⚠️ {mes}: API informa {total_api} faturas, recebidas {recebidos}, no banco {total_banco}. "
+              "O mês volta para a fila na próxima execução.", flush=True)
+    return verificada
+
+def sincronizar_particao(mes, pagina_inicial, execucao_id, prazo=None, limitador=None, parar=None):
+    """
+    Sincroniza um mês de date_ref a partir do checkpoint. Retorna (concluida, registros_baixados, paginas_puladas).
+    execucao_id: identifica a execução no feed de alterações (log_alteracoes).
+    parar: threading.Event opcional (modo fila) que interrompe no próximo limite de página.
+    """
+    unifica_url, unifica_token = exigir("UNIFICA_BASE_URL", "UNIFICA_TOKEN")
+    headers = {"Authorization": f"Bearer {unifica_token}", "Content-Type": "application/json", "accept": "*/*"}
+    full_url = f"{unifica_url.rstrip('/')}{ENDPOINT}"
+    # Uma sessão por partição: as partições rodam em threads diferentes
+    session = get_session()
+    per_page = 50
+    digests = DigestPaginas(engine, FONTE, mes)
+    estado = {"concluida": False, "total": 0, "total_api": None, "interrompida_em": None}
+
+    def paginas():
+        page = pagina_inicial
+        while True:
+            if (prazo and time.time() > prazo) or (parar and parar.is_set()):
+                estado["interrompida_em"] = page
+                return
+
+            # Respiro compartilhado entre as partições para não sobrecarregar a API
+            if limitador: limitador.aguardar()
+            params = {"page": page, "per_page": per_page, "date_ref": mes}
+            resp = baixar_resposta(session, full_url, {**headers, **digests.condicionais(page)}, params)
+            anterior = digests.inalterada(page, resp) if resp is not None else None
+            if anterior:
+                # Mesmo corpo da execução anterior: nem decodifica, usa a paginação guardada
+                lista, meta, itens = [], anterior["meta"], anterior["itens"]
+            else:
+                dados = resp.json() if resp is not None else None
+                lista = dados.get("data", []) if dados else []
+                meta = {k: v for k, v in (dados or {}).get("meta", {}).items() if k in ("total", "last_page")}
+                itens = len(lista)
+            if meta.get("total") is not None: estado["total_api"] = meta["total"]
+            last_page = meta.get("last_page")
+            fim = not itens or bool(last_page and page >= last_page)
+            yield {"page": page, "lista": lista, "fim": fim, "inalterada": bool(anterior), "itens": itens,
+                   "meta": meta, "assinatura": assinatura(resp) if resp is not None else None}
+            if fim: return
+
+            page += 1
+
+    def gravar(dados_prontos, pagina):
+        if pagina["inalterada"]:
+            digests.pular()
+        else:
+            gravar_lote(dados_prontos, f"{pagina['page']} ({mes})", execucao_id)
+            digests.guardar(pagina["page"], pagina["assinatura"], pagina["meta"], pagina["itens"])
+        estado["total"] += pagina["itens"]
+        if pagina["fim"]:
+            salvar_checkpoint(mes, 1, (pagina_inicial - 1) * per_page + estado["total"], concluida=True)
+            estado["concluida"] = True
+        else:
+            # Salva o progresso para a próxima execução (sempre na ordem das páginas)
+            salvar_checkpoint(mes, pagina["page"] + 1)
+
+    # Download da página N+1 em paralelo com a gravação da página N
+    executar_pipeline(paginas(), lambda pagina: normalizar_lote(pagina["lista"]), gravar)
+
+    if estado["interrompida_em"]:
+        print(f"\n🕒 {mes} interrompido na página {estado['interrompida_em']}. Checkpoint salvo.")
+    if estado["concluida"]:
+        verificar_particao(mes, estado["total_api"], estado["total"], pagina_inicial == 1)
+    if digests.puladas:
+        print(f"\n⏭️ {mes}: {digests.puladas} páginas iguais às da execução anterior, puladas.", flush=True)
+    return estado["concluida"], estado["total"], digests.puladas
+
+def executar_sync_unifica(meses=None, so_quentes=False):
+    aplicar_migracoes(engine)
+    garantir_particoes(engine)
+
     # Controle de tempo para evitar o limite de 6h do GitHub
     start_time = time.time()
     max_duration = 50 * 60  # Para em 50 minutos para salvar o estado com segurança
-    
+    prazo = start_time + max_duration
+
     print(f"🚀 Iniciando Sync Unifica às {datetime.now().strftime('%H:%M:%S')}")
-    
-    headers = {"Authorization": f"Bearer {UNIFICA_TOKEN}", "Content-Type": "application/json", "accept": "*/*"}
-    full_url = f"{UNIFICA_URL}{ENDPOINT}"
-    session = get_session()
-    
-    page = carregar_checkpoint() 
-    per_page = 50
-    total_baixado = 0
-    
-    while True:
-        # Verificação de segurança de tempo
-        if time.time() - start_time > max_duration:
-            print("\n🕒 LIMITE DE TEMPO PREVENTIVO (50 min) ATINGIDO.")
-            print(f"Parando na página {page}. O checkpoint foi salvo para a próxima execução.")
-            break
-
-        params = {"page": page, "per_page": per_page}
-        tentativas_pag = 0
-        sucesso = False
-        
-        while tentativas_pag < 5:
-            try:
-                # Timeout explícito na requisição
-                resp = session.get(full_url, headers=headers, params=params, timeout=45)
-                
-                if resp.status_code == 200:
-                    sucesso = True
-                    break
-                elif resp.status_code == 429:
-                    print(f"\n⏳ Rate Limit (429) na pág {page}. Aguardando 30s...")
-                    time.sleep(30)
-                elif resp.status_code == 404:
-                    print(f"\n🏁 Página {page} retornou 404. Fim dos dados.")
-                    if os.path.exists(CHECKPOINT_FILE): os.remove(CHECKPOINT_FILE)
-                    return
-                else:
-                    print(f"\n⚠️ Erro {resp.status_code} na pág {page}. Tentativa {tentativas_pag+1}/5")
-                    time.sleep(10)
-                
-                tentativas_pag += 1
-
-            except Exception as e:
-                tentativas_pag += 1
-                print(f"\n⚠️ Falha de conexão na pág {page} ({tentativas_pag}/5): {e}")
-                time.sleep(15)
-
-        if not sucesso:
-            print(f"❌ Não foi possível carregar a página {page} após 5 tentativas. Abortando para evitar loop.")
-            break
 
+    if meses:
+        # Atualização pontual de meses específicos: do início, sem orçamento de tempo
+        quentes, frias, registros = sorted(meses, reverse=True), [], {}
+    else:
+        quentes, frias, registros = planejar_particoes()
+        # Passada leve (planejador): só os meses quentes, o rodízio do histórico fica para a varredura
+        if so_quentes: frias = []
+    limitador = LimitadorTaxa(UNIFICA_REQ_POR_SEGUNDO())
+    execucao_id = nova_execucao(FONTE)
+    resultados, falhas = {}, []
+
+    def sync_mes(mes, pagina_inicial, prazo_mes):
+        if prazo_mes and time.time() > prazo_mes: return
         try:
-            dados = resp.json()
-            lista = dados.get("data", [])
-            
-            if not lista: 
-                print(f"\n🏁 Lista vazia na página {page}. Sincronização concluída.")
-                if os.path.exists(CHECKPOINT_FILE): os.remove(CHECKPOINT_FILE)
-                break
-            
-            salvar_em_lotes(lista, page)
-            total_baixado += len(lista)
-            
-            # Salva o progresso para a próxima execução
-            salvar_checkpoint(page + 1)
-            
-            meta = dados.get("meta", {})
-            last_page = meta.get("last_page")
-            if last_page and page >= last_page:
-                print(f"\n🏁 Última página ({last_page}) atingida com sucesso.")
-                if os.path.exists(CHECKPOINT_FILE): os.remove(CHECKPOINT_FILE)
-                break
-                
-            page += 1
-            # Pequeno respiro para não sobrecarregar a API
-            time.sleep(0.3) 
-            
+            resultados[mes] = sincronizar_particao(mes, pagina_inicial, execucao_id, prazo_mes, limitador)
         except Exception as e:
-            print(f"\n❌ Erro ao processar JSON da página {page}: {e}")
-            break
+            falhas.append(mes)
+            print(f"\n❌ Erro no mês {mes}: {e}")
+
+    with ThreadPoolExecutor(max_workers=UNIFICA_PARALELISMO()) as pool:
+        # 1. Meses quentes: sempre sincronizados por completo, em toda execução
+        print(f"🔥 Meses quentes: {', '.join(quentes)}")
+        list(pool.map(lambda mes: sync_mes(mes, 1, None), quentes))
+
+        if time.time() > prazo:
+            print("\n⚠️ Os meses quentes sozinhos consumiram todo o orçamento de tempo.")
+
+        # 2. Histórico: fatias em rodízio até o orçamento acabar
+        if frias: print(f"🧊 Histórico: {len(frias)} meses na fila (mais desatualizado primeiro)")
+        list(pool.map(lambda mes: sync_mes(mes, registros[mes].proxima_pagina if mes in registros else 1, prazo), frias))
+        if frias and time.time() > prazo:
+            print("\n🕒 LIMITE DE TEMPO PREVENTIVO (50 min) ATINGIDO. O rodízio continua na próxima execução.")
+
+    concluidas = [mes for mes, (concluida, _, _) in resultados.items() if concluida]
+    total_baixado = sum(baixados for _, baixados, _ in resultados.values())
+    puladas = sum(puladas for _, _, puladas in resultados.values())
+    print(f"\n✅ Sincronização encerrada. {len(concluidas)} meses atualizados, {total_baixado} registros processados, "
+          f"{puladas} páginas inalteradas puladas.")
+    if falhas: print(f"❌ Meses com erro: {', '.join(sorted(falhas))}")
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, FONTE)
+    return not falhas
+
+def executar_sync_unifica_fila(rodada=None, paralelismo=None):
+    """
+    Modo fila: cada mês de date_ref é uma unidade em fila_trabalho. Vários runners podem rodar
+    ao mesmo tempo com a mesma rodada; cada mês é baixado por um só deles, retomando do checkpoint.
+    """
+    from .fila import LimitadorCompartilhado, executar_trabalhador, publicar_unidades, rodada_padrao
+
+    aplicar_migracoes(engine)
+    garantir_particoes(engine)
+    rodada = rodada or rodada_padrao()
+    prazo = time.time() + 50 * 60
+    execucao_id = nova_execucao(FONTE)
+
+    # Todos os runners publicam o mesmo plano; o que já está na fila da rodada é mantido
+    quentes, frias, _ = planejar_particoes()
+    unidades = [(mes, {}, 0) for mes in quentes] + [(mes, {}, i + 1) for i, mes in enumerate(frias)]
+    novas = publicar_unidades(engine, FONTE, rodada, unidades)
+    print(f"🚀 Sync Unifica em modo fila (rodada {rodada}): {novas} meses novos na fila.", flush=True)
 
-    print(f"\n✅ Sincronização encerrada. Total de registros processados: {total_baixado}")
+    def processar(mes, parametros, parar):
+        # O checkpoint é relido aqui: outro runner pode ter avançado o mês antes de a concessão vencer
+        with engine.begin() as conn:
+            pagina = conn.execute(text("""
+                SELECT proxima_pagina FROM sync_particoes WHERE fonte = :fonte AND particao = :mes
+            """), {"fonte": FONTE, "mes": mes}).scalar() or 1
+        concluida, _, _ = sincronizar_particao(mes, pagina, execucao_id, prazo, limitador, parar)
+        return concluida
 
-if __name__ == "__main__":
-    executar_sync_unifica()
\ No newline at end of file
+    limitador = LimitadorCompartilhado(UNIFICA_REQ_POR_SEGUNDO())
+    executar_trabalhador(engine, FONTE, rodada, processar, limitador, paralelismo or UNIFICA_PARALELISMO(), prazo)
+    manter_analytics(engine)
+    sinalizar_fim_carga(engine, FONTE)
@@ -0,0 +1,55 @@
+// Cache do pré-carregador de documentos (python -m services documentos), compartilhado pelas
+// funções: o PDF fica no Storage endereçado pelo sha256 e indexado na tabela cache_documentos
+
+function credenciais() {
+  const url = Deno.env.get('SUPABASE_URL')
+  const chave = Deno.env.get('SUPABASE_SERVICE_ROLE_KEY')
+  if (!url || !chave) return null
+  return { url, headers: { 'Authorization': `Bearer ${chave}`, 'apikey': chave } }
+}
+
+const bucket = () => Deno.env.get('DOCUMENTOS_BUCKET') ?? 'documentos'
+
+// Caminho no bucket do documento já baixado, ou null se ainda não está no cache
+async function localizarNoCache(filtros: Record<string, string>): Promise<string | null> {
+  const cred = credenciais()
+  if (!cred) return null
+  const query = Object.entries(filtros).map(([coluna, valor]) => `${coluna}=eq.${encodeURIComponent(valor)}`).join('&')
+  const resCache = await fetch(`${cred.url}/rest/v1/cache_documentos?select=armazenamento,local&status=eq.ok&${query}`, { headers: cred.headers })
+  const linhas = await resCache.json()
+  const doc = Array.isArray(linhas) ? linhas.find((l: any) => l.armazenamento === 'supabase') : null
+  return doc ? doc.local : null
+}
+
+// Bytes do boleto Lumi: evita logar na Lumi e pedir a geração do PDF de novo
+export async function buscarBoletoNoCache(driveId: string): Promise<Uint8Array | null> {
+  try {
+    const local = await localizarNoCache({ origem: 'lumi_boleto', chave: driveId })
+    const cred = credenciais()
+    if (!local || !cred) return null
+    const resArquivo = await fetch(`${cred.url}/storage/v1/object/${bucket()}/${local}`, { headers: cred.headers })
+    if (!resArquivo.ok) return null
+    return new Uint8Array(await resArquivo.arrayBuffer())
+  } catch {
+    return null
+  }
+}
+
+// URL assinada (temporária) do documento no Storage, no mesmo formato que a plataforma devolve
+export async function urlAssinadaDoCache(filtros: Record<string, string>, segundos = 3600): Promise<string | null> {
+  try {
+    const local = await localizarNoCache(filtros)
+    const cred = credenciais()
+    if (!local || !cred) return null
+    const resAssinatura = await fetch(`${cred.url}/storage/v1/object/sign/${bucket()}/${local}`, {
+      method: 'POST',
+      headers: { ...cred.headers, 'Content-Type': 'application/json' },
+      body: JSON.stringify({ expiresIn: segundos })
+    })
+    if (!resAssinatura.ok) return null
+    const { signedURL } = await resAssinatura.json()
+    return signedURL ? `${cred.url}/storage/v1${signedURL}` : null
+  } catch {
+    return null
+  }
+}
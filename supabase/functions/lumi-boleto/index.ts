@@ -1,4 +1,5 @@
 import "@supabase/functions-js/edge-runtime.d.ts"
+import { buscarBoletoNoCache } from "../_shared/cacheDocumentos.ts"
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
@@ -32,6 +33,10 @@ Deno.serve(async (req) => {
 
     if (!month || !year) throw new Error("Mês de referência inválido.");
 
+    const driveId = `${uc}-${month}-${year}`;
+    let byteArray = await buscarBoletoNoCache(driveId);
+
+    if (!byteArray) {
     // 3. Fazer Login na Lumi
     const loginRes = await fetch("https://api.labs-lumi.com.br/login", {
       method: "POST",
@@ -46,7 +51,6 @@ Deno.serve(async (req) => {
     const token = loginData.token;
 
     // 4. Buscar o Buffer do Boleto
-    const driveId = `${uc}-${month}-${year}`;
     const boletoRes = await fetch("https://api.labs-lumi.com.br/pagamentos/preview-cobranca/location", {
       method: "POST",
       headers: { 
@@ -60,9 +64,10 @@ Deno.serve(async (req) => {
     if (boletoData.status !== 'successo' || !boletoData.data?.toRender?.data) {
       throw new Error("Boleto não encontrado na Lumi para este período.");
     }
+    byteArray = new Uint8Array(boletoData.data.toRender.data);
+    }
 
     // 5. Converter Buffer (Array de Bytes) para Base64 para mandar pro React
-    const byteArray = new Uint8Array(boletoData.data.toRender.data);
     let binaryString = "";
     for (let i = 0; i < byteArray.byteLength; i++) {
         binaryString += String.fromCharCode(byteArray[i]);
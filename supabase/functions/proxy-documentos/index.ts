@@ -1,4 +1,5 @@
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts"
+import { buscarBoletoNoCache, urlAssinadaDoCache } from "../_shared/cacheDocumentos.ts"
 
 const corsHeaders = {
   'Access-Control-Allow-Origin': '*',
@@ -14,6 +15,16 @@ serve(async (req) => {
     // --- ROTA 1: PLATAFORMA GESTÃO (UNIFICA) ---
     if (action === 'GESTAO_DOC') {
         const { uc, refYm, tipoDoc } = payload;
+
+        // A fatura da concessionária já pré-carregada sai do Storage, sem passar pela plataforma
+        // (origem própria: o 'unifica' guarda o boleto quando ele existe)
+        if (tipoDoc !== 'BOLETO') {
+            const cacheada = await urlAssinadaDoCache({ origem: 'unifica_concessionaria', uc: String(uc), mes_referencia: `${String(refYm).slice(0, 7)}-01` });
+            if (cacheada) {
+                return new Response(JSON.stringify({ url: cacheada }), { headers: { ...corsHeaders, 'Content-Type': 'application/json' }});
+            }
+        }
+
         // Puxa o Token das secrets do Supabase
         const token = Deno.env.get('GESTAO_TOKEN'); 
 
@@ -41,6 +52,14 @@ serve(async (req) => {
     // --- ROTA 2: LUMI BOLETOS (Geração em PDF) ---
     if (action === 'LUMI_BOLETO') {
         const { uc, mesRef } = payload;
+        const parts = mesRef.split('/');
+        const driveId = `${uc}-${parts[0]}-${parts[1]}`;
+
+        const cacheado = await buscarBoletoNoCache(driveId);
+        if (cacheado) {
+            return new Response(JSON.stringify({ buffer: Array.from(cacheado) }), { headers: { ...corsHeaders, 'Content-Type': 'application/json' }});
+        }
+
         const email = Deno.env.get('LUMI_EMAIL');
         const senha = Deno.env.get('LUMI_SENHA');
 
@@ -52,8 +71,6 @@ serve(async (req) => {
         const loginData = await resLogin.json();
         if (loginData.status !== 'sucesso') throw new Error("Falha de autenticação na Lumi.");
 
-        const parts = mesRef.split('/');
-        const driveId = `${uc}-${parts[0]}-${parts[1]}`;
         const resBoleto = await fetch('https://api.labs-lumi.com.br/pagamentos/preview-cobranca/location', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${loginData.token}` },
@@ -0,0 +1,31 @@
+import threading
+import time
+from services.concorrencia import LimitadorTaxa
+
+def test_rajada_padrao_e_um_segundo_de_requisicoes():
+    limitador = LimitadorTaxa(10)
+    inicio = time.monotonic()
+    for _ in range(10): limitador.aguardar()
+    assert time.monotonic() - inicio < 0.1
+
+def test_rajada_inicial_sem_espera():
+    limitador = LimitadorTaxa(1, rajada=5)
+    inicio = time.monotonic()
+    for _ in range(5): limitador.aguardar()
+    assert time.monotonic() - inicio < 0.1
+
+def test_respeita_a_taxa_depois_da_rajada():
+    limitador = LimitadorTaxa(20, rajada=1)
+    inicio = time.monotonic()
+    # 1 token de rajada + 4 a 20/s = ~0,2 s
+    for _ in range(5): limitador.aguardar()
+    assert time.monotonic() - inicio >= 0.18
+
+def test_taxa_dividida_entre_threads():
+    limitador = LimitadorTaxa(50, rajada=1)
+    inicio = time.monotonic()
+    threads = [threading.Thread(target=lambda: [limitador.aguardar() for _ in range(5)]) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    # 20 requisições a 50/s, com 1 de rajada: ~0,38 s no total, não 5 x 0,1 s por thread em paralelo
+    assert time.monotonic() - inicio >= 0.35
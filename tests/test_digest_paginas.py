@@ -0,0 +1,45 @@
+import hashlib
+from types import SimpleNamespace
+from services.digest_paginas import DigestPaginas, assinatura
+
+def resposta(conteudo=b"", status=200, **cabecalhos):
+    return SimpleNamespace(content=conteudo, status_code=status, headers=cabecalhos)
+
+def digest(anteriores):
+    # Só o estado lido do banco: comparação e cabeçalhos não consultam nada
+    d = DigestPaginas.__new__(DigestPaginas)
+    d.anteriores, d.puladas = anteriores, 0
+    return d
+
+def registro(conteudo, etag=None, last_modified=None):
+    return {"pagina": 1, "sha256": hashlib.sha256(conteudo).hexdigest(), "etag": etag,
+            "last_modified": last_modified, "meta": {}, "itens": 1}
+
+def test_assinatura_guarda_sha256_e_validadores():
+    a = assinatura(resposta(b"[1]", ETag='"v1"', **{"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}))
+    assert a == {"sha256": hashlib.sha256(b"[1]").hexdigest(), "etag": '"v1"',
+                 "last_modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+
+def test_assinatura_de_304_nao_tem_corpo():
+    assert assinatura(resposta(status=304, ETag='"v1"'))["sha256"] is None
+
+def test_mesmo_corpo_e_inalterado():
+    anterior = registro(b"[1,2]")
+    assert digest({1: anterior}).inalterada(1, resposta(b"[1,2]")) is anterior
+
+def test_corpo_diferente_e_alterado():
+    assert digest({1: registro(b"[1,2]")}).inalterada(1, resposta(b"[1,3]")) is None
+
+def test_304_e_inalterado():
+    anterior = registro(b"[1,2]", etag='"v1"')
+    assert digest({1: anterior}).inalterada(1, resposta(status=304)) is anterior
+
+def test_pagina_sem_registro_anterior():
+    d = digest({})
+    assert d.inalterada(1, resposta(b"[1]")) is None
+    assert d.condicionais(1) == {}
+
+def test_condicionais_com_os_validadores_guardados():
+    d = digest({1: registro(b"", etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT"), 2: registro(b"")})
+    assert d.condicionais(1) == {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert d.condicionais(2) == {}
@@ -0,0 +1,33 @@
+from decimal import Decimal
+from services.extratos_comissao import COLUNAS_EXTRATO, _nome_arquivo, assinar, gerar_extrato
+
+def linha(uc, comissao):
+    return {"papel": "Parceiro", "uc": uc, "cliente": "Cliente", "concessionaria": "CEMIG",
+            "parceiro_unidade": None, "consumo_kwh": Decimal("100"), "compensacao_kwh": Decimal("90"),
+            "total_cobranca": Decimal("200.00"), "percentual": Decimal("5"), "comissao": comissao}
+
+def test_assinatura_estavel_e_sensivel_ao_conteudo():
+    linhas = [linha("1", Decimal("10.00"))]
+    assert assinar(linhas) == assinar([linha("1", Decimal("10.00"))])
+    assert assinar(linhas) != assinar([linha("1", Decimal("10.01"))])
+    assert assinar(linhas) != assinar(linhas + [linha("2", None)])
+
+def test_nome_de_arquivo_estavel_por_beneficiario():
+    assert _nome_arquivo("José / Parceiros") == _nome_arquivo("José / Parceiros")
+    assert _nome_arquivo("José / Parceiros").startswith("José_Parceiros_")
+
+def test_nomes_que_limpam_igual_nao_colidem():
+    # Viram o mesmo texto limpo, mas são beneficiários diferentes
+    assert _nome_arquivo("ACME/SP") != _nome_arquivo("ACME SP")
+    assert _nome_arquivo("///") != _nome_arquivo("???")
+    assert _nome_arquivo("///").startswith("beneficiario_")
+
+def test_gerar_extrato_soma_comissoes(tmp_path):
+    from openpyxl import load_workbook
+    caminho = tmp_path / "extrato.xlsx"
+    entrada = gerar_extrato("Parceiro X", "2024-03", [linha("1", Decimal("10.00")), linha("2", None)], str(caminho))
+    assert entrada["linhas"] == 2
+    assert entrada["total_comissao"] == 10.0
+    linhas = list(load_workbook(caminho).active.iter_rows(values_only=True))
+    assert linhas[3] == tuple(titulo for _, titulo in COLUNAS_EXTRATO)
+    assert linhas[-1][0] == "Total" and linhas[-1][-1] == 10.0
@@ -0,0 +1,19 @@
+from services.fila import LimitadorCompartilhado
+
+def test_orcamento_dividido_entre_trabalhadores_vivos():
+    limitador = LimitadorCompartilhado(12)
+    limitador.dividir(3)
+    assert limitador.por_segundo == 4
+    assert limitador.capacidade == 4
+
+def test_sem_trabalhadores_vivos_fica_com_o_total():
+    limitador = LimitadorCompartilhado(6)
+    limitador.dividir(0)
+    assert limitador.por_segundo == 6
+
+def test_rajada_nunca_abaixo_de_uma_requisicao():
+    limitador = LimitadorCompartilhado(1)
+    limitador.dividir(4)
+    assert limitador.por_segundo == 0.25
+    assert limitador.capacidade == 1
+    assert limitador.tokens <= 1
@@ -0,0 +1,74 @@
+import math
+from collections import namedtuple
+from datetime import datetime, timedelta
+from services.planejador import TAREFAS_SYNC, decidir, estimar
+
+Execucao = namedtuple("Execucao", "iniciada_em terminada_em alteracoes")
+AGORA = datetime(2026, 3, 10, 12, 0)
+CONFIG = {"minimo": 2, "maximo": 24, "custo": 5}
+
+def execucao(horas_atras, alteracoes, minutos=10):
+    inicio = AGORA - timedelta(hours=horas_atras)
+    return Execucao(inicio, inicio + timedelta(minutes=minutos), alteracoes)
+
+def test_estimar_taxa_e_custo():
+    # Mais recente primeiro: 10 alterações nas 2 h desde a anterior, 30 nas 6 h antes dela
+    execucoes = [execucao(4, 10, minutos=6), execucao(6, 30, minutos=12), execucao(12, 0, minutos=9)]
+    taxa, custo = estimar(execucoes, CONFIG)
+    assert taxa == 40 / 8
+    assert custo == 9
+
+def test_estimar_uma_execucao_nao_da_taxa():
+    taxa, custo = estimar([execucao(3, 5)], CONFIG)
+    assert taxa is None
+    assert custo == 10
+
+def test_estimar_sem_historico_usa_custo_configurado():
+    assert estimar([], CONFIG) == (None, 5)
+
+def test_estimar_limita_intervalo_a_uma_semana():
+    taxa, _ = estimar([execucao(1, 168), execucao(1000, 0)], CONFIG)
+    assert taxa == 1
+
+def test_estimar_ignora_execucao_sem_medicao():
+    taxa, _ = estimar([execucao(1, None), execucao(3, 20), execucao(5, 0)], CONFIG)
+    assert taxa == 10
+
+def test_decidir_sem_historico_roda_primeiro():
+    rodar, prioridade, _ = decidir("rd", CONFIG, [], AGORA)
+    assert rodar and math.isinf(prioridade)
+
+def test_decidir_respeita_intervalo_minimo():
+    rodar, _, motivo = decidir("rd", CONFIG, [execucao(1, 100), execucao(2, 100)], AGORA)
+    assert not rodar
+    assert "mínimo" in motivo
+
+def test_decidir_intervalo_maximo_passa_na_frente():
+    rodar, prioridade, _ = decidir("rd", CONFIG, [execucao(30, 0), execucao(60, 0)], AGORA)
+    assert rodar and prioridade > 1e6
+
+def test_decidir_aguarda_historico_para_estimar():
+    rodar, _, motivo = decidir("rd", CONFIG, [execucao(5, 3)], AGORA)
+    assert not rodar
+    assert "aguardando" in motivo
+
+def test_decidir_pela_taxa_de_alteracoes():
+    # 1 alteração/h, 10 min por execução: em 3 h, 3 alterações esperadas
+    rodar, prioridade, _ = decidir("rd", CONFIG, [execucao(3, 1), execucao(4, 0)], AGORA)
+    assert rodar
+    assert prioridade == 3 / 10
+
+def test_decidir_fonte_parada_nao_roda():
+    rodar, _, _ = decidir("rd", CONFIG, [execucao(3, 0), execucao(4, 0)], AGORA)
+    assert not rodar
+
+def test_limiar_lido_na_hora_da_decisao(monkeypatch):
+    execucoes = [execucao(3, 1), execucao(4, 0)]
+    monkeypatch.setenv("PLANEJADOR_LIMIAR_ALTERACOES", "5")
+    assert not decidir("rd", CONFIG, execucoes, AGORA)[0]
+    monkeypatch.setenv("PLANEJADOR_LIMIAR_ALTERACOES", "2")
+    assert decidir("rd", CONFIG, execucoes, AGORA)[0]
+
+def test_intervalos_das_tarefas_coerentes():
+    for nome, config in TAREFAS_SYNC.items():
+        assert 0 < config["minimo"] <= config["maximo"], nome
@@ -0,0 +1,62 @@
+from datetime import date
+import pandas as pd
+import pytest
+from services.previsoes import calcular_previsoes, proxima_data
+
+def test_proxima_data_no_mes_ou_no_seguinte():
+    dias = pd.Series([10, 5, 20])
+    referencia = pd.Series(pd.to_datetime(["2024-03-05", "2024-03-20", "2024-03-20"]))
+    assert list(proxima_data(dias, referencia).dt.date) == [date(2024, 3, 10), date(2024, 4, 5), date(2024, 3, 20)]
+
+def test_proxima_data_dia_alem_do_fim_do_mes():
+    dias = pd.Series([31, 31])
+    referencia = pd.Series(pd.to_datetime(["2024-02-10", "2023-02-28"]))
+    assert list(proxima_data(dias, referencia).dt.date) == [date(2024, 2, 29), date(2023, 2, 28)]
+
+def test_proxima_data_sem_dia_fica_vazia():
+    resultado = proxima_data(pd.Series([None, "x"]), pd.Series(pd.to_datetime(["2024-03-05", "2024-03-05"])))
+    assert resultado.isna().all()
+
+def entradas():
+    crm = pd.DataFrame([
+        {"uc": "A", "concessionaria": "CEMIG", "dia_leitura": 10, "consumo_medio_mwh": 1.0},
+        {"uc": "B", "concessionaria": "ENEL", "dia_leitura": 2, "consumo_medio_mwh": 2.0},
+    ])
+    historico = pd.DataFrame([
+        {"uc": "A", "mes_referencia": date(2024, 2, 1), "consumo_kwh": 100, "total_cobranca": 80},
+        {"uc": "A", "mes_referencia": date(2024, 1, 1), "consumo_kwh": 200, "total_cobranca": 160},
+    ])
+    emissoes = pd.DataFrame([
+        {"uc": "A", "data_emissao": date(2024, 2, 15)},
+        {"uc": "A", "data_emissao": date(2024, 1, 15)},
+    ])
+    return crm, historico, emissoes
+
+def test_calcular_previsoes_com_historico(monkeypatch):
+    monkeypatch.setenv("PREVISAO_DECAIMENTO", "0.6")
+    previsoes = calcular_previsoes(*entradas(), hoje=date(2024, 3, 5)).set_index("uc")
+    a = previsoes.loc["A"]
+    # Média ponderada: (100 x 1 + 200 x 0,6) / 1,6
+    assert a["consumo_previsto_kwh"] == pytest.approx(137.5)
+    assert a["tarifa_estimada"] == pytest.approx(0.8)
+    assert a["valor_previsto"] == pytest.approx(110.0)
+    assert a["meses_historico"] == 2
+    assert a["mes_previsto"].date() == date(2024, 3, 1)
+    assert a["data_leitura_prevista"].date() == date(2024, 3, 10)
+    assert a["data_emissao_prevista"].date() == date(2024, 3, 15)
+
+def test_calcular_previsoes_sem_historico_usa_o_crm(monkeypatch):
+    monkeypatch.setenv("PREVISAO_DIAS_LEITURA_EMISSAO", "3")
+    b = calcular_previsoes(*entradas(), hoje=date(2024, 3, 5)).set_index("uc").loc["B"]
+    assert b["consumo_previsto_kwh"] == pytest.approx(2000)
+    assert pd.isna(b["tarifa_estimada"]) and pd.isna(b["valor_previsto"])
+    assert b["meses_historico"] == 0
+    assert b["mes_previsto"].date() == date(2024, 3, 1)
+    assert b["data_leitura_prevista"].date() == date(2024, 4, 2)
+    assert b["data_emissao_prevista"].date() == date(2024, 4, 5)
+
+def test_calcular_previsoes_respeita_meses_de_historico(monkeypatch):
+    monkeypatch.setenv("PREVISAO_MESES_HISTORICO", "1")
+    a = calcular_previsoes(*entradas(), hoje=date(2024, 3, 5)).set_index("uc").loc["A"]
+    assert a["consumo_previsto_kwh"] == pytest.approx(100)
+    assert a["meses_historico"] == 1
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from services.replica_local import TABELAS_REPLICA, _chave_do_log, _gravar_lote, _lote_dataframe, _valor_local, abrir_replica
+
+duckdb = pytest.importorskip("duckdb")
+
+COLUNAS = ["id_linha", "uc", "mes_referencia", "total", "atualizado_em"]
+CONFIG = TABELAS_REPLICA["analytics_incremental"]
+T1, T2 = datetime(2024, 3, 1, 10), datetime(2024, 3, 2, 10)
+
+@pytest.fixture
+def local(tmp_path):
+    conexao = abrir_replica(str(tmp_path / "replica.duckdb"))
+    yield conexao
+    conexao.close()
+
+def gravar(local, linhas):
+    _gravar_lote(local, "analytics_incremental", CONFIG["chave"], _lote_dataframe(COLUNAS, linhas),
+                 CONFIG["grupo"], CONFIG["marca"])
+
+def linhas_da_replica(local):
+    return local.execute("SELECT id_linha, uc, total FROM analytics_incremental ORDER BY id_linha").fetchall()
+
+def test_linhas_repetidas_da_chave_em_lotes_diferentes(local):
+    # (uc, mes) repete na analytics: o segundo lote da mesma cópia não pode apagar o primeiro
+    gravar(local, [(1, "10", "2024-02-01", 50.0, T1)])
+    gravar(local, [(2, "10", "2024-02-01", 70.0, T1)])
+    assert linhas_da_replica(local) == [(1, "10", 50.0), (2, "10", 70.0)]
+
+def test_grupo_regravado_substitui_as_linhas_antigas(local):
+    gravar(local, [(1, "10", "2024-02-01", 50.0, T1), (2, "10", "2024-02-01", 70.0, T1),
+                   (3, "11", "2024-02-01", 90.0, T1)])
+    # A origem apagou e reinseriu o grupo (10, fev) com ids novos
+    gravar(local, [(4, "10", "2024-02-01", 55.0, T2)])
+    assert linhas_da_replica(local) == [(3, "11", 90.0), (4, "10", 55.0)]
+
+def test_sobreposicao_recopia_sem_duplicar(local):
+    gravar(local, [(1, "10", "2024-02-01", 50.0, T1)])
+    gravar(local, [(1, "10", "2024-02-01", 50.0, T1)])
+    assert linhas_da_replica(local) == [(1, "10", 50.0)]
+
+def test_chave_do_log_desfaz_float_de_inteiro():
+    # O log normaliza inteiros como float
+    assert _chave_do_log(123.0) == "123"
+    assert _chave_do_log(1.5) == "1.5"
+    assert _chave_do_log("abc") == "abc"
+
+def test_valor_local_converte_para_utc_sem_fuso():
+    sp = timezone(timedelta(hours=-3))
+    assert _valor_local(datetime(2024, 3, 1, 7, tzinfo=sp)) == datetime(2024, 3, 1, 10)
+    assert _valor_local({"a": 1}) == '{"a": 1}'